@@ -1,86 +1,449 @@
+import itertools
 import re
-from typing import List, Dict, Any
+import threading
+import weakref
+from collections import deque
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, List, Dict, Any, Callable, Iterable, Iterator, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+import metrics
+from cache import TTLCache
+from knowledge_base import KnowledgeBase, load_knowledge_base
+from singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    # scipy.sparse takes a noticeable share of startup and only the batch
+    # path needs it, so it is imported on first use
+    from scipy import sparse
+
+ENGINES = ("automaton", "scan")
+# Numbers every SymptomIndex built in this process
+_index_serials = itertools.count()
+
+# Stages reported, in order, to the on_stage callback of analyze_symptoms
+ANALYSIS_STAGES = ("tokenize", "match", "score", "rank")
+
+ANALYSIS_SECONDS = metrics.histogram("telemed_analysis_seconds", "Time to analyze one symptom description")
+ANALYSIS_STAGE_SECONDS = metrics.histogram(
+    "telemed_analysis_stage_seconds", "Time spent in each stage of analyze_symptoms"
+)
+ANALYSIS_CACHE = metrics.counter(
+    "telemed_analysis_cache_total", "Analysis result cache lookups by result (hit or miss)"
+)
+
+
+class AnalysisCancelled(Exception):
+    """
+    Raised from an on_stage callback to abandon an analysis in progress
+    """
+
+
+def _ignore_stage(stage: str) -> None:
+    pass
+
+
+class SymptomMatcher:
+    """
+    Aho-Corasick automaton over a fixed set of symptom strings.
+
+    A single pass over the text reports every symptom that occurs anywhere in
+    it, which is exactly the set for which ``symptom in text`` is true.
+    """
+
+    def __init__(self, symptoms: Iterable[str]):
+        self.symptoms = list(symptoms)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        # The empty string is a substring of every text
+        self._always = frozenset(i for i, s in enumerate(self.symptoms) if not s)
+
+        for symptom_id, symptom in enumerate(self.symptoms):
+            if not symptom:
+                continue
+            state = 0
+            for char in symptom:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (symptom_id,)
+
+        # Breadth-first pass to wire failure links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    @property
+    def longest(self) -> int:
+        return max((len(symptom) for symptom in self.symptoms), default=0)
+
+    def count(self, text: str) -> Dict[int, int]:
+        """
+        Return the number of occurrences in text of every non-empty symptom
+        that occurs at least once
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        counts: Dict[int, int] = {}
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for symptom_id in out[state]:
+                counts[symptom_id] = counts.get(symptom_id, 0) + 1
+        return counts
+
+    def find(self, text: str) -> Set[int]:
+        """
+        Return the ids of all symptoms occurring in text
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(self._always)
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class SymptomIndex:
+    """
+    Matching engine compiled once per knowledge base: the symptom automaton
+    plus a symptom -> conditions inverted index.
+    """
+
+    def __init__(self, kb: KnowledgeBase):
+        self.kb = kb
+        # Symptom ids only mean something within one index; cache keys
+        # carry this so results of different knowledge bases never mix
+        self.serial = next(_index_serials)
+        self.condition_sizes = np.diff(kb.symptom_ptr).tolist()
+        postings: List[Dict[int, int]] = [{} for _ in range(len(kb.symptom_string_ids))]
+
+        for condition_id in range(len(kb)):
+            for symptom_id in kb.condition_symptom_ids(condition_id).tolist():
+                # A symptom listed twice counts twice, as in the linear scan
+                counts = postings[symptom_id]
+                counts[condition_id] = counts.get(condition_id, 0) + 1
+
+        self.postings: List[Tuple[Tuple[int, int], ...]] = [
+            tuple(counts.items()) for counts in postings
+        ]
+        self.matcher = SymptomMatcher(kb.symptoms)
+        self._condition_matrix: Optional["sparse.csr_matrix"] = None
+        self._condition_sizes_array: Optional[np.ndarray] = None
+
+    @property
+    def condition_matrix(self) -> "sparse.csr_matrix":
+        """
+        Condition x symptom matrix of symptom multiplicities, built on first use
+        """
+        if self._condition_matrix is None:
+            from scipy import sparse
+
+            kb = self.kb
+            sizes = np.diff(kb.symptom_ptr)
+            rows = np.repeat(np.arange(len(kb)), sizes)
+            # Duplicate (condition, symptom) entries are summed by scipy
+            self._condition_matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.int64), (rows, kb.symptom_refs)),
+                shape=(len(kb), len(self.postings))
+            )
+            self._condition_sizes_array = sizes.astype(np.float64)
+        return self._condition_matrix
+
+    def score_batch(self, texts: Sequence[str]) -> "sparse.csr_matrix":
+        """
+        Return a patient x condition matrix of probabilities for lowercased texts
+        """
+        from scipy import sparse
+
+        condition_matrix = self.condition_matrix
+        indptr, indices = [0], []
+        for text in texts:
+            indices.extend(self.matcher.find(text))
+            indptr.append(len(indices))
+        incidence = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int64), indices, indptr),
+            shape=(len(texts), len(self.postings))
+        )
+        scores = (incidence @ condition_matrix.T).tocsr()
+        # Normalise integer counts afterwards so every probability is the
+        # same float that count / len(symptoms) gives in analyze_symptoms
+        scores.data = scores.data / self._condition_sizes_array[scores.indices]
+        return scores
+
+    def match_counts(self, text: str) -> Dict[int, int]:
+        """
+        Return matching-symptom counts for every condition the text touches
+        """
+        return self.condition_counts(self.matcher.find(text))
+
+    def condition_counts(self, symptom_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Return matching-symptom counts for every condition the symptoms touch
+        """
+        counts: Dict[int, int] = {}
+        for symptom_id in symptom_ids:
+            for condition_id, weight in self.postings[symptom_id]:
+                counts[condition_id] = counts.get(condition_id, 0) + weight
+        return counts
+
+
+_shared_indexes: "weakref.WeakKeyDictionary[KnowledgeBase, SymptomIndex]" = weakref.WeakKeyDictionary()
+_shared_indexes_lock = threading.Lock()
+
+
+def get_symptom_index(kb: KnowledgeBase) -> SymptomIndex:
+    """
+    Return the SymptomIndex for kb, compiling it once per process
+    """
+    with _shared_indexes_lock:
+        index = _shared_indexes.get(kb)
+        if index is None:
+            index = SymptomIndex(kb)
+            _shared_indexes[kb] = index
+        return index
+
+
+class ConditionsView(Mapping):
+    """
+    Read-only {condition: {"symptoms": [...], "remedies": [...]}} view over a
+    KnowledgeBase, for callers that used the old in-memory dict.
+    """
+
+    def __init__(self, kb: KnowledgeBase):
+        self.kb = kb
+
+    def __getitem__(self, condition: str) -> Dict[str, List[str]]:
+        condition_id = self.kb.condition_id(condition)
+        if condition_id is None:
+            raise KeyError(condition)
+        return {
+            "symptoms": self.kb.condition_symptoms(condition_id),
+            "remedies": self.kb.remedies(condition_id)
+        }
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.kb.condition_name(condition_id) for condition_id in range(len(self.kb)))
+
+    def __len__(self) -> int:
+        return len(self.kb)
+
+
+# Cached analysis results: a tuple of (condition, probability, remedies)
+FrozenSuggestions = Tuple[Tuple[str, float, Tuple[str, ...]], ...]
+
 
 class SymptomAnalyzer:
-    def __init__(self):
-        # Define common conditions and their associated symptoms
-        self.conditions = {
-            "Common Cold": {
-                "symptoms": ["runny nose", "sore throat", "cough", "congestion", "sneezing"],
-                "remedies": [
-                    "Rest and get plenty of sleep",
-                    "Stay hydrated with warm fluids",
-                    "Use over-the-counter cold medications",
-                    "Try saline nasal drops",
-                    "Use a humidifier"
-                ]
-            },
-            "Flu": {
-                "symptoms": ["fever", "body aches", "fatigue", "cough", "sore throat", "headache"],
-                "remedies": [
-                    "Rest and stay hydrated",
-                    "Take over-the-counter pain relievers",
-                    "Use a humidifier",
-                    "Stay home to prevent spreading",
-                    "Consider antiviral medications if prescribed"
-                ]
-            },
-            "Allergies": {
-                "symptoms": ["sneezing", "itchy eyes", "runny nose", "congestion", "post-nasal drip"],
-                "remedies": [
-                    "Take antihistamines",
-                    "Use nasal sprays",
-                    "Avoid allergens",
-                    "Keep windows closed during high pollen times",
-                    "Use air purifiers"
-                ]
-            },
-            "Migraine": {
-                "symptoms": ["severe headache", "nausea", "sensitivity to light", "sensitivity to sound"],
-                "remedies": [
-                    "Rest in a dark, quiet room",
-                    "Apply cold or warm compresses",
-                    "Stay hydrated",
-                    "Take prescribed migraine medications",
-                    "Practice stress management"
-                ]
-            },
-            "Gastroenteritis": {
-                "symptoms": ["nausea", "vomiting", "diarrhea", "abdominal pain", "fever"],
-                "remedies": [
-                    "Stay hydrated with clear fluids",
-                    "Follow the BRAT diet (Bananas, Rice, Applesauce, Toast)",
-                    "Rest and avoid strenuous activity",
-                    "Avoid dairy and fatty foods",
-                    "Consider over-the-counter anti-diarrheal medications"
-                ]
-            }
+    def __init__(self, engine: str = "automaton", knowledge_base: Union[KnowledgeBase, str, None] = None,
+                 cache_size: int = 1024, cache_ttl: Optional[float] = None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+        self.engine = engine
+        # The knowledge base is memory-mapped once per process and shared
+        if isinstance(knowledge_base, KnowledgeBase):
+            self.kb = knowledge_base
+        else:
+            self.kb = load_knowledge_base(knowledge_base)
+        self.conditions = ConditionsView(self.kb)
+        self._index: Optional[SymptomIndex] = None
+        # Keyed by the index serial and the sorted ids of the matched
+        # symptoms, so differently worded complaints naming the same
+        # symptoms share one entry
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._flight = SingleFlight("analysis")
+
+    def reload_knowledge_base(self, path: Optional[str] = None) -> None:
+        """
+        Re-read the knowledge base from disk and drop every cached result.
+        Analyses already running finish on the old knowledge base but
+        cannot add its results to the cache.
+        """
+        self.kb = load_knowledge_base(path or self.kb.path, reload=True)
+        self.conditions = ConditionsView(self.kb)
+        self._index = None
+        self.cache.clear()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
+    @property
+    def index(self) -> SymptomIndex:
+        if self._index is None:
+            self._index = get_symptom_index(self.kb)
+        return self._index
+
+    def analyze_symptoms(self, symptoms_text: str, engine: Optional[str] = None,
+                         on_stage: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        Analyze symptoms and return possible conditions with probabilities.
+
+        ``engine`` overrides the analyzer's default: "automaton" matches via the
+        compiled index, "scan" is the original per-condition substring loop.
+        Both return identical results.
+
+        ``on_stage`` is called with each name in ANALYSIS_STAGES as that stage
+        completes; it may raise AnalysisCancelled to stop the analysis early.
+        """
+        on_stage = on_stage or _ignore_stage
+        engine = engine or self.engine
+        if not metrics.enabled():
+            return self._analyze(symptoms_text, engine, on_stage)
+        timer = metrics.StageTimer(on_stage)
+        result = self._analyze(symptoms_text, engine, timer)
+        timer.record(ANALYSIS_STAGE_SECONDS, ANALYSIS_SECONDS, engine=engine)
+        return result
+
+    def _analyze(self, symptoms_text: str, engine: str, on_stage: Callable[[str], None]) -> Dict[str, Any]:
+        if engine == "scan":
+            return self._analyze_scan(symptoms_text, on_stage)
+        if engine != "automaton":
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+
+        index = self.index
+        symptoms_text = symptoms_text.lower()
+        on_stage("tokenize")
+        matched = tuple(sorted(index.matcher.find(symptoms_text)))
+        on_stage("match")
+        return self._suggest(index, matched, None, on_stage)
+
+    def _suggest(self, index: SymptomIndex, matched: Tuple[int, ...],
+                 counts: Optional[Dict[int, int]], on_stage: Callable[[str], None]) -> Dict[str, Any]:
+        suggestions = self.cache.get((index.serial, matched))
+        ANALYSIS_CACHE.inc(result="miss" if suggestions is None else "hit")
+        if suggestions is None:
+            # Identical requests racing past the cache wait for the first
+            # one instead of scoring the same symptoms again
+            suggestions, _ = self._flight.do((index, matched), self._compute, index, matched, counts)
+        on_stage("score")
+
+        # Hand out fresh containers so callers cannot alter the cached entry
+        result = {
+            "suggestions": [
+                {
+                    "condition": condition,
+                    "probability": probability,
+                    "home_remedies": list(remedies)
+                }
+                for condition, probability, remedies in suggestions
+            ]
         }
+        on_stage("rank")
+        return result
+
+    def _compute(self, index: SymptomIndex, matched: Tuple[int, ...],
+                 counts: Optional[Dict[int, int]]) -> FrozenSuggestions:
+        if counts is None:
+            counts = index.condition_counts(matched)
+        suggestions = self._rank(index, self._score(index, counts))
+        # A computation still running on the index of a knowledge base
+        # reloaded meanwhile files its result under the old serial, where
+        # no lookup will find it
+        self.cache.set((index.serial, matched), suggestions)
+        return suggestions
+
+    @staticmethod
+    def _score(index: SymptomIndex, counts: Dict[int, int]) -> List[Tuple[float, int]]:
+        return [
+            (-(matching_symptoms / index.condition_sizes[condition_id]), condition_id)
+            for condition_id, matching_symptoms in counts.items()
+        ]
+
+    @staticmethod
+    def _rank(index: SymptomIndex, scored: List[Tuple[float, int]]) -> FrozenSuggestions:
+        # Ties keep knowledge-base order, like the stable sort in the scan
+        scored.sort()
 
-    def analyze_symptoms(self, symptoms_text: str) -> Dict[str, Any]:
+        return tuple(
+            (index.kb.condition_name(condition_id), -negative_probability, tuple(index.kb.remedies(condition_id)))
+            for negative_probability, condition_id in scored[:3]
+        )
+
+    def analyze_symptoms_batch(self, texts: Sequence[str], top_k: int = 3) -> List[Dict[str, Any]]:
         """
-        Analyze symptoms and return possible conditions with probabilities
+        Analyze many symptom descriptions at once.
+
+        Every condition is scored for every text in a single sparse matrix
+        multiply; each entry of the returned list has the same structure as
+        analyze_symptoms would return for the corresponding text.
         """
+        index = self.index
+        scores = index.score_batch([text.lower() for text in texts])
+
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            probabilities = scores.data[start:end]
+            condition_ids = scores.indices[start:end]
+
+            if len(probabilities) > top_k:
+                # Keep everything tied with the k-th best so the final ordering
+                # matches the stable sort of the single-text path
+                best = np.argpartition(-probabilities, top_k - 1)[:top_k]
+                threshold = probabilities[best].min()
+                keep = np.flatnonzero(probabilities >= threshold)
+                probabilities = probabilities[keep]
+                condition_ids = condition_ids[keep]
+            order = np.lexsort((condition_ids, -probabilities))[:top_k]
+
+            suggestions = []
+            for position in order:
+                condition_id = int(condition_ids[position])
+                suggestions.append({
+                    "condition": self.kb.condition_name(condition_id),
+                    "probability": float(probabilities[position]),
+                    "home_remedies": self.kb.remedies(condition_id)
+                })
+            results.append({
+                "suggestions": suggestions
+            })
+
+        return results
+
+    def _analyze_scan(self, symptoms_text: str, on_stage: Callable[[str], None]) -> Dict[str, Any]:
         symptoms_text = symptoms_text.lower()
+        on_stage("tokenize")
         results = []
 
-        for condition, data in self.conditions.items():
+        for condition_id in range(len(self.kb)):
+            symptoms = self.kb.condition_symptoms(condition_id)
             # Count matching symptoms
-            matching_symptoms = sum(1 for symptom in data["symptoms"] 
+            matching_symptoms = sum(1 for symptom in symptoms
                                  if symptom in symptoms_text)
             
             if matching_symptoms > 0:
                 # Calculate probability based on number of matching symptoms
-                probability = matching_symptoms / len(data["symptoms"])
+                probability = matching_symptoms / len(symptoms)
                 
                 results.append({
-                    "condition": condition,
+                    "condition": self.kb.condition_name(condition_id),
                     "probability": probability,
-                    "home_remedies": data["remedies"]
+                    "home_remedies": self.kb.remedies(condition_id)
                 })
+        on_stage("match")
+        on_stage("score")
 
         # Sort results by probability
         results.sort(key=lambda x: x["probability"], reverse=True)
+        on_stage("rank")
         
         # Take top 3 results
         top_results = results[:3]
@@ -93,8 +456,89 @@ class SymptomAnalyzer:
         """
         Get home remedies for a specific condition
         """
-        return self.conditions.get(condition, {}).get("remedies", [
-            "Rest and stay hydrated",
-            "Take over-the-counter pain relievers if needed",
-            "Monitor symptoms and seek medical attention if they worsen"
-        ]) 
\ No newline at end of file
+        condition_id = self.kb.condition_id(condition)
+        if condition_id is None:
+            return [
+                "Rest and stay hydrated",
+                "Take over-the-counter pain relievers if needed",
+                "Monitor symptoms and seek medical attention if they worsen"
+            ]
+        return self.kb.remedies(condition_id)
+
+
+class IncrementalAnalysis:
+    """
+    Keeps a symptom analysis up to date while a text is being edited.
+
+    Occurrence counts per symptom and match counts per condition are kept
+    between edits. An edit only re-scans the changed span widened by the
+    longest symptom on each side, so its cost follows the size of the edit
+    rather than of the document or the knowledge base. result() gives the
+    same answer as analyze_symptoms on the current text.
+    """
+
+    def __init__(self, analyzer: SymptomAnalyzer, text: str = ""):
+        self.analyzer = analyzer
+        self.set_text(text)
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def set_text(self, text: str) -> None:
+        """
+        Replace the whole text and rebuild every count from scratch
+        """
+        self.index = self.analyzer.index
+        # An occurrence touching an edit lies within this many characters of
+        # it; lowercasing never shortens text, so raw offsets are safe
+        self._margin = max(1, self.index.matcher.longest - 1)
+        self._text = ""
+        self._occurrences: Dict[int, int] = {}
+        self._condition_counts: Dict[int, int] = {}
+        for symptom_id in self.index.matcher.find(""):
+            self._occurrences[symptom_id] = 1
+            self._activate(symptom_id, 1)
+        self.apply_edit(0, 0, text)
+
+    def apply_edit(self, position: int, chars_removed: int, inserted: str) -> None:
+        """
+        Replace chars_removed characters at position with inserted
+        """
+        text = self._text
+        position = max(0, min(position, len(text)))
+        chars_removed = max(0, min(chars_removed, len(text) - position))
+        start = max(0, position - self._margin)
+
+        self._adjust(text[start:position + chars_removed + self._margin], -1)
+        self._text = text = text[:position] + inserted + text[position + chars_removed:]
+        self._adjust(text[start:position + len(inserted) + self._margin], 1)
+
+    def _adjust(self, segment: str, sign: int) -> None:
+        for symptom_id, occurrences in self.index.matcher.count(segment.lower()).items():
+            before = self._occurrences.get(symptom_id, 0)
+            after = before + sign * occurrences
+            if after:
+                self._occurrences[symptom_id] = after
+            else:
+                del self._occurrences[symptom_id]
+            if not before:
+                self._activate(symptom_id, 1)
+            elif not after:
+                self._activate(symptom_id, -1)
+
+    def _activate(self, symptom_id: int, sign: int) -> None:
+        counts = self._condition_counts
+        for condition_id, weight in self.index.postings[symptom_id]:
+            count = counts.get(condition_id, 0) + sign * weight
+            if count:
+                counts[condition_id] = count
+            else:
+                del counts[condition_id]
+
+    def result(self) -> Dict[str, Any]:
+        if self.index is not self.analyzer.index:
+            # The knowledge base was reloaded since the counts were built
+            self.set_text(self._text)
+        matched = tuple(sorted(self._occurrences))
+        return self.analyzer._suggest(self.index, matched, self._condition_counts, _ignore_stage)
@@ -1 +1,243 @@
- 
\ No newline at end of file
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+import metrics
+from ai_symptom_analyzer import ANALYSIS_SECONDS, ANALYSIS_STAGE_SECONDS, SymptomAnalyzer
+from directory import directory_from_env
+from doctor_providers import DirectoryProvider
+from doctor_search import AsyncDoctorSearch
+from ranking import DEFAULT_PAGE_SIZE
+from singleflight import AsyncSingleFlight
+
+load_dotenv()
+# Search and directory errors are reported through logging
+logging.basicConfig(level=os.environ.get("TELEMED_LOG_LEVEL", "INFO"),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+# httpx logs every provider request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Set to the number of uvicorn workers: each starts its own analysis pool,
+# and by default the pools share the CPUs between them
+API_WORKERS = int(os.environ.get("TELEMED_API_WORKERS", 1))
+ANALYSIS_PROCESSES = int(os.environ.get(
+    "TELEMED_ANALYSIS_PROCESSES", max(1, (os.cpu_count() or 1) // API_WORKERS)
+))
+MAX_PENDING_ANALYSES = int(os.environ.get("TELEMED_MAX_PENDING_ANALYSES", 64))
+MAX_PENDING_SEARCHES = int(os.environ.get("TELEMED_MAX_PENDING_SEARCHES", 128))
+KNOWLEDGE_BASE_PATH = os.environ.get("TELEMED_KB_PATH")
+MAX_PAGE_SIZE = int(os.environ.get("TELEMED_MAX_PAGE_SIZE", 100))
+# Comma-separated base URLs of provider APIs speaking the HTTPProvider contract
+PROVIDER_URLS = [url for url in os.environ.get("TELEMED_PROVIDER_URLS", "").split(",") if url]
+# Serve GET /debug/profile, which samples the server's threads on demand
+PROFILER_ENABLED = os.environ.get("TELEMED_PROFILER") == "1"
+
+REQUEST_SECONDS = metrics.histogram("telemed_http_request_seconds", "API request latency by endpoint")
+REQUESTS_REJECTED = metrics.counter(
+    "telemed_http_rejected_total", "Requests turned away with 503 by the admission limiters"
+)
+
+# One analyzer per pool process, created by the pool initializer so the
+# knowledge base is mapped once per worker rather than once per request
+_worker_analyzer: Optional[SymptomAnalyzer] = None
+
+
+def _init_analysis_worker(kb_path: Optional[str]) -> None:
+    global _worker_analyzer
+    # Metrics recorded in a worker would never be exported; stage timings
+    # are sent back with each result instead
+    metrics.disable()
+    _worker_analyzer = SymptomAnalyzer(knowledge_base=kb_path)
+    # Compile the matcher up front instead of on the first request
+    _worker_analyzer.index
+
+
+def _analyze_in_worker(symptoms: str, timed: bool = False) -> Tuple[Dict[str, Any], Optional[metrics.StageTimer]]:
+    if not timed:
+        return _worker_analyzer.analyze_symptoms(symptoms), None
+    timer = metrics.StageTimer()
+    return _worker_analyzer.analyze_symptoms(symptoms, on_stage=timer), timer
+
+
+class AdmissionLimiter:
+    """
+    Caps the requests of one kind that are running or queued. Requests
+    beyond the cap are rejected with 503 at once instead of piling up, so
+    clients can back off and retry.
+    """
+
+    def __init__(self, name: str, limit: int, retry_after: int = 1):
+        self.name = name
+        self.limit = limit
+        self.retry_after = retry_after
+        self.pending = 0
+
+    def __enter__(self) -> "AdmissionLimiter":
+        # Only touched from the event loop thread, so no lock is needed
+        if self.pending >= self.limit:
+            REQUESTS_REJECTED.inc(limiter=self.name)
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        self.pending += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.pending -= 1
+
+
+class SymptomRequest(BaseModel):
+    symptoms: str
+
+
+class DoctorSearchRequest(BaseModel):
+    location: str
+    specialization: str
+    radius: float = 10
+
+
+class DoctorPageRequest(DoctorSearchRequest):
+    sort_by: Literal["distance", "rating"] = "distance"
+    min_rating: Optional[float] = None
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    # next_cursor of the previous page
+    cursor: Optional[str] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.analysis_pool = ProcessPoolExecutor(
+        max_workers=ANALYSIS_PROCESSES,
+        initializer=_init_analysis_worker,
+        initargs=(KNOWLEDGE_BASE_PATH,)
+    )
+    app.state.analysis_limiter = AdmissionLimiter("analysis", MAX_PENDING_ANALYSES)
+    app.state.search_limiter = AdmissionLimiter("search", MAX_PENDING_SEARCHES)
+    app.state.analysis_flight = AsyncSingleFlight("analysis")
+    # A real provider directory and provider APIs when configured, mock data otherwise
+    directory = directory_from_env()
+    providers = [DirectoryProvider(directory)] if directory is not None else []
+    app.state.doctor_search = AsyncDoctorSearch(providers if providers or PROVIDER_URLS else None)
+    for number, url in enumerate(PROVIDER_URLS, 1):
+        app.state.doctor_search.add_http_provider(f"provider{number}", url)
+    try:
+        yield
+    finally:
+        await app.state.doctor_search.aclose()
+        app.state.analysis_pool.shutdown(cancel_futures=True)
+
+
+app = FastAPI(title="Telemedicine API", lifespan=lifespan)
+# The Flutter web build is served from a different origin during development
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "pending_analyses": app.state.analysis_limiter.pending,
+        "pending_searches": app.state.search_limiter.pending
+    }
+
+
+@app.get("/metrics")
+async def get_metrics(format: str = "prometheus"):
+    """
+    Metrics of this server process, as Prometheus text or, with
+    ?format=json, as JSON. Empty unless TELEMED_METRICS=1.
+    """
+    if format == "json":
+        return metrics.REGISTRY.to_json()
+    return PlainTextResponse(metrics.REGISTRY.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profile")
+async def profile(seconds: float = 5.0, interval: float = 0.005) -> PlainTextResponse:
+    """
+    Sample every thread of this process for a while and return the stacks
+    in collapsed format, ready for flamegraph.pl or speedscope
+    """
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    profiler = metrics.SamplingProfiler(interval)
+    profiler.start()
+    try:
+        await asyncio.sleep(min(seconds, 60.0))
+    finally:
+        profiler.stop()
+    return PlainTextResponse(profiler.collapsed())
+
+
+@app.post("/analyze-symptoms")
+async def analyze_symptoms(request: SymptomRequest) -> Dict[str, Any]:
+    with REQUEST_SECONDS.time(endpoint="/analyze-symptoms"), app.state.analysis_limiter:
+        loop = asyncio.get_running_loop()
+        try:
+            # Matching is case-insensitive, so texts differing only in case
+            # share one trip to the worker pool
+            (result, timer), shared = await app.state.analysis_flight.do(
+                request.symptoms.lower(),
+                lambda: loop.run_in_executor(
+                    app.state.analysis_pool, _analyze_in_worker, request.symptoms, metrics.enabled()
+                )
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error analyzing symptoms: {str(e)}")
+        if timer is not None and not shared:
+            timer.record(ANALYSIS_STAGE_SECONDS, ANALYSIS_SECONDS, engine="automaton")
+        return result
+
+
+@app.post("/search-doctors")
+async def search_doctors(request: DoctorSearchRequest) -> List[Dict[str, Any]]:
+    with REQUEST_SECONDS.time(endpoint="/search-doctors"), app.state.search_limiter:
+        try:
+            doctors = await app.state.doctor_search.search_nearby_doctors(
+                request.location, request.specialization, request.radius
+            )
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error searching for doctors: {str(e)}")
+        return [asdict(doctor) for doctor in doctors]
+
+
+@app.post("/search-doctors/page")
+async def search_doctors_page(request: DoctorPageRequest) -> Dict[str, Any]:
+    """
+    One page of a doctor search, nearest or best rated first. Pass the
+    returned next_cursor back with the same parameters for the next page.
+    """
+    with REQUEST_SECONDS.time(endpoint="/search-doctors/page"), app.state.search_limiter:
+        try:
+            page = await app.state.doctor_search.query(
+                request.location, request.specialization, request.radius,
+                request.sort_by, request.min_rating, request.limit, request.cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error searching for doctors: {str(e)}")
+        return {"doctors": [asdict(doctor) for doctor in page.doctors], "next_cursor": page.next_cursor}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "api:app",
+        host=os.environ.get("TELEMED_API_HOST", "0.0.0.0"),
+        port=int(os.environ.get("TELEMED_API_PORT", 8000)),
+        workers=API_WORKERS
+    )
@@ -0,0 +1,3 @@
+"""
+Synthetic-scale benchmarks; run with ``python -m benchmarks.run``
+"""
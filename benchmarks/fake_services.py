@@ -0,0 +1,233 @@
+"""
+Local stand-ins for the services the API calls out to, so load tests never
+touch the network: a Nominatim geocoder and a provider API speaking the
+HTTPProvider contract, each with injectable latency, jitter and errors.
+
+    python -m benchmarks.fake_services --nominatim-port 8081 --provider-port 8082 \\
+        --latency 40 --jitter 20 --error-rate 0.01
+
+Then start the API against them:
+
+    TELEMED_NOMINATIM_URL=http://127.0.0.1:8081 TELEMED_GEOCODE_RATE=100 \\
+    TELEMED_PROVIDER_URLS=http://127.0.0.1:8082 uvicorn api:app
+
+The geocoder resolves the benchmark CITIES by name and "lat, lon" strings
+to themselves. The provider API serves a synthetic directory of
+--provider-size doctors, nearest first.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.generators import StubGeocoder, generate_directory
+from directory import DirectorySnapshot
+
+MAX_PROVIDER_RESULTS = 100
+
+# (status, JSON body) for the parsed query string and request body
+Route = Callable[[Dict[str, str], Any], Tuple[int, Any]]
+
+
+@dataclass
+class Faults:
+    """
+    Latency of every response, uniformly jittered by up to jitter_ms either
+    way, and the share of requests answered with a 503
+    """
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    def delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+    def fail(self, rng: random.Random) -> bool:
+        return self.error_rate > 0 and rng.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real services, so client pools are exercised
+    protocol_version = "HTTP/1.1"
+    server: "FakeServer"
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = self.rfile.read(length) if length else b""
+        route = self.server.routes.get((method, url.path))
+        server = self.server
+        time.sleep(server.faults.delay(server.rng))
+        if route is None:
+            status, body = 404, {"error": "not found"}
+        elif server.faults.fail(server.rng):
+            status, body = 503, {"error": "injected failure"}
+        else:
+            try:
+                params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                status, body = route(params, json.loads(payload) if payload else None)
+            except (KeyError, ValueError) as e:
+                status, body = 400, {"error": f"bad request: {e}"}
+        server.count(status)
+        encoded = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    Threaded JSON server for a table of routes, served from a background
+    thread after start()
+    """
+
+    daemon_threads = True
+
+    def __init__(self, routes: Dict[Tuple[str, str], Route], faults: Faults,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        super().__init__((host, port), _Handler)
+        self.routes = routes
+        self.faults = faults
+        self.rng = random.Random(seed)
+        self.responses: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, status: int) -> None:
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.serve_forever, name=f"fake-{self.url}", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def nominatim_routes() -> Dict[Tuple[str, str], Route]:
+    """
+    GET /search?q=&format=json, answered as Nominatim does: a list of
+    places whose coordinates are strings, empty when nothing matches
+    """
+    geocoder = StubGeocoder()
+
+    def search(params: Dict[str, str], body: Any) -> Tuple[int, Any]:
+        location = geocoder.geocode(params["q"])
+        if location is None:
+            return 200, []
+        lat, lon = location.latitude, location.longitude
+        return 200, [{
+            "place_id": geocoder.calls,
+            "lat": f"{lat:.7f}",
+            "lon": f"{lon:.7f}",
+            "display_name": location.address,
+            "boundingbox": [f"{lat - 0.01:.7f}", f"{lat + 0.01:.7f}", f"{lon - 0.01:.7f}", f"{lon + 0.01:.7f}"],
+            "class": "place",
+            "type": "city",
+            "importance": 0.5
+        }]
+
+    return {("GET", "/search"): search}
+
+
+def provider_routes(size: int = 100000, seed: int = 0,
+                    max_results: int = MAX_PROVIDER_RESULTS) -> Dict[Tuple[str, str], Route]:
+    """
+    The HTTPProvider contract over a synthetic directory:
+      GET  /doctors?lat=&lon=&specialization=&radius_km=  -> {"doctors": [...]}
+      POST /doctors/batch {"ids": [...]}                  -> {"doctors": [...]}
+    """
+    snapshot = DirectorySnapshot.build(generate_directory(size, seed))
+    store = snapshot.store
+
+    def doctors(params: Dict[str, str], body: Any) -> Tuple[int, Any]:
+        code = store.specialization_code(params["specialization"])
+        if code is None:
+            return 200, {"doctors": []}
+        hits = snapshot.index.query_radius(
+            float(params["lat"]), float(params["lon"]), float(params["radius_km"]), code
+        )
+        return 200, {"doctors": [asdict(store.doctor(row, distance)) for distance, row in hits[:max_results]]}
+
+    def batch(params: Dict[str, str], body: Any) -> Tuple[int, Any]:
+        rows = (store.row_for_id(str(doctor_id)) for doctor_id in body["ids"])
+        return 200, {"doctors": [asdict(store.doctor(row)) for row in rows if row is not None]}
+
+    return {("GET", "/doctors"): doctors, ("POST", "/doctors/batch"): batch}
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for Nominatim and a provider API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--nominatim-port", type=int, default=8081)
+    parser.add_argument("--provider-port", type=int, default=8082)
+    parser.add_argument("--provider-size", type=int, default=100000, help="doctors in the provider directory")
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency in ms, both services")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform jitter in ms, both services")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses, both services")
+    parser.add_argument("--geocode-latency", type=float, help="overrides --latency for Nominatim")
+    parser.add_argument("--geocode-jitter", type=float, help="overrides --jitter for Nominatim")
+    parser.add_argument("--geocode-error-rate", type=float, help="overrides --error-rate for Nominatim")
+    parser.add_argument("--provider-latency", type=float, help="overrides --latency for the provider API")
+    parser.add_argument("--provider-jitter", type=float, help="overrides --jitter for the provider API")
+    parser.add_argument("--provider-error-rate", type=float, help="overrides --error-rate for the provider API")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def _faults(args: argparse.Namespace, service: str) -> Faults:
+    def pick(name: str) -> float:
+        value = getattr(args, f"{service}_{name}")
+        return getattr(args, name) if value is None else value
+
+    return Faults(pick("latency"), pick("jitter"), pick("error_rate"))
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = parse_args(argv)
+    servers = [
+        FakeServer(nominatim_routes(), _faults(args, "geocode"), args.host, args.nominatim_port, args.seed),
+        FakeServer(provider_routes(args.provider_size, args.seed), _faults(args, "provider"),
+                   args.host, args.provider_port, args.seed + 1)
+    ]
+    for server in servers:
+        server.start()
+    print(f"Nominatim at {servers[0].url}, provider API at {servers[1].url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Synthetic, reproducible inputs for the benchmarks: knowledge bases of any
+size, patient descriptions drawn from them, doctor directories clustered
+around real cities and a geocoder stub that never touches the network.
+"""
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from doctor_store import DoctorStore, StringPool
+from knowledge_base import KnowledgeBase, write_knowledge_base
+
+SYLLABLES = (
+    "ab", "al", "an", "ar", "bo", "ca", "de", "di", "el", "en", "fa", "ga", "he", "in", "ir",
+    "ka", "la", "li", "lo", "ma", "mi", "na", "ne", "no", "or", "pa", "ra", "re", "ri", "ro",
+    "sa", "se", "si", "ta", "te", "ti", "to", "ul", "ur", "va", "ve", "za"
+)
+
+FILLERS = (
+    "i have", "and", "also", "since yesterday", "for two days", "some", "a bit of",
+    "really bad", "on and off", "mostly at night", "after eating", "my child has"
+)
+
+# (city, latitude, longitude, relative size)
+CITIES = (
+    ("New York", 40.7128, -74.0060, 8.3), ("Los Angeles", 34.0522, -118.2437, 3.9),
+    ("Chicago", 41.8781, -87.6298, 2.7), ("Houston", 29.7604, -95.3698, 2.3),
+    ("Phoenix", 33.4484, -112.0740, 1.6), ("Seattle", 47.6062, -122.3321, 0.75),
+    ("Miami", 25.7617, -80.1918, 0.45), ("Toronto", 43.6532, -79.3832, 2.8),
+    ("Mexico City", 19.4326, -99.1332, 9.2), ("Sao Paulo", -23.5505, -46.6333, 12.3),
+    ("Buenos Aires", -34.6037, -58.3816, 3.1), ("London", 51.5074, -0.1278, 8.9),
+    ("Paris", 48.8566, 2.3522, 2.2), ("Berlin", 52.5200, 13.4050, 3.6),
+    ("Madrid", 40.4168, -3.7038, 3.3), ("Rome", 41.9028, 12.4964, 2.8),
+    ("Stockholm", 59.3293, 18.0686, 0.98), ("Moscow", 55.7558, 37.6173, 12.5),
+    ("Istanbul", 41.0082, 28.9784, 15.5), ("Cairo", 30.0444, 31.2357, 9.5),
+    ("Lagos", 6.5244, 3.3792, 14.8), ("Nairobi", -1.2921, 36.8219, 4.4),
+    ("Johannesburg", -26.2041, 28.0473, 5.6), ("Mumbai", 19.0760, 72.8777, 12.4),
+    ("Delhi", 28.7041, 77.1025, 16.8), ("Bangkok", 13.7563, 100.5018, 8.3),
+    ("Singapore", 1.3521, 103.8198, 5.7), ("Jakarta", -6.2088, 106.8456, 10.6),
+    ("Beijing", 39.9042, 116.4074, 21.5), ("Shanghai", 31.2304, 121.4737, 24.3),
+    ("Seoul", 37.5665, 126.9780, 9.7), ("Tokyo", 35.6762, 139.6503, 13.9),
+    ("Sydney", -33.8688, 151.2093, 5.3), ("Auckland", -36.8485, 174.7633, 1.7),
+    ("Anchorage", 61.2181, -149.9003, 0.29), ("Reykjavik", 64.1466, -21.9426, 0.13),
+    ("Suva", -18.1248, 178.4501, 0.09),
+)
+
+SPECIALIZATIONS = (
+    ("General Medicine", 0.35), ("Pediatrics", 0.15), ("Cardiology", 0.08),
+    ("Dermatology", 0.08), ("Orthopedics", 0.1), ("Neurology", 0.06), ("Gynecology", 0.1),
+    ("Psychiatry", 0.08),
+)
+
+FIRST_NAMES = (
+    "James", "Mary", "Wei", "Aisha", "Carlos", "Yuki", "Olga", "Kwame", "Priya", "Lars",
+    "Fatima", "Diego", "Mei", "Ivan", "Amara", "Noah", "Sofia", "Omar", "Hana", "Luca"
+)
+LAST_NAMES = (
+    "Smith", "Garcia", "Chen", "Okafor", "Patel", "Kim", "Muller", "Rossi", "Silva", "Nguyen",
+    "Ivanova", "Haddad", "Tanaka", "Johansson", "Mensah", "Lopez", "Cohen", "Sato", "Brown", "Ali"
+)
+STREETS = ("Main", "Oak", "Harbor", "Park", "Station", "Hill", "Lake", "Market", "River", "Church")
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def symptom_vocabulary(size: int, seed: int = 0) -> List[str]:
+    """
+    ``size`` distinct made-up symptom phrases of one to three words
+    """
+    rng = random.Random(seed)
+    vocabulary: Dict[str, None] = {}
+    while len(vocabulary) < size:
+        vocabulary[" ".join(_word(rng) for _ in range(rng.choice((1, 1, 2, 2, 3))))] = None
+    return list(vocabulary)
+
+
+def vocabulary_size(conditions: int) -> int:
+    # Symptoms are shared between conditions, so the vocabulary grows
+    # sub-linearly: about 40 symptoms for 10 conditions, 45k for 100k
+    return max(40, int(8 * conditions ** 0.75))
+
+
+def _zipf_weights(size: int, exponent: float = 0.8) -> List[float]:
+    weights = [1.0 / (rank + 1) ** exponent for rank in range(size)]
+    cumulative, total = [], 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def generate_conditions(count: int, seed: int = 0) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Knowledge base dict with ``count`` conditions of 3-12 symptoms each.
+    Symptom popularity is Zipf-distributed, as in real symptom lists.
+    """
+    rng = random.Random(seed)
+    vocabulary = symptom_vocabulary(vocabulary_size(count), seed)
+    weights = _zipf_weights(len(vocabulary))
+    remedies = [f"Remedy {_word(rng)} {number}" for number in range(max(20, count // 10))]
+    conditions = {}
+    for number in range(count):
+        symptoms = list(dict.fromkeys(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(3, 12))))
+        conditions[f"Condition {number}"] = {
+            "symptoms": symptoms,
+            "remedies": rng.sample(remedies, rng.randint(3, 5))
+        }
+    return conditions
+
+
+def write_synthetic_kb(count: int, directory: str, seed: int = 0) -> str:
+    """
+    Compile a synthetic knowledge base into directory and return its path
+    """
+    path = os.path.join(directory, f"synthetic-{count}-{seed}.kb")
+    write_knowledge_base(generate_conditions(count, seed), path)
+    return path
+
+
+def generate_patient_texts(kb: KnowledgeBase, count: int, seed: int = 0,
+                           unknown_share: float = 0.1) -> List[str]:
+    """
+    Free-text descriptions mentioning one to five of the KB's symptoms,
+    common symptoms more often, mixed with filler and unknown words
+    """
+    rng = random.Random(seed)
+    symptoms = list(kb.symptoms)
+    weights = _zipf_weights(len(symptoms))
+    texts = []
+    for _ in range(count):
+        parts = []
+        for symptom in rng.choices(symptoms, cum_weights=weights, k=rng.randint(1, 5)):
+            parts.append(rng.choice(FILLERS))
+            parts.append(_word(rng) if rng.random() < unknown_share else symptom)
+        texts.append(" ".join(parts))
+    return texts
+
+
+def _city_weights() -> np.ndarray:
+    sizes = np.array([size for _, _, _, size in CITIES])
+    return sizes / sizes.sum()
+
+
+def random_points(count: int, seed: int = 0, spread_deg: float = 0.05,
+                  suburb_share: float = 0.3, suburb_spread_deg: float = 0.3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Points clustered around CITIES by population: a dense core and a wider
+    suburban ring, with longitude spread corrected for latitude
+    """
+    rng = np.random.default_rng(seed)
+    city = rng.choice(len(CITIES), size=count, p=_city_weights())
+    centres = np.array([(lat, lon) for _, lat, lon, _ in CITIES])
+    spread = np.where(rng.random(count) < suburb_share, suburb_spread_deg, spread_deg)
+    latitudes = np.clip(centres[city, 0] + rng.normal(0.0, spread), -89.9, 89.9)
+    longitudes = centres[city, 1] + rng.normal(0.0, spread) / np.cos(np.radians(latitudes))
+    longitudes = (longitudes + 180.0) % 360.0 - 180.0
+    return latitudes, longitudes
+
+
+def generate_directory(count: int, seed: int = 0) -> DoctorStore:
+    """
+    DoctorStore of ``count`` providers clustered around CITIES, built
+    column by column so a million rows take seconds, not minutes
+    """
+    latitudes, longitudes = random_points(count, seed)
+    rng = np.random.default_rng(seed + 1)
+    labels = [name for name, _ in SPECIALIZATIONS]
+    shares = np.array([share for _, share in SPECIALIZATIONS])
+    codes = rng.choice(len(labels), size=count, p=shares / shares.sum()).astype(np.int32)
+    ratings = np.round(np.clip(rng.normal(4.2, 0.5, size=count), 1.0, 5.0), 1)
+
+    strings = StringPool()
+    first = rng.integers(len(FIRST_NAMES), size=count).tolist()
+    last = rng.integers(len(LAST_NAMES), size=count).tolist()
+    house = rng.integers(1, 2000, size=count).tolist()
+    street = rng.integers(len(STREETS), size=count).tolist()
+    name_ids, address_ids, phone_ids, doctor_ids = [], [], [], []
+    for row in range(count):
+        name_ids.append(strings.intern(f"Dr. {FIRST_NAMES[first[row]]} {LAST_NAMES[last[row]]}"))
+        address_ids.append(strings.intern(f"{house[row]} {STREETS[street[row]]} St"))
+        phone_ids.append(strings.intern(f"(555) {row // 10000:03d}-{row % 10000:04d}"))
+        doctor_ids.append(strings.intern(f"synthetic-{row}"))
+    return DoctorStore(
+        latitudes, longitudes, ratings, codes, labels,
+        np.array(name_ids, dtype=np.int32),
+        np.array(address_ids, dtype=np.int32),
+        np.array(phone_ids, dtype=np.int32),
+        strings,
+        np.array(doctor_ids, dtype=np.int32)
+    )
+
+
+def generate_locations(count: int, seed: int = 0) -> List[str]:
+    """
+    Query locations as "lat, lon" strings, distributed like the directory
+    """
+    latitudes, longitudes = random_points(count, seed + 7, spread_deg=0.1, suburb_share=0.0)
+    return [f"{lat:.5f}, {lon:.5f}" for lat, lon in zip(latitudes.tolist(), longitudes.tolist())]
+
+
+def generate_specializations(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return rng.choices([name for name, _ in SPECIALIZATIONS], weights=[share for _, share in SPECIALIZATIONS], k=count)
+
+
+@dataclass
+class StubLocation:
+    latitude: float
+    longitude: float
+    address: str
+
+
+class StubGeocoder:
+    """
+    Offline stand-in for Nominatim: resolves CITIES by name and "lat, lon"
+    strings to themselves, optionally after a fixed delay per request
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._cities = {name.lower(): (lat, lon) for name, lat, lon, _ in CITIES}
+
+    def geocode(self, query: str) -> Optional[StubLocation]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        city = self._cities.get(query.strip().lower())
+        if city is not None:
+            return StubLocation(city[0], city[1], query)
+        try:
+            lat, lon = (float(part) for part in query.split(","))
+        except ValueError:
+            return None
+        return StubLocation(lat, lon, query)
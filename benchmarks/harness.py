@@ -0,0 +1,141 @@
+"""
+Measurement helpers shared by the benchmarks: latency percentiles,
+throughput, peak traced memory and the JSON result format.
+"""
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+PERCENTILES = (50, 90, 95, 99)
+
+
+def latency_summary(samples_ns: Sequence[int]) -> Dict[str, float]:
+    """
+    Percentiles, mean and max of per-call latencies, in milliseconds
+    """
+    values = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    summary = {f"p{percentile}": float(np.percentile(values, percentile)) for percentile in PERCENTILES}
+    summary["mean"] = float(values.mean())
+    summary["max"] = float(values.max())
+    return summary
+
+
+def measure_latency(call: Callable[[Any], Any], inputs: Sequence[Any], warmup: int = 50) -> Dict[str, Any]:
+    """
+    Call ``call`` once per input and report latency percentiles and the
+    throughput of the whole run. A few warm-up calls are made first.
+    """
+    for value in inputs[:warmup]:
+        call(value)
+    gc.collect()
+    samples = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for value in inputs:
+        before = clock()
+        call(value)
+        samples.append(clock() - before)
+    elapsed = (clock() - started) / 1e9
+    return {
+        "operations": len(inputs),
+        "seconds": elapsed,
+        "throughput_per_s": len(inputs) / elapsed if elapsed else 0.0,
+        "latency_ms": latency_summary(samples)
+    }
+
+
+def measure_memory(build: Callable[[], Any]) -> Tuple[Any, Dict[str, float]]:
+    """
+    Run ``build`` under tracemalloc and return its result with the time it
+    took and the peak memory it allocated. numpy reports its buffers to
+    tracemalloc, so arrays count too.
+    """
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = build()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {"build_seconds": elapsed, "peak_memory_mb": peak / 2 ** 20}
+
+
+def max_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    params = ",".join(f"{name}={value}" for name, value in sorted(result["params"].items()))
+    return f"{result['benchmark']}[{params}]"
+
+
+def write_results(path: str, results: List[Dict[str, Any]], extra: Optional[Dict[str, Any]] = None) -> None:
+    document = {"format": FORMAT_VERSION, "environment": environment(), "max_rss_mb": max_rss_mb(),
+                "results": results}
+    document.update(extra or {})
+    with open(path, "w", encoding="utf-8") as output_file:
+        json.dump(document, output_file, indent=2, sort_keys=True)
+        output_file.write("\n")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> Iterable[str]:
+    """
+    Yield one line per benchmark present in both documents with the ratio
+    of current to baseline p50, p99, throughput and peak memory
+    """
+    previous = {result_key(result): result for result in baseline["results"]}
+    yield f"{'benchmark':<60} {'p50':>8} {'p99':>8} {'ops/s':>8} {'memory':>8}"
+    for result in current["results"]:
+        key = result_key(result)
+        old = previous.get(key)
+        if old is None:
+            continue
+
+        def ratio(path: Sequence[str]) -> str:
+            before, after = old, result
+            for name in path:
+                before, after = (before or {}).get(name), (after or {}).get(name)
+            if not before or after is None:
+                return "-"
+            return f"{after / before:.2f}x"
+
+        yield (
+            f"{key:<60} {ratio(('latency_ms', 'p50')):>8} {ratio(('latency_ms', 'p99')):>8} "
+            f"{ratio(('throughput_per_s',)):>8} {ratio(('peak_memory_mb',)):>8}"
+        )
@@ -0,0 +1,335 @@
+"""
+Open-loop load test of the HTTP API, offline: Nominatim and the provider
+API are replaced by the local stand-ins in benchmarks.fake_services.
+
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --rates 50,100,200,400 --duration 20 --workers 4
+    python -m benchmarks.loadtest --latency 80 --jitter 40 --error-rate 0.02 --output load.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --endpoints search
+
+Without --url the fake services and the API are started as subprocesses on
+free ports, the API configured to call the fakes. Each endpoint is then
+driven at every rate of --rates for --duration seconds. Requests are sent
+on a fixed (or, with --arrivals poisson, exponential) schedule whether or
+not earlier ones have returned, and latency is measured from the scheduled
+send time, so a server that falls behind shows it in the percentiles
+rather than by quietly slowing the driver down.
+
+A stage is saturated when the API answers less than --min-throughput of
+the offered rate, its p99 exceeds --slo-ms, or more than --max-overload of
+its requests are turned away (503), time out or fail to connect. The
+rates of an endpoint stop rising at its first saturated stage. Errors
+injected into the fake services show up as 502s and do not count as
+overload.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks import generators
+from benchmarks.harness import compare, latency_summary, write_results
+from knowledge_base import load_knowledge_base
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = {
+    "analyze": "/analyze-symptoms",
+    "search": "/search-doctors",
+    "page": "/search-doctors/page"
+}
+DEFAULT_RATES = (10, 25, 50, 100, 200, 400)
+STARTUP_TIMEOUT = 120.0
+# Driver send lag, in ms, beyond which its own numbers are suspect
+MAX_SEND_LAG_MS = 10.0
+
+# Outcome of one request: HTTP status, or "timeout"/"connect" for failures
+Outcome = Tuple[Any, float, float]
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class Stack:
+    """
+    The fake services and the API as subprocesses, stopped on exit
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+        self.url = ""
+
+    def __enter__(self) -> "Stack":
+        args = self.args
+        nominatim_port, provider_port, api_port = _free_port(), _free_port(), _free_port()
+        fakes = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_services", "--nominatim-port", str(nominatim_port),
+             "--provider-port", str(provider_port), "--provider-size", str(args.provider_size),
+             "--latency", str(args.latency), "--jitter", str(args.jitter),
+             "--error-rate", str(args.error_rate), "--seed", str(args.seed)],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True
+        )
+        self.processes.append(fakes)
+        # The fakes print one line once both servers are listening
+        if not fakes.stdout.readline():
+            raise RuntimeError("fake services failed to start")
+
+        env = dict(os.environ)
+        env.pop("TELEMED_DIRECTORY", None)
+        env.update({
+            "TELEMED_NOMINATIM_URL": f"http://127.0.0.1:{nominatim_port}",
+            "TELEMED_PROVIDER_URLS": f"http://127.0.0.1:{provider_port}",
+            "TELEMED_API_WORKERS": str(args.workers),
+            "TELEMED_GEOCODE_RATE": str(args.geocode_rate),
+            "TELEMED_GEOCODE_BURST": str(max(1, int(args.geocode_rate))),
+            # A cold, in-memory geocode cache per run
+            "TELEMED_GEOCODE_CACHE": ""
+        })
+        log = open(args.server_log, "a") if args.server_log else subprocess.DEVNULL
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(api_port),
+             "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        ))
+        self.url = f"http://127.0.0.1:{api_port}"
+        self._wait_healthy()
+        return self
+
+    def _wait_healthy(self) -> None:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.processes[-1].poll() is not None:
+                raise RuntimeError("API exited during startup; see --server-log")
+            try:
+                if httpx.get(f"{self.url}/health", timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"API not healthy after {STARTUP_TIMEOUT:.0f}s")
+
+    def __exit__(self, *exc_info) -> None:
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def request_bodies(endpoint: str, count: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Request bodies for an endpoint, drawn from the benchmark generators.
+    Searches cycle through --locations distinct places, so after the first
+    few the geocode cache answers most of them, as in production.
+    """
+    if endpoint == "analyze":
+        texts = generators.generate_patient_texts(load_knowledge_base(args.kb), count, args.seed)
+        return [{"symptoms": text} for text in texts]
+    rng = random.Random(args.seed)
+    places = generators.generate_locations(args.locations, args.seed)
+    specializations = generators.generate_specializations(count, args.seed)
+    bodies = [{"location": rng.choice(places), "specialization": specialization, "radius": args.radius}
+              for specialization in specializations]
+    if endpoint == "page":
+        for body in bodies:
+            body["sort_by"] = rng.choice(("distance", "rating"))
+    return bodies
+
+
+async def _send(client: httpx.AsyncClient, path: str, body: Dict[str, Any], scheduled: float) -> Outcome:
+    loop = asyncio.get_running_loop()
+    lag = loop.time() - scheduled
+    try:
+        response = await client.post(path, json=body)
+        outcome = response.status_code
+    except httpx.TimeoutException:
+        outcome = "timeout"
+    except httpx.HTTPError:
+        outcome = "connect"
+    return outcome, loop.time() - scheduled, lag
+
+
+async def drive(client: httpx.AsyncClient, path: str, bodies: List[Dict[str, Any]], rate: float,
+                duration: float, poisson: bool, rng: random.Random) -> Tuple[List[Outcome], float]:
+    """
+    Send requests at rate per second for duration seconds, open loop, and
+    return their outcomes and the time from the first send to the last
+    response
+    """
+    loop = asyncio.get_running_loop()
+    count = max(1, int(rate * duration))
+    tasks = []
+    started = scheduled = loop.time()
+    for number in range(count):
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(_send(client, path, bodies[number % len(bodies)], scheduled)))
+        scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+    outcomes = await asyncio.gather(*tasks)
+    return outcomes, loop.time() - started
+
+
+def stage_result(endpoint: str, rate: float, outcomes: List[Outcome], elapsed: float,
+                 args: argparse.Namespace) -> Dict[str, Any]:
+    responses: Dict[str, int] = {}
+    for outcome, _, _ in outcomes:
+        responses[str(outcome)] = responses.get(str(outcome), 0) + 1
+    answered = [latency for outcome, latency, _ in outcomes if isinstance(outcome, int)]
+    succeeded = [latency for outcome, latency, _ in outcomes if isinstance(outcome, int) and outcome < 400]
+    overloaded = sum(count for outcome, count in responses.items() if outcome in ("503", "timeout", "connect"))
+    lags = np.array([lag for _, _, lag in outcomes]) * 1000.0
+    result = {
+        "benchmark": f"load_{endpoint}",
+        "params": {"rate": rate},
+        "operations": len(outcomes),
+        "seconds": elapsed,
+        "offered_per_s": rate,
+        "throughput_per_s": len(answered) / elapsed if elapsed else 0.0,
+        "success_per_s": len(succeeded) / elapsed if elapsed else 0.0,
+        "latency_ms": latency_summary([seconds * 1e9 for seconds in succeeded]) if succeeded else None,
+        "responses": responses,
+        "overload_share": overloaded / len(outcomes),
+        "send_lag_ms": {"p99": float(np.percentile(lags, 99)), "max": float(lags.max())}
+    }
+    reasons = []
+    if result["throughput_per_s"] < args.min_throughput * rate:
+        reasons.append(f"throughput {result['throughput_per_s']:.1f}/s < {args.min_throughput:.0%} of offered")
+    if result["latency_ms"] is None or result["latency_ms"]["p99"] > args.slo_ms:
+        reasons.append(f"p99 over {args.slo_ms:.0f} ms")
+    if result["overload_share"] > args.max_overload:
+        reasons.append(f"{result['overload_share']:.1%} rejected or timed out")
+    result["saturated"] = bool(reasons)
+    result["reasons"] = reasons
+    return result
+
+
+def format_stage(result: Dict[str, Any]) -> str:
+    latency = result["latency_ms"] or {}
+    ok = sum(count for status, count in result["responses"].items() if status.isdigit() and int(status) < 400)
+
+    def ms(name: str) -> str:
+        return f"{latency[name]:8.1f}" if name in latency else f"{'-':>8}"
+
+    line = (
+        f"{result['benchmark']:<14} {result['offered_per_s']:>8.0f} {result['throughput_per_s']:>9.1f} "
+        f"{ok / result['operations']:>6.1%} {ms('p50')} {ms('p95')} {ms('p99')} "
+        f"{result['overload_share']:>9.1%}"
+    )
+    if result["send_lag_ms"]["p99"] > MAX_SEND_LAG_MS:
+        line += "  (driver lagging; use more driver processes)"
+    if result["saturated"]:
+        line += "  SATURATED: " + "; ".join(result["reasons"])
+    return line
+
+
+async def run(url: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    results = []
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        print(f"{'endpoint':<14} {'offered':>8} {'achieved':>9} {'ok':>6} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'overload':>9}")
+        for endpoint in args.endpoints:
+            path = ENDPOINTS[endpoint]
+            bodies = request_bodies(endpoint, max(1000, int(max(args.rates) * args.duration)), args)
+            if args.warmup:
+                await drive(client, path, bodies, min(args.rates), args.warmup, False, rng)
+            sustained = None
+            for rate in args.rates:
+                outcomes, elapsed = await drive(client, path, bodies, rate, args.duration,
+                                                args.arrivals == "poisson", rng)
+                result = stage_result(endpoint, rate, outcomes, elapsed, args)
+                results.append(result)
+                print(format_stage(result), flush=True)
+                if result["saturated"]:
+                    break
+                sustained = rate
+            if sustained is None:
+                print(f"{endpoint}: saturated at the lowest rate, {min(args.rates)}/s")
+            elif result["saturated"]:
+                print(f"{endpoint}: sustains {sustained}/s, saturates by {result['offered_per_s']}/s")
+            else:
+                print(f"{endpoint}: sustains every rate up to {sustained}/s")
+    return results
+
+
+def _rates(value: str) -> List[float]:
+    return sorted(float(rate) for rate in value.split(",") if rate)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Open-loop load test of the API against local fake services")
+    parser.add_argument("--url", help="API to load; by default the API and fake services are started locally")
+    parser.add_argument("--endpoints", default="analyze,search", help="comma-separated: analyze, search, page")
+    parser.add_argument("--rates", type=_rates, default=list(DEFAULT_RATES), help="requests per second per stage")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per stage")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds at the lowest rate before measuring")
+    parser.add_argument("--arrivals", choices=("uniform", "poisson"), default="uniform")
+    parser.add_argument("--timeout", type=float, default=10.0, help="client timeout per request in seconds")
+    parser.add_argument("--connections", type=int, default=512, help="client connection pool size")
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="p99 latency above which a stage is saturated")
+    parser.add_argument("--min-throughput", type=float, default=0.95,
+                        help="share of the offered rate the API must answer")
+    parser.add_argument("--max-overload", type=float, default=0.01,
+                        help="share of 503s, timeouts and connect errors tolerated")
+    parser.add_argument("--locations", type=int, default=500, help="distinct search locations")
+    parser.add_argument("--radius", type=float, default=10.0, help="search radius in km")
+    parser.add_argument("--kb", help="knowledge base for symptom texts (default: the bundled one)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the local API")
+    parser.add_argument("--geocode-rate", type=float, default=50.0,
+                        help="geocoder requests per second the local API may make; 1 mirrors public Nominatim")
+    parser.add_argument("--latency", type=float, default=30.0, help="fake service latency in ms")
+    parser.add_argument("--jitter", type=float, default=15.0, help="fake service jitter in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake service requests failing")
+    parser.add_argument("--provider-size", type=int, default=100000, help="doctors in the fake provider API")
+    parser.add_argument("--server-log", help="append the local API's output to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+    args.endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.url:
+        results = asyncio.run(run(args.url, args))
+    else:
+        with Stack(args) as stack:
+            results = asyncio.run(run(stack.url, args))
+    if args.output:
+        write_results(args.output, results, {"arguments": {
+            "url": args.url, "endpoints": args.endpoints, "rates": args.rates, "duration": args.duration,
+            "arrivals": args.arrivals, "workers": args.workers, "geocode_rate": args.geocode_rate,
+            "latency_ms": args.latency, "jitter_ms": args.jitter, "error_rate": args.error_rate,
+            "provider_size": args.provider_size, "locations": args.locations, "seed": args.seed
+        }})
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        for line in compare(baseline, {"results": results}):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
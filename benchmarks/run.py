@@ -0,0 +1,232 @@
+"""
+Benchmark the symptom analyzer and doctor search on synthetic data.
+
+    python -m benchmarks.run --quick
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+    python -m benchmarks.run --suite search --directory-sizes 1000000 --stages
+
+Knowledge bases of --kb-sizes conditions and doctor directories of
+--directory-sizes providers are generated from a fixed seed, so runs on
+different revisions see identical inputs. Each result records its build
+time and peak traced memory, latency percentiles and throughput. --output
+writes them as JSON for --compare or other tools. --stages turns on the
+metrics layer and adds per-stage timings to each result; instrumented
+latencies are then slightly higher.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from ai_symptom_analyzer import SymptomAnalyzer
+from benchmarks import generators
+from benchmarks.harness import compare, measure_latency, measure_memory, result_key, write_results
+from doctor_search import CachingGeocoder, DoctorSearch
+from spatial_index import MAX_DISTANCE_KM
+from knowledge_base import KnowledgeBase
+
+DEFAULT_KB_SIZES = (10, 1000, 100000)
+DEFAULT_DIRECTORY_SIZES = (1000, 100000, 1000000)
+QUICK_KB_SIZES = (10, 1000)
+QUICK_DIRECTORY_SIZES = (1000, 100000)
+BATCH_SIZE = 256
+PAGE_SIZE = 20
+PAGES = 5
+# The original linear scan is only measured where it finishes in reasonable time
+MAX_SCAN_CONDITIONS = 1000
+
+
+def stage_summary() -> Dict[str, Dict[str, Any]]:
+    """
+    Counter values and the count and mean milliseconds of every histogram
+    series recorded since the last reset
+    """
+    summary: Dict[str, Dict[str, Any]] = {}
+    for name, metric in metrics.REGISTRY.to_json().items():
+        for series in metric["series"]:
+            labels = ",".join(f"{key}={value}" for key, value in sorted(series["labels"].items())) or "all"
+            if metric["type"] == "counter":
+                summary.setdefault(name, {})[labels] = series["value"]
+            elif series["count"]:
+                summary.setdefault(name, {})[labels] = {
+                    "count": series["count"],
+                    "mean_ms": series["sum"] / series["count"] * 1000
+                }
+    return summary
+
+
+class Runner:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.results: List[Dict[str, Any]] = []
+
+    def record(self, benchmark: str, params: Dict[str, Any], measured: Dict[str, Any],
+               build: Optional[Dict[str, float]] = None) -> None:
+        result = {"benchmark": benchmark, "params": params}
+        result.update(build or {})
+        result.update(measured)
+        if self.args.stages:
+            result["stages"] = stage_summary()
+        self.results.append(result)
+        latency = measured["latency_ms"]
+        print(
+            f"{result_key(result):<60} p50 {latency['p50']:9.3f} ms  p99 {latency['p99']:9.3f} ms  "
+            f"{measured['throughput_per_s']:10.0f} ops/s",
+            file=sys.stderr
+        )
+
+    def measure(self, call: Callable[[Any], Any], inputs: List[Any]) -> Dict[str, Any]:
+        metrics.REGISTRY.reset()
+        return measure_latency(call, inputs)
+
+    def run_analyzer(self, conditions: int, directory: str) -> None:
+        args = self.args
+        path = generators.write_synthetic_kb(conditions, directory, args.seed)
+
+        def build() -> SymptomAnalyzer:
+            analyzer = SymptomAnalyzer(knowledge_base=KnowledgeBase(path), cache_size=0)
+            analyzer.index
+            return analyzer
+
+        analyzer, build_stats = measure_memory(build)
+        texts = generators.generate_patient_texts(analyzer.kb, args.queries, args.seed)
+        params = {"conditions": conditions}
+
+        self.record("analyze_symptoms", params, self.measure(analyzer.analyze_symptoms, texts), build_stats)
+
+        cached = SymptomAnalyzer(knowledge_base=analyzer.kb)
+        repeated = [texts[position % 100] for position in range(len(texts))]
+        self.record("analyze_symptoms_cached", params, self.measure(cached.analyze_symptoms, repeated))
+
+        if conditions <= MAX_SCAN_CONDITIONS:
+            scan = lambda text: analyzer.analyze_symptoms(text, engine="scan")
+            self.record("analyze_symptoms_scan", params, self.measure(scan, texts))
+
+        batches = [texts[start:start + BATCH_SIZE] for start in range(0, len(texts), BATCH_SIZE)]
+        measured = self.measure(analyzer.analyze_symptoms_batch, batches)
+        measured["items_per_s"] = len(texts) / measured["seconds"] if measured["seconds"] else 0.0
+        self.record("analyze_symptoms_batch", dict(params, batch_size=BATCH_SIZE), measured)
+
+    def run_search(self, providers: int) -> None:
+        args = self.args
+        stub = generators.StubGeocoder(latency=args.geocode_latency / 1000)
+        geocoder = CachingGeocoder(stub, cache_path=None, rate=1e9, burst=1 << 30)
+
+        def build() -> DoctorSearch:
+            return DoctorSearch(geocoder=geocoder, doctors=generators.generate_directory(providers, args.seed))
+
+        doctor_search, build_stats = measure_memory(build)
+        queries = list(zip(
+            generators.generate_locations(args.queries, args.seed),
+            generators.generate_specializations(args.queries, args.seed)
+        ))
+        params = {"providers": providers, "radius_km": args.radius}
+
+        search = lambda query: doctor_search.search(query[0], query[1], args.radius)
+        self.record("search", params, self.measure(search, queries), build_stats)
+
+        nearest = lambda query: doctor_search.find_nearest_doctors(query[0], query[1], k=10)
+        self.record("find_nearest_doctors", dict(params, k=10), self.measure(nearest, queries))
+
+        best_rated = lambda query: doctor_search.query(query[0], query[1], args.radius, "rating", limit=PAGE_SIZE)
+        self.record("query_best_rated", dict(params, limit=PAGE_SIZE), self.measure(best_rated, queries))
+
+        def next_pages(query):
+            cursor = None
+            for _ in range(PAGES):
+                cursor = doctor_search.query(query[0], query[1], args.radius, limit=PAGE_SIZE, cursor=cursor).next_cursor
+                if cursor is None:
+                    break
+
+        self.record("query_nearest_pages", dict(params, limit=PAGE_SIZE, pages=PAGES), self.measure(next_pages, queries))
+
+        rated = lambda query: doctor_search.query(query[0], query[1], MAX_DISTANCE_KM, min_rating=4.5, limit=PAGE_SIZE)
+        self.record(
+            "query_nearest_rated", dict(params, radius_km=MAX_DISTANCE_KM, min_rating=4.5, limit=PAGE_SIZE),
+            self.measure(rated, queries)
+        )
+
+        nearby = lambda query: doctor_search.search_nearby_doctors(query[0], query[1], args.radius)
+        self.record("search_nearby_doctors", params, self.measure(nearby, queries))
+
+        async def fan_out() -> None:
+            # A bounded number of searches in flight, like a busy API worker
+            slots = asyncio.Semaphore(args.concurrency)
+
+            async def one(location: str, specialization: str) -> None:
+                async with slots:
+                    await doctor_search.async_search.search_nearby_doctors(location, specialization, args.radius)
+
+            await asyncio.gather(*(one(location, specialization) for location, specialization in queries))
+
+        concurrent = lambda _: doctor_search._loop_thread.run(fan_out())
+        measured = self.measure(concurrent, [None])
+        measured["throughput_per_s"] = len(queries) / measured["seconds"] if measured["seconds"] else 0.0
+        self.record("search_nearby_doctors_concurrent", dict(params, concurrency=args.concurrency), measured)
+
+    def run(self) -> List[Dict[str, Any]]:
+        args = self.args
+        if "analyzer" in args.suite:
+            with tempfile.TemporaryDirectory() as directory:
+                for conditions in args.kb_sizes:
+                    self.run_analyzer(conditions, directory)
+        if "search" in args.suite:
+            for providers in args.directory_sizes:
+                self.run_search(providers)
+        return self.results
+
+
+def _sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark symptom analysis and doctor search")
+    parser.add_argument("--suite", default="analyzer,search", help="comma-separated: analyzer, search")
+    parser.add_argument("--kb-sizes", type=_sizes, help="conditions per synthetic knowledge base")
+    parser.add_argument("--directory-sizes", type=_sizes, help="providers per synthetic directory")
+    parser.add_argument("--queries", type=int, help="queries per benchmark (default 2000, 300 with --quick)")
+    parser.add_argument("--radius", type=float, default=10.0, help="search radius in km")
+    parser.add_argument("--concurrency", type=int, default=16, help="searches in flight in the concurrent benchmark")
+    parser.add_argument("--geocode-latency", type=float, default=0.0, help="stub geocoder delay in ms")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer queries")
+    parser.add_argument("--stages", action="store_true", help="record per-stage timings via the metrics layer")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+    args.suite = set(args.suite.split(","))
+    if args.kb_sizes is None:
+        args.kb_sizes = QUICK_KB_SIZES if args.quick else DEFAULT_KB_SIZES
+    if args.directory_sizes is None:
+        args.directory_sizes = QUICK_DIRECTORY_SIZES if args.quick else DEFAULT_DIRECTORY_SIZES
+    if args.queries is None:
+        args.queries = 300 if args.quick else 2000
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.stages:
+        metrics.enable()
+    results = Runner(args).run()
+    if args.output:
+        write_results(args.output, results, {"arguments": {
+            "kb_sizes": args.kb_sizes, "directory_sizes": args.directory_sizes, "queries": args.queries,
+            "radius_km": args.radius, "geocode_latency_ms": args.geocode_latency, "seed": args.seed,
+            "stages": args.stages
+        }})
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        for line in compare(baseline, {"results": results}):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Stream a JSONL or CSV file of symptom descriptions through SymptomAnalyzer
+and write one JSON result per record.
+
+    python bulk_analyze.py messages.jsonl -o results.jsonl
+    python bulk_analyze.py messages.csv -o results.jsonl --field text --id-field message_id
+    python bulk_analyze.py messages.jsonl -o results.jsonl --resume
+
+Records are read lazily, grouped into chunks and analyzed by a process
+pool; at most ``--max-in-flight`` chunks are queued, buffered or running at
+any time, so memory stays bounded whatever the input size. Output lines are
+``{"index": n, "id": ..., "suggestions": [...]}``, or ``{"index": n,
+"error": ...}`` for records that could not be read.
+
+When writing to a file, progress is checkpointed next to the output. The
+checkpoint holds the input byte offset reached, the output size at that
+point and, for unordered output, which chunks past that offset are
+already written. --resume truncates the output to the checkpointed size
+and carries on from there without duplicating or losing records.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from ai_symptom_analyzer import SymptomAnalyzer
+
+# (input offset after the record, record id, text, read error)
+Record = Tuple[int, Any, Optional[str], Optional[str]]
+# (index of the first record, input offset after the last record, records)
+Chunk = Tuple[int, int, List[Record]]
+
+_worker_analyzer: Optional[SymptomAnalyzer] = None
+_worker_top_k = 3
+
+
+def _init_worker(kb_path: Optional[str], top_k: int) -> None:
+    global _worker_analyzer, _worker_top_k
+    _worker_analyzer = SymptomAnalyzer(knowledge_base=kb_path, cache_size=0)
+    _worker_top_k = top_k
+    _worker_analyzer.index
+
+
+def _analyze_chunk(start: int, records: List[Record], with_ids: bool) -> str:
+    """
+    Analyze one chunk and return its output lines, serialised in the worker
+    so the parent process only has to write them
+    """
+    texts = [text for _, _, text, error in records if error is None]
+    results = iter(_worker_analyzer.analyze_symptoms_batch(texts, _worker_top_k))
+    lines = []
+    for index, (_, record_id, _, error) in enumerate(records, start):
+        entry: Dict[str, Any] = {"index": index}
+        if with_ids:
+            entry["id"] = record_id
+        if error is None:
+            entry.update(next(results))
+        else:
+            entry["error"] = error
+        lines.append(json.dumps(entry, ensure_ascii=False))
+    return "\n".join(lines) + "\n"
+
+
+def _tracked_lines(stream: io.BufferedReader, position: List[int]) -> Iterator[str]:
+    for line in stream:
+        position[0] += len(line)
+        yield line.decode("utf-8")
+
+
+def read_jsonl(path: str, field: str, id_field: Optional[str], offset: int = 0) -> Iterator[Record]:
+    with open(path, "rb") as stream:
+        stream.seek(offset)
+        for line in stream:
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                if isinstance(data, str):
+                    yield offset, None, data, None
+                    continue
+                text = data[field]
+                if not isinstance(text, str):
+                    raise ValueError(f"field {field!r} is not a string")
+                yield offset, data.get(id_field) if id_field else None, text, None
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                yield offset, None, None, f"Invalid record: {e!r}"
+
+
+def read_csv(path: str, field: str, id_field: Optional[str], offset: int = 0) -> Iterator[Record]:
+    with open(path, "rb") as stream:
+        header_line = stream.readline()
+        header = next(csv.reader([header_line.decode("utf-8-sig")]))
+        if field not in header:
+            raise ValueError(f"CSV file has no {field!r} column")
+        if id_field is not None and id_field not in header:
+            raise ValueError(f"CSV file has no {id_field!r} column")
+        offset = max(offset, len(header_line))
+        stream.seek(offset)
+        position = [offset]
+        # csv pulls exactly the lines of one record (quoted fields may span
+        # several) before yielding it, so position ends on a record boundary
+        for row in csv.DictReader(_tracked_lines(stream, position), fieldnames=header):
+            if row[field] is None:
+                yield position[0], None, None, f"Invalid record: missing {field!r} column"
+                continue
+            yield position[0], row[id_field] if id_field else None, row[field], None
+
+
+def chunked(records: Iterator[Record], size: int, start: int) -> Iterator[Chunk]:
+    chunk: List[Record] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield start, record[0], chunk
+            start += size
+            chunk = []
+    if chunk:
+        yield start, chunk[-1][0], chunk
+
+
+class Checkpoint:
+    """
+    Resume point of a run, written atomically after chunks are flushed
+    """
+
+    def __init__(self, path: str, source: str, chunk_size: int):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.chunk_size = chunk_size
+        self.records = 0
+        self.input_offset = 0
+        self.output_bytes = 0
+        self.done: Set[int] = set()
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        with open(path, encoding="utf-8") as checkpoint_file:
+            data = json.load(checkpoint_file)
+        checkpoint = cls(path, data["source"], data["chunk_size"])
+        checkpoint.records = data["records"]
+        checkpoint.input_offset = data["input_offset"]
+        checkpoint.output_bytes = data["output_bytes"]
+        checkpoint.done = set(data["done"])
+        return checkpoint
+
+    def save(self) -> None:
+        data = {
+            "source": self.source,
+            "chunk_size": self.chunk_size,
+            "records": self.records,
+            "input_offset": self.input_offset,
+            "output_bytes": self.output_bytes,
+            "done": sorted(self.done)
+        }
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as checkpoint_file:
+            json.dump(data, checkpoint_file)
+        os.replace(temporary, self.path)
+
+
+def run(args: argparse.Namespace) -> int:
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    checkpoint_path = (args.checkpoint or args.output + ".checkpoint") if args.output else None
+
+    if args.resume:
+        if not args.output or not checkpoint_path or not os.path.exists(checkpoint_path):
+            print("Nothing to resume: --resume needs --output and an existing checkpoint", file=sys.stderr)
+            return 2
+        checkpoint = Checkpoint.load(checkpoint_path)
+        if checkpoint.source != os.path.abspath(args.input):
+            print(f"Checkpoint belongs to {checkpoint.source}, not {args.input}", file=sys.stderr)
+            return 2
+        # Chunks must line up with the previous run for the done set to apply
+        args.chunk_size = checkpoint.chunk_size
+        with open(args.output, "r+b") as output_file:
+            output_file.truncate(checkpoint.output_bytes)
+        output = open(args.output, "a", encoding="utf-8")
+    else:
+        checkpoint = Checkpoint(checkpoint_path, args.input, args.chunk_size) if checkpoint_path else None
+        output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    reader = read_csv if fmt == "csv" else read_jsonl
+    offset = checkpoint.input_offset if checkpoint else 0
+    first = checkpoint.records if checkpoint else 0
+    chunks = chunked(reader(args.input, args.field, args.id_field, offset), args.chunk_size, first)
+    skip = set(checkpoint.done) if checkpoint else set()
+
+    processes = args.processes or os.cpu_count() or 1
+    max_in_flight = args.max_in_flight or 2 * processes
+    with_ids = args.id_field is not None
+
+    # Chunks submitted but not yet written, and the size and end offset of
+    # every chunk the checkpoint has not moved past, by first record index
+    pending: Set[int] = set()
+    chunk_sizes: Dict[int, Tuple[int, int]] = {}
+    finished: Dict[int, Tuple[int, str]] = {}
+    running: Dict[Future, int] = {}
+    next_to_write = first
+    records_done = 0
+    started = last_report = last_checkpoint = time.perf_counter()
+
+    def write(start: int, text: str) -> None:
+        output.write(text)
+        pending.discard(start)
+        # A chunk skipped on resume may already be behind the checkpoint
+        if checkpoint is not None and start >= checkpoint.records:
+            checkpoint.done.add(start)
+            # The checkpoint offset only moves over a contiguous run of written chunks
+            while checkpoint.records in checkpoint.done:
+                checkpoint.done.discard(checkpoint.records)
+                size, end_offset = chunk_sizes.pop(checkpoint.records)
+                checkpoint.records += size
+                checkpoint.input_offset = end_offset
+
+    def complete(start: int, size: int, text: str) -> None:
+        nonlocal next_to_write
+        if args.unordered:
+            write(start, text)
+            return
+        finished[start] = size, text
+        while next_to_write in finished:
+            start = next_to_write
+            size, text = finished.pop(start)
+            next_to_write += size
+            write(start, text)
+
+    def drain(block: bool) -> None:
+        nonlocal records_done
+        done, _ = wait(list(running), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            start = running.pop(future)
+            size = chunk_sizes[start][0]
+            records_done += size
+            complete(start, size, future.result())
+
+    def save_checkpoint(force: bool = False) -> None:
+        nonlocal last_checkpoint
+        now = time.perf_counter()
+        if checkpoint is None or (not force and now - last_checkpoint < args.checkpoint_interval):
+            return
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint.output_bytes = output.tell()
+        checkpoint.save()
+        last_checkpoint = now
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(args.kb, args.top_k)) as pool:
+        try:
+            for start, end_offset, records in chunks:
+                chunk_sizes[start] = (len(records), end_offset)
+                if start in skip:
+                    # Already written by the interrupted run
+                    complete(start, len(records), "")
+                    continue
+                while len(pending) >= max_in_flight:
+                    drain(block=True)
+                pending.add(start)
+                running[pool.submit(_analyze_chunk, start, records, with_ids)] = start
+                drain(block=False)
+                save_checkpoint()
+
+                now = time.perf_counter()
+                if args.progress and now - last_report >= args.progress:
+                    last_report = now
+                    rate = records_done / (now - started)
+                    print(f"{records_done} records, {rate:.0f} records/s", file=sys.stderr)
+            while running:
+                drain(block=True)
+            save_checkpoint(force=True)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    elapsed = time.perf_counter() - started
+    rate = records_done / elapsed if elapsed else 0.0
+    print(
+        f"Analyzed {records_done} records in {elapsed:.1f} s "
+        f"({rate:.0f} records/s, {rate * 3600:.0f} records/hour, {processes} workers)",
+        file=sys.stderr
+    )
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analyze a JSONL or CSV file of symptom descriptions")
+    parser.add_argument("input", help="JSONL or CSV file of records")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: from the file extension)")
+    parser.add_argument("--field", default="symptoms", help="JSON key or CSV column holding the text")
+    parser.add_argument("--id-field", help="JSON key or CSV column copied into each result as 'id'")
+    parser.add_argument("--kb", help="compiled knowledge base (default: data/conditions.kb)")
+    parser.add_argument("--top-k", type=int, default=3, help="suggestions per record")
+    parser.add_argument("--processes", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=512, help="records per dispatched chunk")
+    parser.add_argument("--max-in-flight", type=int, help="chunks queued or buffered at once (default: 2 per process)")
+    parser.add_argument("--unordered", action="store_true", help="write chunks as they finish instead of in input order")
+    parser.add_argument("--checkpoint", help="checkpoint file when writing to --output (default: OUTPUT.checkpoint)")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0, help="seconds between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run from its checkpoint")
+    parser.add_argument("--progress", type=float, default=10.0, help="seconds between progress lines (0 disables)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -0,0 +1,579 @@
+"""
+Load a provider directory from CSV or JSONL, keep it current with delta
+files and publish it to searches without ever blocking them.
+
+    python directory.py build providers.csv -o directory.npz
+    python directory.py build providers.jsonl -o directory.npz --max-errors 100
+    python directory.py apply directory.npz deltas/*.jsonl -o directory.npz
+    python directory.py check providers.csv
+
+Directory records carry id, name, specialization, latitude and longitude,
+and optionally address, phone and rating (0 to 5). Coordinates must
+already be geocoded. Input is read and validated in chunks of
+--chunk-rows records that go straight into numpy columns, so peak memory
+is the size of the finished columns, not of a million Python objects.
+Invalid records are reported with their line and skipped; with
+--max-errors, a file with more of them is rejected as a whole.
+
+``build`` writes a snapshot with the spatial grid and rating orders
+already sorted, which servers load through TELEMED_DIRECTORY in well under
+a second. Delta files are records with an extra ``op`` of add, update or
+remove (which only needs the id). A running LiveDirectory applies them
+without a rebuild: only the touched grid cells and specializations are
+redone. ``apply`` does the same offline and compacts the result.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from doctor_store import Doctor, DoctorStore, StringPool
+from ranking import RankedIndex
+from spatial_index import SpatialIndex
+
+CHUNK_ROWS = 50000
+# Validation errors kept in a report; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+# Retired rows left in a live store before it is compacted
+COMPACT_RATIO = 0.25
+SNAPSHOT_FORMAT = 1
+DELTA_OPS = ("add", "update", "remove")
+
+DIRECTORY_PATH = os.environ.get("TELEMED_DIRECTORY")
+DELTA_DIRECTORY = os.environ.get("TELEMED_DIRECTORY_DELTAS")
+DELTA_INTERVAL = float(os.environ.get("TELEMED_DELTA_INTERVAL", 60))
+
+logger = logging.getLogger(__name__)
+
+
+class IngestError(ValueError):
+    """
+    A directory or delta file was rejected as a whole
+    """
+
+
+@dataclass
+class IngestReport:
+    path: str
+    records: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    def reject(self, line: int, message: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {message}")
+
+    def summary(self) -> str:
+        text = (
+            f"{self.path}: {self.records} records, {self.accepted} accepted, {self.rejected} rejected "
+            f"(+{self.added} ~{self.updated} -{self.removed}) in {self.seconds:.2f}s"
+        )
+        return "\n  ".join([text] + self.errors)
+
+
+def _open_text(path: str) -> io.TextIOBase:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_records(path: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    (line, record, error) for every record of a CSV or JSONL file, the
+    format chosen by extension (optionally gzipped). Records that cannot be
+    parsed come with an error instead.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as stream:
+        if name.endswith(".csv"):
+            reader = csv.DictReader(stream)
+            for data in reader:
+                yield reader.line_num, data, None
+            return
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"invalid JSON: {e}"
+                continue
+            if isinstance(data, dict):
+                yield line_number, data, None
+            else:
+                yield line_number, None, "record is not a JSON object"
+
+
+def _text(data: Dict[str, Any], name: str, required: bool = True) -> str:
+    value = data.get(name)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"missing {name}")
+    return value
+
+
+def _number(data: Dict[str, Any], name: str, low: float, high: float, default: Optional[float] = None) -> float:
+    value = data.get(name)
+    if value is None or value == "":
+        if default is None:
+            raise ValueError(f"missing {name}")
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} is not a number: {value!r}") from None
+    if not (math.isfinite(number) and low <= number <= high):
+        raise ValueError(f"{name} out of range [{low:g}, {high:g}]: {value!r}")
+    return number
+
+
+def record_id(data: Dict[str, Any]) -> str:
+    value = data.get("id")
+    if value is None or value == "":
+        value = data.get("doctor_id")
+    value = "" if value is None else str(value).strip()
+    if not value:
+        raise ValueError("missing id")
+    return value
+
+
+def parse_doctor(data: Dict[str, Any]) -> Doctor:
+    """
+    Validate one directory record. Raises ValueError naming the first
+    problem found.
+    """
+    return Doctor(
+        name=_text(data, "name"),
+        specialization=_text(data, "specialization"),
+        address=_text(data, "address", required=False),
+        phone=_text(data, "phone", required=False),
+        rating=_number(data, "rating", 0.0, 5.0, default=0.0),
+        latitude=_number(data, "latitude", -90.0, 90.0),
+        longitude=_number(data, "longitude", -180.0, 180.0),
+        doctor_id=record_id(data)
+    )
+
+
+class ColumnBuilder:
+    """
+    Collects doctors into numpy columns a chunk at a time, interning text
+    into a given pool, so only one chunk of Python values is alive at once
+    """
+
+    COLUMNS = (
+        ("latitudes", np.float64), ("longitudes", np.float64), ("ratings", np.float64),
+        ("codes", np.int32), ("name_ids", np.int32), ("address_ids", np.int32),
+        ("phone_ids", np.int32), ("doctor_ids", np.int32)
+    )
+
+    def __init__(self, strings: StringPool, chunk_rows: int = CHUNK_ROWS):
+        self.strings = strings
+        self.chunk_rows = chunk_rows
+        self.labels: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._pending: List[tuple] = []
+        self._chunks: Dict[str, List[np.ndarray]] = {name: [] for name, _ in self.COLUMNS}
+        self.rows = 0
+
+    def add(self, doctor: Doctor) -> int:
+        code = self._codes.get(doctor.specialization.lower())
+        if code is None:
+            code = self._codes[doctor.specialization.lower()] = len(self.labels)
+            self.labels.append(doctor.specialization)
+        intern = self.strings.intern
+        self._pending.append((
+            doctor.latitude, doctor.longitude, doctor.rating, code, intern(doctor.name),
+            intern(doctor.address), intern(doctor.phone), intern(doctor.doctor_id)
+        ))
+        self.rows += 1
+        if len(self._pending) >= self.chunk_rows:
+            self._flush()
+        return self.rows - 1
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        for (name, dtype), values in zip(self.COLUMNS, zip(*self._pending)):
+            self._chunks[name].append(np.array(values, dtype=dtype))
+        self._pending = []
+
+    def build(self) -> DoctorStore:
+        self._flush()
+        columns = {
+            name: np.concatenate(self._chunks[name]) if self._chunks[name] else np.empty(0, dtype=dtype)
+            for name, dtype in self.COLUMNS
+        }
+        return DoctorStore(
+            columns["latitudes"], columns["longitudes"], columns["ratings"], columns["codes"], self.labels,
+            columns["name_ids"], columns["address_ids"], columns["phone_ids"], self.strings,
+            columns["doctor_ids"]
+        )
+
+
+def _check_errors(report: IngestReport, max_errors: Optional[int]) -> None:
+    if max_errors is not None and report.rejected > max_errors:
+        raise IngestError(f"{report.rejected} invalid records, more than the {max_errors} allowed\n  "
+                          + report.summary())
+
+
+def ingest(path: str, chunk_rows: int = CHUNK_ROWS,
+           max_errors: Optional[int] = None) -> Tuple[DoctorStore, IngestReport]:
+    """
+    Stream a CSV or JSONL directory into a DoctorStore. Invalid records and
+    repeated ids are skipped and reported; with max_errors, more than that
+    many raise IngestError.
+    """
+    started = time.perf_counter()
+    report = IngestReport(path)
+    builder = ColumnBuilder(StringPool(), chunk_rows)
+    seen: Set[str] = set()
+    for line, data, error in read_records(path):
+        report.records += 1
+        try:
+            if error is not None:
+                raise ValueError(error)
+            doctor = parse_doctor(data)
+            if doctor.doctor_id in seen:
+                raise ValueError(f"duplicate id {doctor.doctor_id!r}")
+        except ValueError as e:
+            report.reject(line, str(e))
+            _check_errors(report, max_errors)
+            continue
+        seen.add(doctor.doctor_id)
+        builder.add(doctor)
+        report.accepted += 1
+    report.added = report.accepted
+    report.seconds = time.perf_counter() - started
+    return builder.build(), report
+
+
+@dataclass(frozen=True)
+class DirectorySnapshot:
+    """
+    One consistent, immutable version of the directory and its indexes
+    """
+
+    store: DoctorStore
+    index: SpatialIndex
+    ranked: RankedIndex
+    version: int = 0
+
+    @classmethod
+    def build(cls, store: DoctorStore, version: int = 0, cell_size_deg: float = 0.1,
+              grid_order: Optional[np.ndarray] = None,
+              rating_order: Optional[np.ndarray] = None) -> "DirectorySnapshot":
+        index = SpatialIndex(
+            store.latitudes, store.longitudes, store.specialization_codes.tolist(),
+            cell_size_deg=cell_size_deg, order=grid_order
+        )
+        return cls(store, index, RankedIndex(store, index, rating_order), version)
+
+    @property
+    def retired(self) -> int:
+        return int(np.count_nonzero(self.store.specialization_codes < 0))
+
+    def compacted(self) -> "DirectorySnapshot":
+        """
+        The same directory rebuilt from its live rows only, with a fresh
+        string pool, as a newer version
+        """
+        store = self.store
+        rows = store.live_rows.tolist()
+        return DirectorySnapshot.build(
+            DoctorStore.from_doctors(store.doctor(row) for row in rows),
+            self.version + 1, self.index.cell_size_deg
+        )
+
+
+def _pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = blob.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+
+def save_snapshot(snapshot: DirectorySnapshot, path: str) -> None:
+    """
+    Write a snapshot, compacted first if it has retired rows, with its
+    grid and rating orders. The file is replaced atomically.
+    """
+    if snapshot.retired:
+        snapshot = snapshot.compacted()
+    elif snapshot.index.order is None or snapshot.ranked.order is None:
+        # Updated in place by deltas; sort the orders afresh
+        snapshot = DirectorySnapshot.build(snapshot.store, snapshot.version, snapshot.index.cell_size_deg)
+    store = snapshot.store
+    string_blob, string_offsets = _pack_strings(store.strings.values)
+    label_blob, label_offsets = _pack_strings(store.specializations)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as snapshot_file:
+        np.savez(
+            snapshot_file,
+            format=np.array(SNAPSHOT_FORMAT),
+            cell_size_deg=np.array(snapshot.index.cell_size_deg),
+            latitudes=store.latitudes, longitudes=store.longitudes, ratings=store.ratings,
+            specialization_codes=store.specialization_codes,
+            name_ids=store.name_ids, address_ids=store.address_ids, phone_ids=store.phone_ids,
+            doctor_ids=store.doctor_ids if store.doctor_ids is not None else np.full(len(store), -1, np.int32),
+            string_blob=string_blob, string_offsets=string_offsets,
+            label_blob=label_blob, label_offsets=label_offsets,
+            grid_order=snapshot.index.order, rating_order=snapshot.ranked.order
+        )
+    os.replace(temporary, path)
+
+
+def load_snapshot(path: str) -> DirectorySnapshot:
+    with np.load(path) as data:
+        if int(data["format"]) != SNAPSHOT_FORMAT:
+            raise IngestError(f"{path}: unsupported snapshot format {int(data['format'])}")
+        store = DoctorStore(
+            data["latitudes"], data["longitudes"], data["ratings"], data["specialization_codes"],
+            _unpack_strings(data["label_blob"], data["label_offsets"]),
+            data["name_ids"], data["address_ids"], data["phone_ids"],
+            StringPool.from_values(_unpack_strings(data["string_blob"], data["string_offsets"])),
+            data["doctor_ids"]
+        )
+        return DirectorySnapshot.build(
+            store, cell_size_deg=float(data["cell_size_deg"]),
+            grid_order=data["grid_order"], rating_order=data["rating_order"]
+        )
+
+
+def load_directory(path: str, max_errors: Optional[int] = None) -> DirectorySnapshot:
+    """
+    A snapshot from a file written by save_snapshot (.npz) or from a raw
+    CSV or JSONL directory
+    """
+    if path.endswith(".npz"):
+        return load_snapshot(path)
+    store, report = ingest(path, max_errors=max_errors)
+    logger.info(report.summary())
+    return DirectorySnapshot.build(store)
+
+
+def apply_delta(snapshot: DirectorySnapshot, path: str, chunk_rows: int = CHUNK_ROWS,
+                max_errors: Optional[int] = None) -> Tuple[DirectorySnapshot, IngestReport]:
+    """
+    The snapshot after one delta file, built without touching ``snapshot``.
+    Later records for an id override earlier ones in the same file.
+    """
+    started = time.perf_counter()
+    report = IngestReport(path)
+    store = snapshot.store
+    # Final state of every id the delta touches: a doctor, or None if removed
+    changes: Dict[str, Optional[Doctor]] = {}
+    for line, data, error in read_records(path):
+        report.records += 1
+        try:
+            if error is not None:
+                raise ValueError(error)
+            op = _text(data, "op").lower()
+            if op not in DELTA_OPS:
+                raise ValueError(f"op must be one of {', '.join(DELTA_OPS)}, not {op!r}")
+            doctor_id = record_id(data)
+            if doctor_id in changes:
+                exists = changes[doctor_id] is not None
+            else:
+                exists = store.row_for_id(doctor_id) is not None
+            if op == "add" and exists:
+                raise ValueError(f"id {doctor_id!r} already exists")
+            if op != "add" and not exists:
+                raise ValueError(f"unknown id {doctor_id!r}")
+            changes[doctor_id] = None if op == "remove" else parse_doctor(data)
+        except ValueError as e:
+            report.reject(line, str(e))
+            _check_errors(report, max_errors)
+            continue
+        report.accepted += 1
+    if not changes:
+        report.seconds = time.perf_counter() - started
+        return snapshot, report
+
+    removed, builder = [], ColumnBuilder(store.strings, chunk_rows)
+    for doctor_id, doctor in changes.items():
+        row = store.row_for_id(doctor_id)
+        if row is not None:
+            removed.append(row)
+        if doctor is not None:
+            builder.add(doctor)
+        if doctor is None:
+            # An id added and removed again within the file changes nothing
+            if row is not None:
+                report.removed += 1
+        elif row is None:
+            report.added += 1
+        else:
+            report.updated += 1
+
+    removed_rows = np.array(sorted(removed), dtype=np.int64)
+    extended = store.extended(removed_rows, builder.build())
+    added_rows = np.arange(len(store), len(extended), dtype=np.int64)
+    index = snapshot.index.updated(
+        extended.latitudes, extended.longitudes, extended.specialization_codes.tolist(), removed_rows, added_rows
+    )
+    ranked = snapshot.ranked.updated(extended, index, removed_rows, added_rows)
+    report.seconds = time.perf_counter() - started
+    return DirectorySnapshot(extended, index, ranked, snapshot.version + 1), report
+
+
+class LiveDirectory:
+    """
+    Holds the published DirectorySnapshot.
+
+    Readers take ``current`` once per query and use that snapshot
+    throughout, so they never wait and never see a half-applied delta.
+    Writers build the next snapshot aside, sharing everything a delta does
+    not touch, and publish it by replacing that one reference. Writers are
+    serialized by a lock that readers never take.
+    """
+
+    def __init__(self, snapshot: DirectorySnapshot, compact_ratio: float = COMPACT_RATIO):
+        self.current = snapshot
+        self.compact_ratio = compact_ratio
+        # Delta files already applied or rejected, by absolute path
+        self.seen_deltas: Set[str] = set()
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "LiveDirectory":
+        return cls(load_directory(path))
+
+    def publish(self, snapshot: DirectorySnapshot) -> None:
+        self.current = snapshot
+
+    def apply_delta(self, path: str, max_errors: Optional[int] = None) -> IngestReport:
+        """
+        Apply one delta file and publish the result. Invalid records are
+        skipped and reported; with max_errors, more than that many reject
+        the file with IngestError and nothing is published.
+        """
+        with self._write_lock:
+            snapshot, report = apply_delta(self.current, path, max_errors=max_errors)
+            if snapshot.retired > self.compact_ratio * len(snapshot.store):
+                snapshot = snapshot.compacted()
+            self.publish(snapshot)
+            return report
+
+    def apply_pending(self, delta_directory: str) -> List[IngestReport]:
+        """
+        Apply the delta files in a directory not seen before, in name order.
+        A rejected file is reported once and not retried.
+        """
+        names = sorted(
+            name for name in os.listdir(delta_directory)
+            if not name.startswith(".") and not name.endswith(".tmp")
+        )
+        reports = []
+        for name in names:
+            path = os.path.abspath(os.path.join(delta_directory, name))
+            if path in self.seen_deltas:
+                continue
+            self.seen_deltas.add(path)
+            try:
+                reports.append(self.apply_delta(path))
+            except (ValueError, OSError):
+                logger.exception("Error applying directory delta %s", path)
+        return reports
+
+    def watch(self, delta_directory: str, interval: float = DELTA_INTERVAL) -> threading.Event:
+        """
+        Apply new delta files every ``interval`` seconds on a daemon thread
+        until the returned event is set
+        """
+        stop = threading.Event()
+
+        def poll() -> None:
+            while not stop.is_set():
+                try:
+                    for report in self.apply_pending(delta_directory):
+                        logger.info(report.summary())
+                except OSError:
+                    logger.exception("Error reading directory deltas in %s", delta_directory)
+                stop.wait(interval)
+
+        threading.Thread(target=poll, name="directory-deltas", daemon=True).start()
+        return stop
+
+
+def directory_from_env() -> Optional[LiveDirectory]:
+    """
+    The directory named by TELEMED_DIRECTORY, watching
+    TELEMED_DIRECTORY_DELTAS for delta files when set; None without one
+    """
+    if not DIRECTORY_PATH:
+        return None
+    directory = LiveDirectory.load(DIRECTORY_PATH)
+    if DELTA_DIRECTORY:
+        directory.watch(DELTA_DIRECTORY)
+    return directory
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build and update doctor directory snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="ingest a CSV or JSONL directory into a snapshot")
+    build.add_argument("input")
+    build.add_argument("-o", "--output", required=True, help="snapshot file (.npz)")
+    apply = commands.add_parser("apply", help="apply delta files to a snapshot")
+    apply.add_argument("snapshot")
+    apply.add_argument("deltas", nargs="+")
+    apply.add_argument("-o", "--output", required=True, help="snapshot file (.npz)")
+    check = commands.add_parser("check", help="validate a directory file without writing anything")
+    check.add_argument("input")
+    for command in (build, apply, check):
+        command.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="records per chunk")
+        command.add_argument("--max-errors", type=int, help="reject files with more invalid records")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        if args.command == "apply":
+            snapshot = load_snapshot(args.snapshot)
+            for path in args.deltas:
+                snapshot, report = apply_delta(snapshot, path, args.chunk_rows, args.max_errors)
+                print(report.summary(), file=sys.stderr)
+            save_snapshot(snapshot, args.output)
+            return 0
+
+        store, report = ingest(args.input, args.chunk_rows, args.max_errors)
+        print(report.summary(), file=sys.stderr)
+        if args.command == "build":
+            started = time.perf_counter()
+            save_snapshot(DirectorySnapshot.build(store), args.output)
+            print(f"{len(store)} doctors indexed and saved in {time.perf_counter() - started:.2f}s",
+                  file=sys.stderr)
+        if args.command == "check" and report.rejected:
+            return 1
+        return 0
+    except (ValueError, OSError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
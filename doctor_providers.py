@@ -0,0 +1,205 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+import httpx
+from geopy.distance import geodesic
+
+from doctor_store import Doctor
+
+if TYPE_CHECKING:
+    # directory imports this module through ranking
+    from directory import LiveDirectory
+
+
+class ProviderBackend:
+    """
+    A source of doctors queried by AsyncDoctorSearch. Subclasses return
+    doctors with ``distance`` set when they know it; the search fills in
+    and re-checks distances itself, so filtering here is only an optimisation.
+    """
+
+    name = "provider"
+    # Per-backend timeout in seconds; None uses the search-wide default
+    timeout: Optional[float] = None
+
+    async def search(self, lat: float, lon: float, specialization: str, radius_km: float) -> List[Doctor]:
+        raise NotImplementedError
+
+    async def get_details(self, doctor_ids: List[str]) -> Dict[str, Doctor]:
+        return {}
+
+
+class MockProvider(ProviderBackend):
+    """
+    The three fabricated doctors DoctorSearch has always returned, placed
+    around the query point. Stands in until a real provider is configured.
+    """
+
+    name = "mock"
+
+    async def search(self, lat: float, lon: float, specialization: str, radius_km: float) -> List[Doctor]:
+        # Simulate API call with mock data
+        # In a real app, this would be an actual API call
+        mock_doctors = [
+            Doctor(
+                name="Dr. John Smith",
+                specialization="General Medicine",
+                address="123 Medical Center Dr",
+                phone="(555) 123-4567",
+                rating=4.5,
+                latitude=lat + 0.01,
+                longitude=lon + 0.01
+            ),
+            Doctor(
+                name="Dr. Sarah Johnson",
+                specialization="Pediatrics",
+                address="456 Health Plaza",
+                phone="(555) 234-5678",
+                rating=4.8,
+                latitude=lat - 0.01,
+                longitude=lon - 0.01
+            ),
+            Doctor(
+                name="Dr. Michael Brown",
+                specialization="Cardiology",
+                address="789 Heart Center",
+                phone="(555) 345-6789",
+                rating=4.2,
+                latitude=lat + 0.02,
+                longitude=lon - 0.02
+            )
+        ]
+
+        # Calculate distances
+        for doctor in mock_doctors:
+            doctor_location = (doctor.latitude, doctor.longitude)
+            user_location = (lat, lon)
+            doctor.distance = geodesic(user_location, doctor_location).kilometers
+        return mock_doctors
+
+
+class DirectoryProvider(ProviderBackend):
+    """
+    Serves a local LiveDirectory through its spatial index. Queries run in a
+    worker thread so they never block the event loop, each on the snapshot
+    that was current when it started.
+    """
+
+    name = "directory"
+
+    def __init__(self, directory: "LiveDirectory"):
+        self.directory = directory
+
+    def _search(self, lat: float, lon: float, specialization: str, radius_km: float) -> List[Doctor]:
+        snapshot = self.directory.current
+        code = snapshot.store.specialization_code(specialization)
+        if code is None:
+            return []
+        hits = snapshot.index.query_radius(lat, lon, radius_km, code)
+        return snapshot.store.materialize([row for _, row in hits], [distance for distance, _ in hits])
+
+    async def search(self, lat: float, lon: float, specialization: str, radius_km: float) -> List[Doctor]:
+        return await asyncio.to_thread(self._search, lat, lon, specialization, radius_km)
+
+    def _page(self, lat: float, lon: float, specialization: str, radius_km: float, sort_by: str,
+              min_rating: Optional[float], limit: int, after: Optional[tuple]) -> List[Doctor]:
+        snapshot = self.directory.current
+        code = snapshot.store.specialization_code(specialization)
+        if code is None:
+            return []
+        keys = snapshot.ranked.query(lat, lon, code, sort_by, radius_km, min_rating, limit, after)
+        return snapshot.store.materialize(keys[-1].tolist(), keys[-2].tolist())
+
+    async def page(self, lat: float, lon: float, specialization: str, radius_km: float, sort_by: str,
+                   min_rating: Optional[float], limit: int, after: Optional[tuple]) -> List[Doctor]:
+        """
+        The first ``limit`` doctors after the sort key ``after``, selected by
+        the directory's RankedIndex so only they are materialized
+        """
+        return await asyncio.to_thread(
+            self._page, lat, lon, specialization, radius_km, sort_by, min_rating, limit, after
+        )
+
+    async def get_details(self, doctor_ids: List[str]) -> Dict[str, Doctor]:
+        store = self.directory.current.store
+        details = {}
+        for doctor_id in doctor_ids:
+            row = store.row_for_id(doctor_id)
+            if row is not None:
+                details[doctor_id] = store.doctor(row)
+        return details
+
+
+def doctor_from_json(data: Dict[str, Any]) -> Doctor:
+    doctor_id = data.get("id", data.get("doctor_id"))
+    return Doctor(
+        name=data["name"],
+        specialization=data["specialization"],
+        address=data.get("address", ""),
+        phone=data.get("phone", ""),
+        rating=float(data.get("rating", 0.0)),
+        distance=data.get("distance"),
+        latitude=data.get("latitude"),
+        longitude=data.get("longitude"),
+        doctor_id=None if doctor_id is None else str(doctor_id)
+    )
+
+
+class HTTPProvider(ProviderBackend):
+    """
+    JSON provider API reached through a shared pooled httpx.AsyncClient.
+
+    Expected endpoints, relative to base_url:
+      GET  /doctors?lat=&lon=&specialization=&radius_km=  -> {"doctors": [...]}
+      POST /doctors/batch {"ids": [...]}                  -> {"doctors": [...]}
+    Doctor objects carry name, specialization, address, phone, rating,
+    latitude, longitude, id and optionally distance.
+    """
+
+    def __init__(self, name: str, base_url: str, client: httpx.AsyncClient,
+                 api_key: Optional[str] = None, timeout: Optional[float] = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.client = client
+        self.timeout = timeout
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    async def search(self, lat: float, lon: float, specialization: str, radius_km: float) -> List[Doctor]:
+        response = await self.client.get(
+            f"{self.base_url}/doctors",
+            params={"lat": lat, "lon": lon, "specialization": specialization, "radius_km": radius_km},
+            headers=self.headers
+        )
+        response.raise_for_status()
+        return [doctor_from_json(item) for item in response.json()["doctors"]]
+
+    async def get_details(self, doctor_ids: List[str]) -> Dict[str, Doctor]:
+        response = await self.client.post(
+            f"{self.base_url}/doctors/batch", json={"ids": doctor_ids}, headers=self.headers
+        )
+        response.raise_for_status()
+        doctors = (doctor_from_json(item) for item in response.json()["doctors"])
+        return {doctor.doctor_id: doctor for doctor in doctors if doctor.doctor_id is not None}
+
+
+def doctor_key(doctor: Doctor) -> tuple:
+    """
+    Identity used to merge the same doctor listed by several providers
+    """
+    digits = "".join(char for char in doctor.phone if char.isdigit())
+    return " ".join(doctor.name.casefold().split()), digits or doctor.address.casefold()
+
+
+def merge_doctors(result_lists: Iterable[List[Doctor]]) -> List[Doctor]:
+    """
+    Merge provider results, keeping the closest listing of each doctor.
+    Earlier providers win ties.
+    """
+    merged: Dict[tuple, Doctor] = {}
+    for doctors in result_lists:
+        for doctor in doctors:
+            key = doctor_key(doctor)
+            current = merged.get(key)
+            if current is None or doctor.distance < current.distance:
+                merged[key] = doctor
+    return list(merged.values())
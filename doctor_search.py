@@ -1,96 +1,633 @@
+import asyncio
 import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
+from urllib.parse import urlsplit
+import httpx
 import requests
 from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
+import metrics
+from cache import TTLCache
+from doctor_providers import DirectoryProvider, HTTPProvider, MockProvider, ProviderBackend, merge_doctors
+from directory import DirectorySnapshot, LiveDirectory
+from doctor_store import Doctor, DoctorStore
+from ranking import DEFAULT_PAGE_SIZE, Page, RankedIndex, check_query, decode_cursor, page_doctors, query_fingerprint
+from singleflight import AsyncSingleFlight, SingleFlight
+from spatial_index import MAX_DISTANCE_KM, SpatialIndex
 
-@dataclass
-class Doctor:
-    name: str
-    specialization: str
-    address: str
-    phone: str
-    rating: float
-    distance: Optional[float] = None
-    latitude: Optional[float] = None
-    longitude: Optional[float] = None
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SECONDS = metrics.histogram("telemed_search_seconds", "Time to answer one doctor search")
+SEARCH_STAGE_SECONDS = metrics.histogram(
+    "telemed_search_stage_seconds", "Time spent in each stage of a doctor search"
+)
+SEARCH_ERRORS = metrics.counter("telemed_search_errors_total", "Doctor searches that failed, by operation")
+PROVIDER_SECONDS = metrics.histogram("telemed_provider_seconds", "Provider backend call latency")
+PROVIDER_ERRORS = metrics.counter(
+    "telemed_provider_errors_total", "Provider backend calls that failed, by provider and kind"
+)
+GEOCODE_LOOKUPS = metrics.counter(
+    "telemed_geocode_lookups_total", "Geocoder lookups by where the answer came from"
+)
+GEOCODE_BACKEND_SECONDS = metrics.histogram(
+    "telemed_geocode_backend_seconds", "Latency of geocoding requests sent to the backend"
+)
+
+DEFAULT_GEOCODE_CACHE_PATH = os.environ.get(
+    "TELEMED_GEOCODE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "telemedicine_app", "geocode.sqlite")
+)
+# A self-hosted Nominatim, or a stand-in for load tests, as scheme://host:port
+NOMINATIM_URL = os.environ.get("TELEMED_NOMINATIM_URL")
+# Nominatim's usage policy allows one request per second
+GEOCODE_RATE = float(os.environ.get("TELEMED_GEOCODE_RATE", 1.0))
+GEOCODE_BURST = int(os.environ.get("TELEMED_GEOCODE_BURST", 1))
+
+def nominatim(url: Optional[str] = NOMINATIM_URL) -> Nominatim:
+    """
+    Nominatim client for the public service, or for the server at url
+    """
+    if not url:
+        return Nominatim(user_agent="telemedicine_app")
+    parts = urlsplit(url)
+    return Nominatim(user_agent="telemedicine_app", domain=parts.netloc + parts.path.rstrip("/"),
+                     scheme=parts.scheme or "https")
+
+@dataclass(frozen=True)
+class GeoPoint:
+    latitude: float
+    longitude: float
+    address: str = ""
+
+def normalize_location(query: str) -> str:
+    """
+    Canonical cache key for a free-text location: case, spacing and comma
+    placement are ignored, so " New York,NY" and "new york, ny" share a key.
+    """
+    parts = [" ".join(part.split()) for part in query.casefold().split(",")]
+    return ", ".join(part for part in parts if part)
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter. Callers beyond the burst capacity wait for a
+    token instead of failing, so bursts are spread out at ``rate`` requests
+    per second. Threads block in acquire(); coroutines await
+    acquire_async(), which sleeps on the event loop instead of holding a
+    thread while they wait.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take one token, waiting up to timeout seconds (forever if None)
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            self._sleep(wait)
+
+    def reserve(self) -> float:
+        """
+        Take one token, borrowing from the future if none is left, and
+        return the seconds until it is due
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            return max(0.0, -self._tokens) / self.rate
+
+    async def acquire_async(self) -> None:
+        # A caller cancelled while waiting forfeits its reserved slot
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class GeocodeStore:
+    """
+    SQLite-backed persistent geocode cache with per-entry expiry. Places the
+    provider could not resolve are stored with NULL coordinates.
+    """
+
+    def __init__(self, path: str = DEFAULT_GEOCODE_CACHE_PATH, clock=time.time):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "query TEXT PRIMARY KEY, latitude REAL, longitude REAL, "
+                "address TEXT, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[Optional[GeoPoint], float]]:
+        """
+        Return (point or None for a negative entry, seconds left), or None on a miss
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, address, expires_at FROM geocode WHERE query = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        latitude, longitude, address, expires_at = row
+        remaining = expires_at - self._clock()
+        if remaining <= 0:
+            return None
+        point = None if latitude is None else GeoPoint(latitude, longitude, address or "")
+        return point, remaining
+
+    def set(self, key: str, point: Optional[GeoPoint], ttl: float) -> None:
+        latitude = longitude = address = None
+        if point is not None:
+            latitude, longitude, address = point.latitude, point.longitude, point.address
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)",
+                (key, latitude, longitude, address, self._clock() + ttl)
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM geocode WHERE expires_at <= ?", (self._clock(),)).rowcount
+
+_NOT_FOUND = object()
+
+class CachingGeocoder:
+    """
+    Fronts a geopy-style geocoder (anything with ``geocode(query)`` returning an
+    object with latitude/longitude, or None) with an in-memory LRU, a
+    persistent SQLite cache, negative caching and a token-bucket limiter.
+    Concurrent misses for the same normalized location wait on one backend
+    request. Provider errors propagate to every waiting caller and are
+    never cached.
+
+    geocode() blocks its calling thread. geocode_async() answers memory
+    hits on the event loop, waits for the limiter there and runs only the
+    blocking SQLite and backend calls, on a small executor of its own.
+    """
+
+    def __init__(self, backend: Any = None, cache_path: Optional[str] = DEFAULT_GEOCODE_CACHE_PATH,
+                 memory_size: int = 1024, ttl: float = 30 * 24 * 3600, negative_ttl: float = 24 * 3600,
+                 rate: float = GEOCODE_RATE, burst: int = GEOCODE_BURST, io_threads: int = 4):
+        self.backend = backend if backend is not None else nominatim()
+        self.memory = TTLCache(maxsize=memory_size, ttl=ttl)
+        self.store = GeocodeStore(cache_path) if cache_path else None
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.limiter = TokenBucket(rate, burst)
+        self.flight = SingleFlight("geocode")
+        self.async_flight = AsyncSingleFlight("async_geocode")
+        # Threads are started on first use
+        self.executor = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="geocode")
+        self.backend_calls = 0
+
+    def _cached(self, key: str) -> Any:
+        cached = self.memory.get(key, _NOT_FOUND)
+        if cached is not _NOT_FOUND:
+            GEOCODE_LOOKUPS.inc(source="memory")
+        return cached
+
+    def _stored(self, key: str) -> Any:
+        stored = self.store.get(key)
+        if stored is None:
+            return _NOT_FOUND
+        GEOCODE_LOOKUPS.inc(source="store")
+        point, remaining = stored
+        self.memory.set(key, point, ttl=remaining)
+        return point
+
+    def _fetch(self, query: str) -> Tuple[Optional[GeoPoint], float]:
+        self.backend_calls += 1
+        GEOCODE_LOOKUPS.inc(source="backend")
+        with GEOCODE_BACKEND_SECONDS.time():
+            location = self.backend.geocode(query)
+        if location is None:
+            return None, self.negative_ttl
+        address = getattr(location, "address", "") or ""
+        return GeoPoint(location.latitude, location.longitude, address), self.ttl
+
+    def geocode(self, query: str) -> Optional[GeoPoint]:
+        key = normalize_location(query)
+        if not key:
+            return None
+        cached = self._cached(key)
+        if cached is not _NOT_FOUND:
+            return cached
+        # Concurrent misses for one location share a single lookup
+        point, _ = self.flight.do(key, self._lookup, key, query)
+        return point
+
+    def _lookup(self, key: str, query: str) -> Optional[GeoPoint]:
+        # A lookup that finished just before this one started may have
+        # filled the memory cache already
+        cached = self._cached(key)
+        if cached is not _NOT_FOUND:
+            return cached
+        if self.store is not None:
+            stored = self._stored(key)
+            if stored is not _NOT_FOUND:
+                return stored
+
+        self.limiter.acquire()
+        point, ttl = self._fetch(query)
+        self.memory.set(key, point, ttl=ttl)
+        if self.store is not None:
+            self.store.set(key, point, ttl)
+        return point
+
+    async def geocode_async(self, query: str) -> Optional[GeoPoint]:
+        key = normalize_location(query)
+        if not key:
+            return None
+        cached = self._cached(key)
+        if cached is not _NOT_FOUND:
+            return cached
+        point, _ = await self.async_flight.do(key, lambda: self._lookup_async(key, query))
+        return point
+
+    async def _lookup_async(self, key: str, query: str) -> Optional[GeoPoint]:
+        loop = asyncio.get_running_loop()
+        cached = self._cached(key)
+        if cached is not _NOT_FOUND:
+            return cached
+        if self.store is not None:
+            stored = await loop.run_in_executor(self.executor, self._stored, key)
+            if stored is not _NOT_FOUND:
+                return stored
+
+        await self.limiter.acquire_async()
+        point, ttl = await loop.run_in_executor(self.executor, self._fetch, query)
+        self.memory.set(key, point, ttl=ttl)
+        if self.store is not None:
+            await loop.run_in_executor(self.executor, self.store.set, key, point, ttl)
+        return point
+
+class AsyncDoctorSearch:
+    """
+    Asynchronous doctor search fanning out to several provider backends.
+
+    All HTTP providers share one pooled keep-alive client. Each backend gets
+    its own timeout; a backend that fails or times out is skipped so the
+    others still answer. Results are merged, de-duplicated across providers,
+    filtered by specialization and radius and sorted by distance.
+    """
+
+    def __init__(self, providers: Optional[Sequence[ProviderBackend]] = None,
+                 geocoder: Optional[CachingGeocoder] = None, timeout: float = 5.0,
+                 client: Optional[httpx.AsyncClient] = None, max_connections: int = 20):
+        self.geocoder = geocoder if geocoder is not None else CachingGeocoder()
+        self.timeout = timeout
+        self._owns_client = client is None
+        self.client = client if client is not None else httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.providers: List[ProviderBackend] = list(providers) if providers is not None else [MockProvider()]
+
+    def add_http_provider(self, name: str, base_url: str, api_key: Optional[str] = None,
+                          timeout: Optional[float] = None) -> HTTPProvider:
+        provider = HTTPProvider(name, base_url, self.client, api_key=api_key, timeout=timeout)
+        self.providers.append(provider)
+        return provider
+
+    async def aclose(self) -> None:
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncDoctorSearch":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def _call(self, provider: ProviderBackend, coro: Awaitable[T], default: T) -> T:
+        timeout = provider.timeout if provider.timeout is not None else self.timeout
+        try:
+            with PROVIDER_SECONDS.time(provider=provider.name):
+                return await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            PROVIDER_ERRORS.inc(provider=provider.name, kind="timeout")
+            logger.warning("Provider %s timed out after %ss", provider.name, timeout)
+        except Exception as e:
+            PROVIDER_ERRORS.inc(provider=provider.name, kind=type(e).__name__)
+            logger.warning("Provider %s failed: %s", provider.name, e, exc_info=True)
+        return default
+
+    async def _geocode(self, location: str) -> Optional[GeoPoint]:
+        # Searches for one location with different specializations share
+        # the geocoder's lookup
+        with SEARCH_STAGE_SECONDS.time(stage="geocode"):
+            return await self.geocoder.geocode_async(location)
+
+    async def search_nearby_doctors(self, location: str, specialization: str,
+                                    radius_km: float = 10) -> List[Doctor]:
+        with SEARCH_SECONDS.time(operation="search_nearby_doctors"):
+            point = await self._geocode(location)
+            if not point:
+                return []
+            return await self.search_near(point.latitude, point.longitude, specialization, radius_km)
+
+    async def search_near(self, lat: float, lon: float, specialization: str,
+                          radius_km: float = 10) -> List[Doctor]:
+        filtered = await self._collect(lat, lon, specialization, radius_km)
+        # Sort by distance
+        with SEARCH_STAGE_SECONDS.time(stage="merge_sort"):
+            return sorted(merge_doctors(filtered), key=lambda x: x.distance)
+
+    async def query(self, location: str, specialization: str, radius_km: float = 10,
+                    sort_by: str = "distance", min_rating: Optional[float] = None,
+                    limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Page:
+        """
+        One page of doctors within radius_km, nearest or best rated first,
+        continuing after ``cursor``. Directory providers select their part of
+        the page through their ranked index; the other providers' results
+        are merged with it and only the page is selected from them. Raises
+        ValueError for an unknown sort order or a cursor issued for a
+        different query.
+        """
+        check_query(sort_by, limit)
+        query = query_fingerprint(
+            normalize_location(location), specialization.lower(), radius_km, sort_by, min_rating
+        )
+        after = decode_cursor(cursor, query) if cursor else None
+        with SEARCH_SECONDS.time(operation="query"):
+            point = await self._geocode(location)
+            if not point:
+                return Page([])
+            lat, lon = point.latitude, point.longitude
+            with SEARCH_STAGE_SECONDS.time(stage="providers"):
+                # limit + 1 from each directory tells whether another page follows
+                result_lists = await asyncio.gather(*(
+                    self._call(provider, provider.page(
+                        lat, lon, specialization, radius_km, sort_by, min_rating, limit + 1, after
+                    ) if isinstance(provider, DirectoryProvider) else provider.search(
+                        lat, lon, specialization, radius_km
+                    ), [])
+                    for provider in self.providers
+                ))
+            filtered = self._filter(lat, lon, specialization, radius_km, result_lists)
+            with SEARCH_STAGE_SECONDS.time(stage="merge_page"):
+                return page_doctors(merge_doctors(filtered), query, sort_by, min_rating, limit, after)
+
+    async def _collect(self, lat: float, lon: float, specialization: str,
+                       radius_km: float) -> List[List[Doctor]]:
+        """
+        Each provider's doctors of the specialization within radius_km, with
+        distances filled in
+        """
+        with SEARCH_STAGE_SECONDS.time(stage="providers"):
+            result_lists = await asyncio.gather(*(
+                self._call(provider, provider.search(lat, lon, specialization, radius_km), [])
+                for provider in self.providers
+            ))
+        return self._filter(lat, lon, specialization, radius_km, result_lists)
+
+    @staticmethod
+    def _filter(lat: float, lon: float, specialization: str, radius_km: float,
+                result_lists: List[List[Doctor]]) -> List[List[Doctor]]:
+        with SEARCH_STAGE_SECONDS.time(stage="filter"):
+            wanted = specialization.lower()
+            filtered = []
+            for doctors in result_lists:
+                kept = []
+                for doctor in doctors:
+                    if doctor.specialization.lower() != wanted:
+                        continue
+                    if doctor.distance is None:
+                        if doctor.latitude is None or doctor.longitude is None:
+                            continue
+                        doctor.distance = geodesic((lat, lon), (doctor.latitude, doctor.longitude)).kilometers
+                    if doctor.distance <= radius_km:
+                        kept.append(doctor)
+                filtered.append(kept)
+        return filtered
+
+    async def get_doctor_details_many(self, doctor_ids: Iterable[str]) -> Dict[str, Optional[Doctor]]:
+        """
+        Look up many doctors in one round trip per provider. Providers are
+        queried concurrently; earlier providers win when several know an id.
+        """
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        if not doctor_ids:
+            return {}
+        found = await asyncio.gather(*(
+            self._call(provider, provider.get_details(doctor_ids), {})
+            for provider in self.providers
+        ))
+        details: Dict[str, Optional[Doctor]] = {doctor_id: None for doctor_id in doctor_ids}
+        for provider_details in reversed(found):
+            for doctor_id, doctor in provider_details.items():
+                if doctor_id in details:
+                    details[doctor_id] = doctor
+        return details
+
+    async def get_doctor_details(self, doctor_id: str) -> Optional[Doctor]:
+        return (await self.get_doctor_details_many([doctor_id]))[doctor_id]
+
+
+class _EventLoopThread:
+    """
+    Background event loop that lets synchronous code run coroutines while
+    keeping pooled connections alive between calls.
+    """
 
-class DoctorSearch:
     def __init__(self):
-        self.geolocator = Nominatim(user_agent="telemedicine_app")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def run(self, coro: Awaitable[T]) -> T:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="doctor-search-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+
+class DoctorSearch:
+    """
+    Synchronous facade over AsyncDoctorSearch for the desktop app. Searches
+    run on a private background event loop.
+    """
+
+    def __init__(self, geocoder: Optional[CachingGeocoder] = None,
+                 doctors: Union[LiveDirectory, DoctorStore, Iterable[Doctor], None] = None,
+                 cell_size_deg: float = 0.1,
+                 providers: Optional[Sequence[ProviderBackend]] = None):
+        self.geocoder = geocoder if geocoder is not None else CachingGeocoder()
+        self.geolocator = self.geocoder.backend
         # In a real app, this would be an API key
         self.api_key = "YOUR_API_KEY"
-        
+
+        # With a directory of doctors, searches go through a spatial index
+        # partitioned by specialization; without one they use mock data.
+        # Each search reads the directory's current snapshot once, so
+        # updates published meanwhile never show up halfway through it.
+        self.directory: Optional[LiveDirectory] = None
+        if doctors is not None:
+            if not isinstance(doctors, LiveDirectory):
+                if not isinstance(doctors, DoctorStore):
+                    doctors = DoctorStore.from_doctors(doctors)
+                doctors = LiveDirectory(DirectorySnapshot.build(doctors, cell_size_deg=cell_size_deg))
+            self.directory = doctors
+
+        if providers is None:
+            providers = [DirectoryProvider(self.directory) if self.directory is not None else MockProvider()]
+        self.async_search = AsyncDoctorSearch(providers, geocoder=self.geocoder)
+        self._loop_thread = _EventLoopThread()
+
+    def _resolve(self, location: str) -> Optional[Tuple[float, float]]:
+        location_data = self.geocoder.geocode(location)
+        if not location_data:
+            return None
+        return location_data.latitude, location_data.longitude
+
+    @property
+    def store(self) -> Optional[DoctorStore]:
+        return self.directory.current.store if self.directory is not None else None
+
+    @property
+    def index(self) -> Optional[SpatialIndex]:
+        return self.directory.current.index if self.directory is not None else None
+
+    @property
+    def ranked(self) -> Optional[RankedIndex]:
+        return self.directory.current.ranked if self.directory is not None else None
+
+    @staticmethod
+    def _from_hits(store: DoctorStore, hits: List[Tuple[float, int]]) -> List[Doctor]:
+        # Fresh views, so concurrent searches never share mutable records
+        return store.materialize([row for _, row in hits], [distance for distance, _ in hits])
+
+    def search(self, location: str, specialization: str, radius_km: float = 10,
+               limit: Optional[int] = None) -> List[Tuple[Doctor, float]]:
+        """
+        Search the doctor directory, returning (doctor, distance_km) pairs
+        nearest first. With a ``limit``, only that many doctors are selected
+        and materialized; a limit below 1 raises ValueError. Errors
+        propagate to the caller.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        if self.directory is None:
+            doctors = self.search_nearby_doctors(location, specialization, radius_km)[:limit]
+            return [(doctor, doctor.distance) for doctor in doctors]
+
+        snapshot = self.directory.current
+        with SEARCH_SECONDS.time(operation="search"):
+            with SEARCH_STAGE_SECONDS.time(stage="geocode"):
+                coordinates = self._resolve(location)
+            code = snapshot.store.specialization_code(specialization)
+            if not coordinates or code is None:
+                return []
+            with SEARCH_STAGE_SECONDS.time(stage="index"):
+                if limit is None:
+                    hits = snapshot.index.query_radius(*coordinates, radius_km, code)
+                else:
+                    distances, rows = snapshot.ranked.query(*coordinates, code, radius_km=radius_km, limit=limit)
+                    hits = list(zip(distances.tolist(), rows.tolist()))
+            with SEARCH_STAGE_SECONDS.time(stage="materialize"):
+                doctors = snapshot.store.materialize([row for _, row in hits])
+            return list(zip(doctors, [distance for distance, _ in hits]))
+
+    def query(self, location: str, specialization: str, radius_km: float = 10,
+              sort_by: str = "distance", min_rating: Optional[float] = None,
+              limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Page:
+        """
+        One page of doctors within radius_km, nearest or best rated first
+        ("distance" or "rating"), rated at least min_rating, continuing after
+        the ``next_cursor`` of the previous page. With a directory only the
+        page is selected and materialized. Errors propagate to the caller.
+        """
+        if self.directory is None:
+            return self._loop_thread.run(self.async_search.query(
+                location, specialization, radius_km, sort_by, min_rating, limit, cursor
+            ))
+
+        check_query(sort_by, limit)
+        snapshot = self.directory.current
+        with SEARCH_SECONDS.time(operation="query"):
+            with SEARCH_STAGE_SECONDS.time(stage="geocode"):
+                coordinates = self._resolve(location)
+            code = snapshot.store.specialization_code(specialization)
+            if not coordinates or code is None:
+                return Page([])
+            with SEARCH_STAGE_SECONDS.time(stage="rank"):
+                return snapshot.ranked.page(*coordinates, code, sort_by, radius_km, min_rating, limit, cursor)
+
     def search_nearby_doctors(self, location: str, specialization: str, radius_km: float = 10) -> List[Doctor]:
         """
         Search for doctors near a given location with specified specialization.
         In a real implementation, this would use a medical provider API.
         """
         try:
-            # Get coordinates for the location
-            location_data = self.geolocator.geocode(location)
-            if not location_data:
+            return self._loop_thread.run(
+                self.async_search.search_nearby_doctors(location, specialization, radius_km)
+            )
+        except Exception as e:
+            SEARCH_ERRORS.inc(operation="search_nearby_doctors", error=type(e).__name__)
+            logger.exception("Error searching for doctors near %r", location)
+            return []
+
+    def find_nearest_doctors(self, location: str, specialization: str, k: int = 5,
+                             max_radius_km: float = MAX_DISTANCE_KM) -> List[Doctor]:
+        """
+        Find the k doctors with the given specialization nearest to a location.
+        Requires a doctor directory; the mock data has no meaningful neighbours.
+        """
+        if self.directory is None:
+            return self.search_nearby_doctors(location, specialization, max_radius_km)[:k]
+        snapshot = self.directory.current
+        try:
+            coordinates = self._resolve(location)
+            if not coordinates:
                 return []
-            
-            lat, lon = location_data.latitude, location_data.longitude
-            
-            # Simulate API call with mock data
-            # In a real app, this would be an actual API call
-            mock_doctors = [
-                Doctor(
-                    name="Dr. John Smith",
-                    specialization="General Medicine",
-                    address="123 Medical Center Dr",
-                    phone="(555) 123-4567",
-                    rating=4.5,
-                    latitude=lat + 0.01,
-                    longitude=lon + 0.01
-                ),
-                Doctor(
-                    name="Dr. Sarah Johnson",
-                    specialization="Pediatrics",
-                    address="456 Health Plaza",
-                    phone="(555) 234-5678",
-                    rating=4.8,
-                    latitude=lat - 0.01,
-                    longitude=lon - 0.01
-                ),
-                Doctor(
-                    name="Dr. Michael Brown",
-                    specialization="Cardiology",
-                    address="789 Heart Center",
-                    phone="(555) 345-6789",
-                    rating=4.2,
-                    latitude=lat + 0.02,
-                    longitude=lon - 0.02
-                )
-            ]
-            
-            # Calculate distances and filter by radius
-            for doctor in mock_doctors:
-                doctor_location = (doctor.latitude, doctor.longitude)
-                user_location = (lat, lon)
-                doctor.distance = geodesic(user_location, doctor_location).kilometers
-            
-            # Filter by specialization and radius
-            filtered_doctors = [
-                doctor for doctor in mock_doctors
-                if doctor.specialization.lower() == specialization.lower()
-                and doctor.distance <= radius_km
-            ]
-            
-            # Sort by distance
-            return sorted(filtered_doctors, key=lambda x: x.distance)
-            
+            code = snapshot.store.specialization_code(specialization)
+            if code is None:
+                return []
+            hits = snapshot.index.query_nearest(*coordinates, k, code, max_radius_km)
+            return self._from_hits(snapshot.store, hits)
         except Exception as e:
-            print(f"Error searching for doctors: {str(e)}")
+            SEARCH_ERRORS.inc(operation="find_nearest_doctors", error=type(e).__name__)
+            logger.exception("Error finding doctors nearest to %r", location)
             return []
     
     def get_doctor_details(self, doctor_id: str) -> Optional[Doctor]:
         """
-        Get detailed information about a specific doctor.
-        In a real implementation, this would fetch from a database or API.
+        Get detailed information about a specific doctor from the configured
+        providers.
         """
-        # This would be an actual API call in a real implementation
-        return None 
\ No newline at end of file
+        return self._loop_thread.run(self.async_search.get_doctor_details(doctor_id))
+
+    def get_doctor_details_many(self, doctor_ids: Iterable[str]) -> Dict[str, Optional[Doctor]]:
+        return self._loop_thread.run(self.async_search.get_doctor_details_many(doctor_ids)) 
\ No newline at end of file
@@ -0,0 +1,208 @@
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass(slots=True)
+class Doctor:
+    name: str
+    specialization: str
+    address: str
+    phone: str
+    rating: float
+    distance: Optional[float] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    doctor_id: Optional[str] = None
+
+
+class StringPool:
+    """
+    Append-only pool of interned strings addressed by integer id
+    """
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    @classmethod
+    def from_values(cls, values: Iterable[str]) -> "StringPool":
+        pool = cls()
+        pool.values = [sys.intern(value) for value in values]
+        pool._ids = {value: string_id for string_id, value in enumerate(pool.values)}
+        return pool
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.values[string_id]
+
+    def intern(self, value: str) -> int:
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.values.append(sys.intern(value))
+            self._ids[value] = string_id
+        return string_id
+
+
+class DoctorStore:
+    """
+    Columnar, read-only doctor directory.
+
+    Coordinates and ratings live in float64 arrays, specializations are
+    categorical codes and the text fields are ids into shared string pools.
+    Doctor objects are only built by materialize(), for the rows a caller
+    actually returns; they are fresh per call, so per-query data such as the
+    distance never touches the shared columns.
+
+    Rows retired by extended() keep their data but have specialization code
+    -1 and no doctor id, so no search or id lookup reaches them.
+    """
+
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, ratings: np.ndarray,
+                 specialization_codes: np.ndarray, specializations: Sequence[str],
+                 name_ids: np.ndarray, address_ids: np.ndarray, phone_ids: np.ndarray,
+                 strings: StringPool, doctor_ids: Optional[np.ndarray] = None):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.ratings = ratings
+        self.specialization_codes = specialization_codes
+        self.specializations = list(specializations)
+        self.name_ids = name_ids
+        self.address_ids = address_ids
+        self.phone_ids = phone_ids
+        self.strings = strings
+        # Pool ids of provider doctor ids, -1 where a row has none
+        self.doctor_ids = doctor_ids
+        self._rows_by_id: Optional[Dict[str, int]] = None
+        self._codes = {specialization.lower(): code for code, specialization in enumerate(self.specializations)}
+
+    @classmethod
+    def from_doctors(cls, doctors: Iterable[Doctor]) -> "DoctorStore":
+        strings = StringPool()
+        specializations: Dict[str, int] = {}
+        labels: List[str] = []
+        latitudes, longitudes, ratings = [], [], []
+        codes, name_ids, address_ids, phone_ids, doctor_ids = [], [], [], [], []
+        for doctor in doctors:
+            latitudes.append(doctor.latitude)
+            longitudes.append(doctor.longitude)
+            ratings.append(doctor.rating)
+            # Searches match specializations case-insensitively, so spellings
+            # differing only in case share the first-seen category
+            code = specializations.setdefault(doctor.specialization.lower(), len(specializations))
+            if code == len(labels):
+                labels.append(doctor.specialization)
+            codes.append(code)
+            name_ids.append(strings.intern(doctor.name))
+            address_ids.append(strings.intern(doctor.address))
+            phone_ids.append(strings.intern(doctor.phone))
+            doctor_ids.append(-1 if doctor.doctor_id is None else strings.intern(doctor.doctor_id))
+        return cls(
+            np.array(latitudes, dtype=np.float64),
+            np.array(longitudes, dtype=np.float64),
+            np.array(ratings, dtype=np.float64),
+            np.array(codes, dtype=np.int32),
+            labels,
+            np.array(name_ids, dtype=np.int32),
+            np.array(address_ids, dtype=np.int32),
+            np.array(phone_ids, dtype=np.int32),
+            strings,
+            np.array(doctor_ids, dtype=np.int32)
+        )
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    @property
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.specialization_codes >= 0)
+
+    def extended(self, removed: np.ndarray, added: "DoctorStore") -> "DoctorStore":
+        """
+        A new store with the removed rows retired and the rows of ``added``
+        appended after the existing ones, which keep their row numbers.
+        ``added`` must intern its strings in this store's pool. Columns are
+        copied; the pool is shared, which is safe because it only grows and
+        this store never looks past the ids it already had.
+        """
+        removed = np.asarray(removed, dtype=np.int64)
+        labels = list(self.specializations)
+        remap = []
+        for label in added.specializations:
+            code = self._codes.get(label.lower())
+            if code is None:
+                code = len(labels)
+                labels.append(label)
+            remap.append(code)
+        codes = np.concatenate((
+            self.specialization_codes, np.array(remap, dtype=np.int32)[added.specialization_codes]
+        )).astype(np.int32)
+        codes[removed] = -1
+
+        own_ids = self.doctor_ids if self.doctor_ids is not None else np.full(len(self), -1, dtype=np.int32)
+        added_ids = added.doctor_ids if added.doctor_ids is not None else np.full(len(added), -1, dtype=np.int32)
+        doctor_ids = np.concatenate((own_ids, added_ids)).astype(np.int32)
+        doctor_ids[removed] = -1
+
+        store = DoctorStore(
+            np.concatenate((self.latitudes, added.latitudes)),
+            np.concatenate((self.longitudes, added.longitudes)),
+            np.concatenate((self.ratings, added.ratings)),
+            codes,
+            labels,
+            np.concatenate((self.name_ids, added.name_ids)),
+            np.concatenate((self.address_ids, added.address_ids)),
+            np.concatenate((self.phone_ids, added.phone_ids)),
+            self.strings,
+            doctor_ids
+        )
+        # Carry the id lookup over rather than rebuilding it from every row
+        if self._rows_by_id is not None:
+            rows_by_id = dict(self._rows_by_id)
+            for string_id in own_ids[removed].tolist():
+                if string_id >= 0:
+                    rows_by_id.pop(self.strings[string_id], None)
+            for row, string_id in enumerate(added_ids.tolist(), len(self)):
+                if string_id >= 0:
+                    rows_by_id[self.strings[string_id]] = row
+            store._rows_by_id = rows_by_id
+        return store
+
+    def specialization_code(self, specialization: str) -> Optional[int]:
+        return self._codes.get(specialization.lower())
+
+    def row_for_id(self, doctor_id: str) -> Optional[int]:
+        if self.doctor_ids is None:
+            return None
+        if self._rows_by_id is None:
+            self._rows_by_id = {
+                self.strings[string_id]: row
+                for row, string_id in enumerate(self.doctor_ids.tolist()) if string_id >= 0
+            }
+        return self._rows_by_id.get(doctor_id)
+
+    def doctor(self, row: int, distance: Optional[float] = None) -> Doctor:
+        doctor_id = None
+        if self.doctor_ids is not None and self.doctor_ids[row] >= 0:
+            doctor_id = self.strings[self.doctor_ids[row]]
+        return Doctor(
+            name=self.strings[self.name_ids[row]],
+            specialization=self.specializations[self.specialization_codes[row]],
+            address=self.strings[self.address_ids[row]],
+            phone=self.strings[self.phone_ids[row]],
+            rating=float(self.ratings[row]),
+            distance=distance,
+            latitude=float(self.latitudes[row]),
+            longitude=float(self.longitudes[row]),
+            doctor_id=doctor_id
+        )
+
+    def materialize(self, rows: Iterable[int], distances: Optional[Iterable[float]] = None) -> List[Doctor]:
+        if distances is None:
+            return [self.doctor(row) for row in rows]
+        return [self.doctor(row, distance) for row, distance in zip(rows, distances)]
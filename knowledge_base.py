@@ -0,0 +1,244 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"SKB1"
+VERSION = 3
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_SOURCE_PATH = os.path.join(DATA_DIR, "conditions.json")
+DEFAULT_KB_PATH = os.path.join(DATA_DIR, "conditions.kb")
+
+# magic, version, strings, symptoms, conditions, symptom refs, remedy refs,
+# blob bytes, size and mtime in ns of the source JSON (zeros when built
+# from a mapping)
+_HEADER = struct.Struct("<4s7IQq")
+_WORD = np.dtype("<u4")
+
+logger = logging.getLogger(__name__)
+
+
+def source_path(path: str) -> str:
+    """
+    The JSON a compiled knowledge base is built from, e.g. conditions.json
+    for conditions.kb
+    """
+    return os.path.splitext(path)[0] + ".json"
+
+
+def write_knowledge_base(conditions: Dict[str, Dict[str, Any]], path: str,
+                         source_size: int = 0, source_mtime_ns: int = 0) -> None:
+    """
+    Compile a {condition: {"symptoms": [...], "remedies": [...]}} mapping into
+    the compact on-disk format read by KnowledgeBase.
+
+    Every string is stored once in a shared UTF-8 pool and referenced by its
+    integer id; sections are little-endian uint32 arrays in this order:
+    string offsets, symptom string ids, condition name ids, per-condition
+    symptom pointers and symptom ids, per-condition remedy pointers and
+    remedy string ids, followed by the string blob. ``source_size`` and
+    ``source_mtime_ns`` describe the file the mapping was read from.
+    """
+    string_ids: Dict[str, int] = {}
+    symptom_ids: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return string_ids.setdefault(value, len(string_ids))
+
+    names, symptom_ptr, symptom_refs, remedy_ptr, remedy_refs = [], [0], [], [0], []
+    for condition, data in conditions.items():
+        names.append(intern(condition))
+        for symptom in data["symptoms"]:
+            symptom_refs.append(symptom_ids.setdefault(symptom, len(symptom_ids)))
+            intern(symptom)
+        symptom_ptr.append(len(symptom_refs))
+        remedy_refs.extend(intern(remedy) for remedy in data["remedies"])
+        remedy_ptr.append(len(remedy_refs))
+
+    encoded = [value.encode("utf-8") for value in string_ids]
+    offsets = [0]
+    for chunk in encoded:
+        offsets.append(offsets[-1] + len(chunk))
+
+    sections = [
+        offsets,
+        [string_ids[symptom] for symptom in symptom_ids],
+        names,
+        symptom_ptr,
+        symptom_refs,
+        remedy_ptr,
+        remedy_refs,
+    ]
+    # Written aside and renamed, so a reader never maps a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as handle:
+        handle.write(_HEADER.pack(
+            MAGIC, VERSION, len(string_ids), len(symptom_ids), len(names),
+            len(symptom_refs), len(remedy_refs), offsets[-1], source_size, source_mtime_ns
+        ))
+        for section in sections:
+            handle.write(np.asarray(section, dtype=_WORD).tobytes())
+        handle.write(b"".join(encoded))
+    os.replace(tmp_path, path)
+
+
+def compile_knowledge_base(source: str, target: str) -> None:
+    with open(source, "rb") as source_file:
+        stat = os.fstat(source_file.fileno())
+        conditions = json.load(source_file)
+    write_knowledge_base(conditions, target, stat.st_size, stat.st_mtime_ns)
+
+
+class KnowledgeBase:
+    """
+    Read-only, memory-mapped view of a compiled knowledge base.
+
+    Opening the file only parses the fixed-size header, and the id arrays are
+    zero-copy views into the mapping, so worker processes share one copy
+    through the page cache. Strings are decoded on first access.
+    """
+
+    def __init__(self, path: str = DEFAULT_KB_PATH):
+        self.path = path
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = _HEADER.unpack_from(self._mmap, 0)
+        (magic, version, n_strings, n_symptoms, n_conditions, n_symptom_refs, n_remedy_refs, blob_size,
+         self.source_size, self.source_mtime_ns) = header
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} knowledge base")
+
+        offset = _HEADER.size
+
+        def section(count: int) -> np.ndarray:
+            nonlocal offset
+            array = np.frombuffer(self._mmap, dtype=_WORD, count=count, offset=offset)
+            offset += count * _WORD.itemsize
+            return array
+
+        self._string_offsets = section(n_strings + 1)
+        self.symptom_string_ids = section(n_symptoms)
+        self._condition_name_ids = section(n_conditions)
+        self.symptom_ptr = section(n_conditions + 1)
+        self.symptom_refs = section(n_symptom_refs)
+        self._remedy_ptr = section(n_conditions + 1)
+        self._remedy_refs = section(n_remedy_refs)
+        self._blob_offset = offset
+        if offset + blob_size > len(self._mmap):
+            raise ValueError(f"{path} is truncated")
+
+        self._strings: Dict[int, str] = {}
+        self._remedies: Dict[int, Tuple[str, ...]] = {}
+        self._condition_ids: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._condition_name_ids)
+
+    def string(self, string_id: int) -> str:
+        value = self._strings.get(string_id)
+        if value is None:
+            start = self._blob_offset + int(self._string_offsets[string_id])
+            end = self._blob_offset + int(self._string_offsets[string_id + 1])
+            value = sys.intern(self._mmap[start:end].decode("utf-8"))
+            self._strings[string_id] = value
+        return value
+
+    @property
+    def symptoms(self) -> List[str]:
+        """
+        Distinct symptom strings, indexed by symptom id
+        """
+        return [self.string(string_id) for string_id in self.symptom_string_ids.tolist()]
+
+    def condition_name(self, condition_id: int) -> str:
+        return self.string(int(self._condition_name_ids[condition_id]))
+
+    def condition_id(self, condition: str) -> Optional[int]:
+        if self._condition_ids is None:
+            self._condition_ids = {
+                self.condition_name(condition_id): condition_id for condition_id in range(len(self))
+            }
+        return self._condition_ids.get(condition)
+
+    def condition_symptom_ids(self, condition_id: int) -> np.ndarray:
+        return self.symptom_refs[self.symptom_ptr[condition_id]:self.symptom_ptr[condition_id + 1]]
+
+    def condition_symptoms(self, condition_id: int) -> List[str]:
+        return [
+            self.string(int(self.symptom_string_ids[symptom_id]))
+            for symptom_id in self.condition_symptom_ids(condition_id).tolist()
+        ]
+
+    def remedies(self, condition_id: int) -> List[str]:
+        """
+        Remedies for a condition, decoded the first time they are requested
+        """
+        remedies = self._remedies.get(condition_id)
+        if remedies is None:
+            refs = self._remedy_refs[self._remedy_ptr[condition_id]:self._remedy_ptr[condition_id + 1]]
+            remedies = tuple(self.string(string_id) for string_id in refs.tolist())
+            self._remedies[condition_id] = remedies
+        return list(remedies)
+
+    def to_dict(self) -> Dict[str, Dict[str, List[str]]]:
+        return {
+            self.condition_name(condition_id): {
+                "symptoms": self.condition_symptoms(condition_id),
+                "remedies": self.remedies(condition_id)
+            }
+            for condition_id in range(len(self))
+        }
+
+
+_loaded: Dict[str, KnowledgeBase] = {}
+_loaded_lock = threading.Lock()
+
+
+def is_stale(kb: KnowledgeBase) -> bool:
+    """
+    Whether the source JSON next to a compiled knowledge base looks edited
+    since it was compiled, judged by stat alone so loading never reads it.
+    A checkout also changes mtimes, so a newer mtime only counts when the
+    source is newer than the compiled file too.
+    """
+    try:
+        source = os.stat(source_path(kb.path))
+    except OSError:
+        return False
+    if source.st_size != kb.source_size:
+        return True
+    return (source.st_mtime_ns != kb.source_mtime_ns
+            and source.st_mtime_ns > os.stat(kb.path).st_mtime_ns)
+
+
+def load_knowledge_base(path: Optional[str] = None, reload: bool = False) -> KnowledgeBase:
+    """
+    Return the process-wide KnowledgeBase for path, opening it on first use.
+    Files are only compiled by ``python knowledge_base.py``; one whose
+    source JSON appears edited since is served with a warning.
+    """
+    path = os.path.abspath(path or DEFAULT_KB_PATH)
+    with _loaded_lock:
+        kb = _loaded.get(path)
+        if kb is None or reload:
+            kb = KnowledgeBase(path)
+            if is_stale(kb):
+                logger.warning("%s looks older than %s; rebuild it with python knowledge_base.py %s %s",
+                               path, source_path(path), source_path(path), path)
+            _loaded[path] = kb
+        return kb
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOURCE_PATH
+    target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_KB_PATH
+    compile_knowledge_base(source, target)
+    print(f"Wrote {len(load_knowledge_base(target))} conditions to {target}")
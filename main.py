@@ -1,30 +1,68 @@
+import logging
+import os
 import sys
+import threading
+import time
+
+# Taken before the heavy imports so the startup report includes them
+_STARTUP_T0 = time.perf_counter()
+
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QTextEdit, QPushButton, QLabel, QProgressBar,
                             QScrollArea, QFrame, QTabWidget, QLineEdit,
-                            QComboBox, QHBoxLayout, QGridLayout)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
-from PyQt6.QtGui import QFont, QPalette, QColor
-import speech_recognition as sr
-from ai_symptom_analyzer import SymptomAnalyzer
-from doctor_search import DoctorSearch, Doctor
+                            QComboBox, QGridLayout, QCheckBox,
+                            QListView, QStyledItemDelegate, QStyle)
+from PyQt6.QtCore import (Qt, QThread, pyqtSignal, QTimer, QObject, QRunnable, QThreadPool,
+                          QAbstractListModel, QModelIndex, QRectF, QSize)
+from PyQt6.QtGui import QFont, QPalette, QColor, QTextCursor, QPainter
+from ai_symptom_analyzer import ANALYSIS_STAGES, AnalysisCancelled, IncrementalAnalysis, SymptomAnalyzer
+
+# speech_recognition (and PyAudio), geopy and httpx are imported on first
+# use: voice capture on the first recording, doctor_search on the first search
+
+_IMPORTS_DONE = time.perf_counter()
+
+
+class StartupReport:
+    """
+    Startup timings, enabled with --startup-report or TELEMED_STARTUP_REPORT=1.
+    Marks are milliseconds since main.py started importing; the report is
+    printed to stderr once the window has painted for the first time.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.marks = {"imports": (_IMPORTS_DONE - _STARTUP_T0) * 1000}
+        self.reported = False
+
+    def mark(self, name):
+        if self.enabled and name not in self.marks:
+            self.marks[name] = (time.perf_counter() - _STARTUP_T0) * 1000
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        print("startup: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in self.marks.items()), file=sys.stderr)
 
 class VoiceRecorderThread(QThread):
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
     status = pyqtSignal(str)
+    partial = pyqtSignal(str)
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
 
     def run(self):
+        import speech_recognition as sr
+
         try:
-            recognizer = sr.Recognizer()
-            with sr.Microphone() as source:
-                self.status.emit("Adjusting for ambient noise...")
-                recognizer.adjust_for_ambient_noise(source)
-                self.status.emit("Recording... Speak now")
-                audio = recognizer.listen(source, timeout=5)
-                self.status.emit("Processing speech...")
-                text = recognizer.recognize_google(audio)
-                self.finished.emit(text)
+            text = self.session.transcribe(
+                timeout=5, on_status=self.status.emit, on_partial=self.partial.emit
+            )
+            self.finished.emit(text)
         except sr.WaitTimeoutError:
             self.error.emit("No speech detected")
         except sr.UnknownValueError:
@@ -32,35 +70,223 @@ class VoiceRecorderThread(QThread):
         except Exception as e:
             self.error.emit(f"Error: {str(e)}")
 
-class AnalysisThread(QThread):
-    finished = pyqtSignal(dict)
-    progress = pyqtSignal(int)
+class AnalysisSignals(QObject):
+    # Every signal carries the id of the request it belongs to
+    finished = pyqtSignal(int, dict)
+    progress = pyqtSignal(int, int)
+
+class AnalysisTask(QRunnable):
+    """
+    One symptom analysis run on the window's thread pool. Progress follows
+    the analyzer's real stages; setting ``cancelled`` stops the task at the
+    next stage boundary without emitting a result.
+    """
 
-    def __init__(self, symptoms, analyzer):
+    def __init__(self, request_id, symptoms, analyzer, signals):
         super().__init__()
+        self.request_id = request_id
         self.symptoms = symptoms
         self.analyzer = analyzer
+        self.signals = signals
+        self.cancelled = threading.Event()
+
+    def on_stage(self, stage):
+        if self.cancelled.is_set():
+            raise AnalysisCancelled()
+        done = ANALYSIS_STAGES.index(stage) + 1
+        self.signals.progress.emit(self.request_id, done * 100 // len(ANALYSIS_STAGES))
+
+    def run(self):
+        try:
+            results = self.analyzer.analyze_symptoms(self.symptoms, on_stage=self.on_stage)
+        except AnalysisCancelled:
+            return
+        except Exception as e:
+            results = {"error": str(e)}
+        if not self.cancelled.is_set():
+            self.signals.finished.emit(self.request_id, results)
+
+class DoctorSearchSignals(QObject):
+    finished = pyqtSignal(int, list)
+    failed = pyqtSignal(int, str)
+
+class DoctorSearchTask(QRunnable):
+    """
+    Runs a doctor search (geocoding included) off the GUI thread
+    """
+
+    def __init__(self, request_id, get_doctor_search, location, specialization, radius, signals):
+        super().__init__()
+        self.request_id = request_id
+        # Called on the worker thread so the first search, not the GUI
+        # thread, pays for importing and constructing DoctorSearch
+        self.get_doctor_search = get_doctor_search
+        self.location = location
+        self.specialization = specialization
+        self.radius = radius
+        self.signals = signals
 
     def run(self):
+        # An exception escaping a QRunnable aborts the application
         try:
-            # Simulate progress
-            for i in range(0, 101, 10):
-                self.progress.emit(i)
-                self.msleep(100)
-            
-            # Get analysis results
-            results = self.analyzer.analyze_symptoms(self.symptoms)
-            self.finished.emit(results)
+            doctors = self.get_doctor_search().search_nearby_doctors(
+                self.location, self.specialization, self.radius
+            )
         except Exception as e:
-            self.finished.emit({"error": str(e)})
+            self.signals.failed.emit(self.request_id, str(e))
+            return
+        self.signals.finished.emit(self.request_id, doctors)
+
+class DoctorListModel(QAbstractListModel):
+    """
+    Search results exposed to the view a page at a time: rows are added
+    through fetchMore() as the user scrolls towards the end of the list.
+    """
+
+    PAGE_SIZE = 50
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._doctors = []
+        self._visible = 0
+
+    def set_doctors(self, doctors):
+        self.beginResetModel()
+        self._doctors = doctors
+        self._visible = min(self.PAGE_SIZE, len(doctors))
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._visible
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self._visible:
+            return None
+        doctor = self._doctors[index.row()]
+        if role == Qt.ItemDataRole.UserRole:
+            return doctor
+        if role == Qt.ItemDataRole.DisplayRole:
+            return doctor.name
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._visible < len(self._doctors)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.PAGE_SIZE, len(self._doctors) - self._visible)
+        self.beginInsertRows(QModelIndex(), self._visible, self._visible + count - 1)
+        self._visible += count
+        self.endInsertRows()
+
+class DoctorCardDelegate(QStyledItemDelegate):
+    """
+    Paints a doctor card directly, so only rows on screen cost anything
+    """
+
+    CARD_HEIGHT = 120
+    MARGIN = 5
+    PADDING = 10
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self.CARD_HEIGHT)
+
+    def paint(self, painter, option, index):
+        doctor = index.data(Qt.ItemDataRole.UserRole)
+        if doctor is None:
+            return
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        card = QRectF(option.rect).adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+        selected = option.state & QStyle.StateFlag.State_Selected
+        painter.setPen(QColor("#BDBDBD"))
+        painter.setBrush(QColor("#E3F2FD" if selected else "#f5f5f5"))
+        painter.drawRoundedRect(card, 5, 5)
+
+        text = card.adjusted(self.PADDING, self.PADDING / 2, -self.PADDING, -self.PADDING / 2)
+        line_height = text.height() / 5
+        base_font = QFont(option.font)
+
+        def draw_line(line, value, bold=False, italic=False, align=Qt.AlignmentFlag.AlignLeft):
+            font = QFont(base_font)
+            font.setBold(bold)
+            font.setItalic(italic)
+            painter.setFont(font)
+            rect = QRectF(text.left(), text.top() + line * line_height, text.width(), line_height)
+            painter.drawText(rect, align | Qt.AlignmentFlag.AlignVCenter, value)
+
+        painter.setPen(QColor("#212121"))
+        # Doctor name and rating
+        draw_line(0, doctor.name, bold=True)
+        draw_line(0, f"⭐ {doctor.rating:.1f}", align=Qt.AlignmentFlag.AlignRight)
+        # Specialization
+        draw_line(1, doctor.specialization, italic=True)
+        # Address and distance
+        draw_line(2, f"📍 {doctor.address}")
+        draw_line(3, f"Distance: {doctor.distance:.1f} km")
+        # Phone
+        draw_line(4, f"📞 {doctor.phone}")
+        painter.restore()
 
 class TelemedicineApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, startup_report=None):
         super().__init__()
+        self.startup_report = startup_report or StartupReport(False)
         self.analyzer = SymptomAnalyzer()
-        self.doctor_search = DoctorSearch()
+        self._doctor_search = None
+        self._doctor_search_lock = threading.Lock()
+
+        # Long-lived workers: threads are reused across analyses
+        self.analysis_pool = QThreadPool(self)
+        self.analysis_pool.setMaxThreadCount(2)
+        self.analysis_pool.setExpiryTimeout(-1)
+        self.analysis_signals = AnalysisSignals()
+        self.analysis_signals.progress.connect(self.update_progress)
+        self.analysis_signals.finished.connect(self.on_analysis_finished)
+        self.analysis_request_id = 0
+        self.analysis_task = None
+
+        # Live analysis follows every edit; rendering waits for a typing pause
+        self.live_analysis = IncrementalAnalysis(self.analyzer)
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(300)
+        self.live_timer.timeout.connect(self.show_live_results)
+
+        self.search_pool = QThreadPool(self)
+        self.search_pool.setMaxThreadCount(2)
+        self.search_pool.setExpiryTimeout(-1)
+        self.search_signals = DoctorSearchSignals()
+        self.search_signals.finished.connect(self.on_doctor_search_finished)
+        self.search_signals.failed.connect(self.on_doctor_search_failed)
+        self.search_request_id = 0
+
+        # Kept across recordings so ambient-noise calibration runs only once
+        self.capture_session = None
+
         self.init_ui()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.startup_report.reported:
+            self.startup_report.mark("first paint")
+            self.startup_report.report()
+
+    def get_doctor_search(self):
+        """
+        Return the DoctorSearch, importing and constructing it on first use.
+        Safe to call from worker threads.
+        """
+        with self._doctor_search_lock:
+            if self._doctor_search is None:
+                from directory import directory_from_env
+                from doctor_search import DoctorSearch
+
+                self._doctor_search = DoctorSearch(doctors=directory_from_env())
+            return self._doctor_search
+
     def init_ui(self):
         self.setWindowTitle('Telemedicine')
         self.setMinimumSize(800, 900)
@@ -90,8 +316,13 @@ class TelemedicineApp(QMainWindow):
         self.symptom_input = QTextEdit()
         self.symptom_input.setPlaceholderText('Describe your symptoms here...')
         self.symptom_input.setMinimumHeight(100)
+        self.symptom_input.document().contentsChange.connect(self.on_symptoms_edited)
         symptom_layout.addWidget(self.symptom_input)
 
+        self.live_checkbox = QCheckBox('Analyze while typing')
+        self.live_checkbox.setChecked(True)
+        symptom_layout.addWidget(self.live_checkbox)
+
         self.voice_btn = QPushButton('🎤 Record Voice')
         self.voice_btn.setStyleSheet("""
             QPushButton {
@@ -149,9 +380,47 @@ class TelemedicineApp(QMainWindow):
 
         tabs.addTab(symptom_tab, "Symptom Analysis")
 
-        # Doctor Search Tab
-        doctor_tab = QWidget()
-        doctor_layout = QVBoxLayout(doctor_tab)
+        # The doctor search tab is built when it is first selected
+        self.tabs = tabs
+        self.doctor_tab = QWidget()
+        self.doctor_tab_built = False
+        tabs.addTab(self.doctor_tab, "Find Doctors")
+        tabs.currentChanged.connect(self.on_tab_changed)
+
+        # Set window style
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: white;
+            }
+            QTextEdit, QLineEdit {
+                border: 1px solid #BDBDBD;
+                border-radius: 5px;
+                padding: 5px;
+            }
+            QProgressBar {
+                border: 1px solid #BDBDBD;
+                border-radius: 5px;
+                text-align: center;
+            }
+            QProgressBar::chunk {
+                background-color: #4CAF50;
+            }
+            QComboBox {
+                border: 1px solid #BDBDBD;
+                border-radius: 5px;
+                padding: 5px;
+            }
+        """)
+
+    def on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.doctor_tab:
+            self.build_doctor_tab()
+
+    def build_doctor_tab(self):
+        if self.doctor_tab_built:
+            return
+        self.doctor_tab_built = True
+        doctor_layout = QVBoxLayout(self.doctor_tab)
 
         # Search form
         search_form = QGridLayout()
@@ -202,48 +471,30 @@ class TelemedicineApp(QMainWindow):
         doctor_layout.addLayout(search_form)
 
         # Results area
-        self.doctor_results = QScrollArea()
-        self.doctor_results.setWidgetResizable(True)
+        self.doctor_status_label = QLabel("")
+        self.doctor_status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        doctor_layout.addWidget(self.doctor_status_label)
+
+        self.doctor_model = DoctorListModel(self)
+        self.doctor_results = QListView()
+        self.doctor_results.setModel(self.doctor_model)
+        self.doctor_results.setItemDelegate(DoctorCardDelegate(self.doctor_results))
+        self.doctor_results.setUniformItemSizes(True)
+        self.doctor_results.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
         self.doctor_results.setMinimumHeight(400)
-        
-        self.doctor_results_widget = QWidget()
-        self.doctor_results_layout = QVBoxLayout(self.doctor_results_widget)
-        self.doctor_results.setWidget(self.doctor_results_widget)
-        
         doctor_layout.addWidget(self.doctor_results)
-        tabs.addTab(doctor_tab, "Find Doctors")
-
-        # Set window style
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: white;
-            }
-            QTextEdit, QLineEdit {
-                border: 1px solid #BDBDBD;
-                border-radius: 5px;
-                padding: 5px;
-            }
-            QProgressBar {
-                border: 1px solid #BDBDBD;
-                border-radius: 5px;
-                text-align: center;
-            }
-            QProgressBar::chunk {
-                background-color: #4CAF50;
-            }
-            QComboBox {
-                border: 1px solid #BDBDBD;
-                border-radius: 5px;
-                padding: 5px;
-            }
-        """)
 
     def record_voice(self):
         self.voice_btn.setEnabled(False)
-        self.recording_thread = VoiceRecorderThread()
+        if self.capture_session is None:
+            from voice_capture import CaptureSession
+
+            self.capture_session = CaptureSession()
+        self.recording_thread = VoiceRecorderThread(self.capture_session)
         self.recording_thread.finished.connect(self.on_recording_finished)
         self.recording_thread.error.connect(self.on_recording_error)
         self.recording_thread.status.connect(self.on_recording_status)
+        self.recording_thread.partial.connect(self.on_recording_partial)
         self.recording_thread.start()
 
     def on_recording_finished(self, text):
@@ -260,25 +511,60 @@ class TelemedicineApp(QMainWindow):
     def on_recording_status(self, status):
         self.recording_label.setText(status)
 
+    def on_recording_partial(self, text):
+        self.recording_label.setText(f"Heard: {text}")
+
     def analyze_symptoms(self):
         symptoms = self.symptom_input.toPlainText()
         if symptoms:
             self.progress_bar.setVisible(True)
             self.progress_bar.setValue(0)
-            self.analyze_btn.setEnabled(False)
-            
-            self.analysis_thread = AnalysisThread(symptoms, self.analyzer)
-            self.analysis_thread.progress.connect(self.update_progress)
-            self.analysis_thread.finished.connect(self.on_analysis_finished)
-            self.analysis_thread.start()
 
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
-
-    def on_analysis_finished(self, results):
+            # A newer request supersedes whatever is still running
+            if self.analysis_task is not None:
+                self.analysis_task.cancelled.set()
+            self.analysis_request_id += 1
+            self.analysis_task = AnalysisTask(
+                self.analysis_request_id, symptoms, self.analyzer, self.analysis_signals
+            )
+            self.analysis_pool.start(self.analysis_task)
+
+    def update_progress(self, request_id, value):
+        if request_id == self.analysis_request_id:
+            self.progress_bar.setValue(value)
+
+    def on_analysis_finished(self, request_id, results):
+        if request_id != self.analysis_request_id:
+            return
+        self.analysis_task = None
         self.progress_bar.setVisible(False)
-        self.analyze_btn.setEnabled(True)
-        
+        self.show_analysis_results(results)
+
+    def on_symptoms_edited(self, position, chars_removed, chars_added):
+        document = self.symptom_input.document()
+        cursor = QTextCursor(document)
+        cursor.setPosition(position)
+        cursor.setPosition(min(position + chars_added, document.characterCount() - 1),
+                           QTextCursor.MoveMode.KeepAnchor)
+        # Match toPlainText(), which the Analyze button uses
+        inserted = cursor.selectedText().replace('\u2029', '\n').replace('\u2028', '\n').replace('\xa0', ' ')
+        self.live_analysis.apply_edit(position, chars_removed, inserted)
+
+        # Qt positions count UTF-16 units, so astral characters (emoji) can
+        # desynchronise the offsets; resync from the full text when they do
+        if len(self.live_analysis.text) != document.characterCount() - 1:
+            self.live_analysis.set_text(self.symptom_input.toPlainText())
+
+        if self.live_checkbox.isChecked():
+            self.live_timer.start()
+
+    def show_live_results(self):
+        if not self.live_analysis.text.strip():
+            self.results_label.setText("")
+            return
+        self.show_analysis_results(self.live_analysis.result())
+
+    def show_analysis_results(self, results):
         if "error" in results:
             self.results_label.setText(f"<span style='color: red;'>Error: {results['error']}</span>")
         else:
@@ -303,62 +589,46 @@ class TelemedicineApp(QMainWindow):
 
         # Clear previous results
         self.clear_doctor_results()
+        self.doctor_status_label.setText("Searching...")
 
-        # Search for doctors
-        doctors = self.doctor_search.search_nearby_doctors(location, specialization, radius)
-        
+        # Search for doctors; a newer search makes older results stale
+        self.search_request_id += 1
+        self.search_pool.start(DoctorSearchTask(
+            self.search_request_id, self.get_doctor_search, location, specialization, radius, self.search_signals
+        ))
+
+    def on_doctor_search_finished(self, request_id, doctors):
+        if request_id != self.search_request_id:
+            return
         if not doctors:
             self.show_doctor_results("No doctors found in your area")
             return
+        self.doctor_status_label.setText(f"{len(doctors)} doctors found")
+        self.doctor_model.set_doctors(doctors)
 
-        # Display results
-        for doctor in doctors:
-            doctor_card = QFrame()
-            doctor_card.setFrameStyle(QFrame.Shape.StyledPanel)
-            doctor_card.setStyleSheet("""
-                QFrame {
-                    background-color: #f5f5f5;
-                    border-radius: 5px;
-                    margin: 5px;
-                }
-            """)
-            
-            card_layout = QVBoxLayout(doctor_card)
-            
-            # Doctor name and rating
-            name_layout = QHBoxLayout()
-            name_label = QLabel(f"<b>{doctor.name}</b>")
-            rating_label = QLabel(f"⭐ {doctor.rating:.1f}")
-            name_layout.addWidget(name_label)
-            name_layout.addWidget(rating_label)
-            card_layout.addLayout(name_layout)
-            
-            # Specialization
-            card_layout.addWidget(QLabel(f"<i>{doctor.specialization}</i>"))
-            
-            # Address and distance
-            card_layout.addWidget(QLabel(f"📍 {doctor.address}"))
-            card_layout.addWidget(QLabel(f"Distance: {doctor.distance:.1f} km"))
-            
-            # Phone
-            card_layout.addWidget(QLabel(f"📞 {doctor.phone}"))
-            
-            self.doctor_results_layout.addWidget(doctor_card)
+    def on_doctor_search_failed(self, request_id, message):
+        if request_id != self.search_request_id:
+            return
+        self.show_doctor_results(f"Error searching for doctors: {message}")
 
     def clear_doctor_results(self):
-        while self.doctor_results_layout.count():
-            item = self.doctor_results_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
+        self.doctor_model.set_doctors([])
+        self.doctor_status_label.setText("")
 
     def show_doctor_results(self, message):
         self.clear_doctor_results()
-        label = QLabel(message)
-        label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.doctor_results_layout.addWidget(label)
+        self.doctor_status_label.setText(message)
 
 if __name__ == '__main__':
+    logging.basicConfig(level=os.environ.get('TELEMED_LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    startup_report = StartupReport(
+        '--startup-report' in sys.argv or os.environ.get('TELEMED_STARTUP_REPORT') == '1'
+    )
     app = QApplication(sys.argv)
-    window = TelemedicineApp()
+    startup_report.mark("application")
+    window = TelemedicineApp(startup_report)
+    startup_report.mark("window")
     window.show()
     sys.exit(app.exec()) 
\ No newline at end of file
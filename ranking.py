@@ -0,0 +1,357 @@
+import base64
+import copy
+import hashlib
+import heapq
+import json
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from doctor_providers import doctor_key
+from doctor_store import Doctor, DoctorStore
+from spatial_index import (HAVERSINE_RELATIVE_ERROR, KM_PER_DEGREE_LATITUDE, MAX_DISTANCE_KM, SpatialIndex,
+                           haversine_km)
+
+SORT_ORDERS = ("distance", "rating")
+DEFAULT_PAGE_SIZE = 20
+# Rows of the rating order examined per step when walking it
+WALK_CHUNK = 1024
+# Distances in sort keys are rounded to a millimetre, so the same doctor gets
+# the same key on every page however the vectorized maths rounded its last bit
+KEY_DECIMALS = 6
+
+# (distance, tiebreak) for sort_by="distance", (-rating, distance, tiebreak)
+# for sort_by="rating". The tiebreak is the doctor's id, or its identity
+# when it has none, so keys stay valid when a directory renumbers its rows.
+Key = Tuple
+
+RatingFilter = Optional[float]
+
+
+@dataclass
+class Page:
+    doctors: List[Doctor]
+    # Pass back as ``cursor`` for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
+def check_query(sort_by: str, limit: int) -> None:
+    if sort_by not in SORT_ORDERS:
+        raise ValueError(f"sort_by must be one of {', '.join(SORT_ORDERS)}, not {sort_by!r}")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+
+
+def query_fingerprint(*parts) -> str:
+    """
+    Short digest of the parameters a cursor is only valid for
+    """
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(query: str, key: Key) -> str:
+    payload = json.dumps({"q": query, "k": list(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, query: str) -> Key:
+    """
+    The sort key a cursor continues after. Raises ValueError for cursors
+    that are malformed or were issued for a different query.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        fingerprint, key = payload["q"], tuple(payload["k"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if fingerprint != query:
+        raise ValueError("Cursor was issued for a different query")
+    return key
+
+
+def top_k(keys: Sequence[np.ndarray], k: int) -> np.ndarray:
+    """
+    Positions of the k smallest entries under the lexicographic order of
+    keys, most significant key first, in that order.
+
+    One partition pass finds the k-th value of the leading key; only the
+    entries tied with it are ranked again on the remaining keys, so apart
+    from that linear pass the work is proportional to k, not to the number
+    of entries.
+    """
+    primary = keys[0]
+    if len(primary) <= k:
+        return np.lexsort(tuple(reversed(keys)))
+    kth = np.partition(primary, k - 1)[k - 1]
+    below = np.flatnonzero(primary < kth)
+    below = below[np.lexsort(tuple(key[below] for key in reversed(keys)))]
+    tied = np.flatnonzero(primary == kth)
+    wanted = k - len(below)
+    if len(keys) > 1:
+        tied = tied[top_k([key[tied] for key in keys[1:]], wanted)]
+    else:
+        tied = tied[:wanted]
+    return np.concatenate((below, tied))
+
+
+def doctor_tiebreak(doctor: Doctor) -> str:
+    return doctor.doctor_id if doctor.doctor_id is not None else "|".join(doctor_key(doctor))
+
+
+def doctor_sort_key(doctor: Doctor, sort_by: str) -> Key:
+    tiebreak = doctor_tiebreak(doctor)
+    # Rounded like RankedIndex rounds its distance columns
+    distance = float(np.round(doctor.distance, KEY_DECIMALS))
+    if sort_by == "rating":
+        return -doctor.rating, distance, tiebreak
+    return distance, tiebreak
+
+
+def page_doctors(doctors: Iterable[Doctor], query: str, sort_by: str = "distance",
+                 min_rating: RatingFilter = None, limit: int = DEFAULT_PAGE_SIZE,
+                 after: Optional[Key] = None) -> Page:
+    """
+    One page of already-fetched doctors, which must have distances set.
+    Keeps a bounded heap of limit + 1 entries instead of sorting them all.
+    """
+    check_query(sort_by, limit)
+    candidates = (
+        (doctor_sort_key(doctor, sort_by), doctor) for doctor in doctors
+        if min_rating is None or doctor.rating >= min_rating
+    )
+    if after is not None:
+        candidates = (candidate for candidate in candidates if candidate[0] > after)
+    best = heapq.nsmallest(limit + 1, candidates, key=lambda candidate: candidate[0])
+    next_cursor = encode_cursor(query, best[limit - 1][0]) if len(best) > limit else None
+    return Page([doctor for _, doctor in best[:limit]], next_cursor)
+
+
+class RankedIndex:
+    """
+    Ranked and paginated queries over a DoctorStore: nearest first, or best
+    rated first with distance breaking ties, optionally restricted to a
+    radius and a minimum rating.
+
+    Next to the spatial index, every specialization keeps its rows sorted
+    by rating, best first. A minimum rating is then a prefix of that order,
+    and a best-rated query over a wide area walks it until a page is full
+    instead of measuring every doctor in range. Whichever of the rating
+    prefix and the grid cells holds fewer candidates is measured, and only
+    the requested page is selected and materialized.
+
+    Pages continue from an opaque cursor holding the sort key of the last
+    doctor returned, so later pages cost the same as the first.
+    """
+
+    def __init__(self, store: DoctorStore, index: SpatialIndex, order: Optional[np.ndarray] = None):
+        self.store = store
+        self.index = index
+        codes = store.specialization_codes
+        # lexsort is stable, so equal ratings stay in row order. Like
+        # SpatialIndex.order, this is saved with a directory snapshot.
+        self.order = np.lexsort((-store.ratings, codes)) if order is None else order
+        boundaries = np.flatnonzero(np.diff(codes[self.order])) + 1
+        self._by_rating: Dict[int, np.ndarray] = {}
+        # Negated ratings along each order, ascending for searchsorted
+        self._negated: Dict[int, np.ndarray] = {}
+        for rows in np.split(self.order, boundaries):
+            # Retired rows have code -1
+            if len(rows) and codes[rows[0]] >= 0:
+                code = int(codes[rows[0]])
+                self._by_rating[code] = rows
+                self._negated[code] = -store.ratings[rows]
+
+    def updated(self, store: DoctorStore, index: SpatialIndex, removed: np.ndarray,
+                added: np.ndarray) -> "RankedIndex":
+        """
+        A new index over a store extended from this one's, given the rows it
+        retired and the ascending rows it appended. Only the specializations
+        they touch are merged, without a sort; the others are shared.
+        """
+        ranked = copy.copy(self)
+        ranked.store, ranked.index, ranked.order = store, index, None
+        ranked._by_rating, ranked._negated = dict(self._by_rating), dict(self._negated)
+        removed_codes = self.store.specialization_codes[removed]
+        added_codes = store.specialization_codes[added]
+        for code in set(removed_codes.tolist()) | set(added_codes.tolist()):
+            rows = self._by_rating.get(code, np.empty(0, dtype=np.int64))
+            gone = removed[removed_codes == code]
+            if len(gone):
+                rows = rows[~np.isin(rows, gone)]
+            fresh = added[added_codes == code]
+            if len(fresh):
+                fresh = fresh[np.argsort(-store.ratings[fresh], kind="stable")]
+                # Appended rows come after every existing row, so after
+                # the existing rows rated the same
+                positions = np.searchsorted(-store.ratings[rows], -store.ratings[fresh], side="right")
+                rows = np.insert(rows, positions, fresh)
+            if len(rows):
+                ranked._by_rating[code] = rows
+                ranked._negated[code] = -store.ratings[rows]
+            else:
+                ranked._by_rating.pop(code, None)
+                ranked._negated.pop(code, None)
+        return ranked
+
+    def rated_rows(self, partition: int, min_rating: RatingFilter = None) -> np.ndarray:
+        """
+        Rows of a specialization rated at least min_rating, best first
+        """
+        rows = self._by_rating.get(partition)
+        if rows is None:
+            return np.empty(0, dtype=np.int64)
+        if min_rating is None:
+            return rows
+        return rows[:np.searchsorted(self._negated[partition], -min_rating, side="right")]
+
+    def tiebreak(self, row: int) -> str:
+        """
+        The last sort key of a row, the same doctor_sort_key gives its Doctor
+        """
+        store = self.store
+        if store.doctor_ids is not None and store.doctor_ids[row] >= 0:
+            return store.strings[store.doctor_ids[row]]
+        return doctor_tiebreak(store.doctor(row))
+
+    def _after(self, keys: Sequence[np.ndarray], key: Key) -> np.ndarray:
+        """
+        Mask of the entries whose keys sort strictly after ``key``. The last
+        column holds rows; their tiebreaks are only looked up for entries
+        tied with ``key`` on every other column.
+        """
+        *columns, rows = keys
+        greater = np.zeros(len(rows), dtype=bool)
+        equal = np.ones(len(rows), dtype=bool)
+        for column, value in zip(columns, key):
+            greater |= equal & (column > value)
+            equal &= column == value
+        tied = np.flatnonzero(equal)
+        if len(tied):
+            greater[tied] = [self.tiebreak(row) > key[-1] for row in rows[tied].tolist()]
+        return greater
+
+    def _select(self, keys: Sequence[np.ndarray], k: int) -> np.ndarray:
+        """
+        Positions of the first k entries in key order, with ties on every
+        column but the rows broken by tiebreak instead of row number
+        """
+        chosen = top_k(keys, k)
+        if not len(chosen):
+            return chosen
+        *columns, rows = keys
+        last = chosen[-1]
+        boundary = np.ones(len(rows), dtype=bool)
+        for column in columns:
+            boundary &= column == column[last]
+        # Entries tied with the last one chosen may come before it by
+        # tiebreak; only the chosen few and those are ordered in Python
+        candidates = np.union1d(chosen, np.flatnonzero(boundary)).tolist()
+        candidates.sort(key=lambda position: tuple(column[position] for column in columns)
+                        + (self.tiebreak(int(rows[position])),))
+        return np.array(candidates[:k], dtype=np.int64)
+
+    def _measure(self, lat: float, lon: float, radius_km: float, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The given rows within radius_km and their haversine distances.
+        Membership is exact, but unlike SpatialIndex.within no distance is
+        replaced by the geodesic near the edge of the circle, so a doctor's
+        key is the same whatever radius a page happened to search.
+        """
+        _, rows = self.index.within(lat, lon, radius_km, rows)
+        return haversine_km(lat, lon, self.index.latitudes[rows], self.index.longitudes[rows]), rows
+
+    def _keys(self, sort_by: str, distances: np.ndarray, rows: np.ndarray) -> List[np.ndarray]:
+        distances = np.round(distances, KEY_DECIMALS)
+        if sort_by == "rating":
+            return [-self.store.ratings[rows], distances, rows]
+        return [distances, rows]
+
+    def _walk(self, lat: float, lon: float, radius_km: float, partition: int, rated: np.ndarray,
+              wanted: int, after: Optional[Key]) -> List[np.ndarray]:
+        negated = self._negated[partition]
+        start = 0 if after is None else int(np.searchsorted(negated, after[0], side="left"))
+        parts: List[List[np.ndarray]] = []
+        found = 0
+        while start < len(rated) and found < wanted:
+            # Finish the rating tier the chunk ends in, so doctors rated the
+            # same are all measured before any of them is ranked
+            end = min(len(rated), start + WALK_CHUNK)
+            end = int(np.searchsorted(negated, negated[end - 1], side="right"))
+            keys = self._keys("rating", *self._measure(lat, lon, radius_km, rated[start:end]))
+            if after is not None:
+                keys = [key[self._after(keys, after)] for key in keys]
+            parts.append(keys)
+            found += len(keys[0])
+            start = end
+        if not parts:
+            return [np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)]
+        return [np.concatenate(column) for column in zip(*parts)]
+
+    def query(self, lat: float, lon: float, partition: int, sort_by: str = "distance",
+              radius_km: float = MAX_DISTANCE_KM, min_rating: RatingFilter = None,
+              limit: int = DEFAULT_PAGE_SIZE, after: Optional[Key] = None) -> List[np.ndarray]:
+        """
+        Sort-key columns of the first ``limit`` matches after ``after``, in
+        order: (distances, rows) for sort_by="distance" and (-ratings,
+        distances, rows) for sort_by="rating". Distances are haversine km,
+        even at the edge of the radius, so a doctor's key does not depend on
+        how far a page searched. Rows stand in for the tiebreak, which is
+        looked up only when needed.
+        """
+        check_query(sort_by, limit)
+        rated = self.rated_rows(partition, min_rating)
+        if sort_by == "rating":
+            blocks = self.index.candidate_blocks(lat, lon, radius_km, partition)
+            # Doctors in range turn up in the rating order at about the rate
+            # the bounding cells hold them in the whole specialization
+            in_cells = sum(len(block) for block in blocks)
+            if limit * self.index.partition_size(partition) < in_cells * in_cells:
+                keys = self._walk(lat, lon, radius_km, partition, rated, limit, after)
+                return [key[self._select(keys, limit)] for key in keys]
+            search_km = radius_km
+        else:
+            # Nearest first needs no more than the smallest circle holding a
+            # page, grown from the cursor's distance as query_nearest grows
+            start_km = self.index.cell_size_deg * KM_PER_DEGREE_LATITUDE
+            search_km = min(radius_km, max(start_km, 2 * after[0] if after is not None else 0.0))
+            blocks = self.index.candidate_blocks(lat, lon, search_km, partition)
+        while True:
+            if len(rated) <= sum(len(block) for block in blocks):
+                # The rating prefix is the smaller candidate set at any
+                # radius from here on, so measure it once at the full one
+                search_km = radius_km
+                rows = rated
+            else:
+                rows = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+                if min_rating is not None:
+                    rows = rows[self.store.ratings[rows] >= min_rating]
+            keys = self._keys(sort_by, *self._measure(lat, lon, search_km, rows))
+            if after is not None:
+                keys = [key[self._after(keys, after)] for key in keys]
+            if search_km >= radius_km:
+                return [key[self._select(keys, limit)] for key in keys]
+            # A doctor just outside the circle may still have a smaller
+            # haversine distance than one inside; only keys below this
+            # bound are known to have nothing missing before them
+            complete = search_km / (1 + HAVERSINE_RELATIVE_ERROR)
+            if np.count_nonzero(keys[0] <= complete) >= limit:
+                return [key[self._select(keys, limit)] for key in keys]
+            search_km = min(radius_km, search_km * 2)
+            blocks = self.index.candidate_blocks(lat, lon, search_km, partition)
+
+    def page(self, lat: float, lon: float, partition: int, sort_by: str = "distance",
+             radius_km: float = MAX_DISTANCE_KM, min_rating: RatingFilter = None,
+             limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Page:
+        # By name, as compaction may renumber specializations along with rows
+        specialization = self.store.specializations[partition].lower()
+        query = query_fingerprint(lat, lon, specialization, sort_by, radius_km, min_rating)
+        after = decode_cursor(cursor, query) if cursor else None
+        keys = self.query(lat, lon, partition, sort_by, radius_km, min_rating, limit + 1, after)
+        rows, distances = keys[-1][:limit], keys[-2][:limit]
+        next_cursor = None
+        if len(keys[-1]) > limit:
+            last = limit - 1
+            key = tuple(column[last].item() for column in keys[:-1]) + (self.tiebreak(int(keys[-1][last])),)
+            next_cursor = encode_cursor(query, key)
+        return Page(self.store.materialize(rows.tolist(), distances.tolist()), next_cursor)
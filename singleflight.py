@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import metrics
+
+SHARED_CALLS = metrics.counter(
+    "telemed_singleflight_shared_total", "Calls answered by joining an identical call already in flight"
+)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key across threads.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for it and receive the same result, or the same exception.
+    Nothing is remembered once the call finishes, so errors are never
+    cached and the next caller starts a fresh call.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: Hashable, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, bool]:
+        """
+        Return (result, shared), where shared tells whether the result came
+        from another caller's call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            SHARED_CALLS.inc(name=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent coroutine calls with the same key on one event loop.
+
+    The first caller's coroutine runs as a task that every caller, the
+    first included, awaits through a shield: a caller that is cancelled
+    stops waiting without cancelling the work the others are waiting for.
+    Results and exceptions go to all callers and are not kept afterwards.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Return (result, shared). factory returns a coroutine or future and is
+        only called when no identical call is in flight
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        task = self._tasks.get(task_key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+            SHARED_CALLS.inc(name=self.name)
+        else:
+            task = asyncio.ensure_future(factory())
+            self._tasks[task_key] = task
+
+            def forget(done: asyncio.Future) -> None:
+                del self._tasks[task_key]
+                # Callers get the exception through their shields; this only
+                # silences the warning when every caller has gone away
+                if not done.cancelled():
+                    done.exception()
+
+            task.add_done_callback(forget)
+        return await asyncio.shield(task), shared
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
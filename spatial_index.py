@@ -0,0 +1,297 @@
+import copy
+import math
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from geopy.distance import geodesic
+
+# Just under the smallest WGS84 radius of curvature (6335.44 km). Geodesics
+# on the ellipsoid are never shorter than on a sphere of this radius, so a
+# bounding box computed on that sphere contains every point within range.
+BOUNDING_SPHERE_RADIUS_KM = 6335.0
+KM_PER_DEGREE_LATITUDE = math.radians(BOUNDING_SPHERE_RADIUS_KM)
+# Longest possible geodesic on the ellipsoid (half a meridian), in km
+MAX_DISTANCE_KM = 20004.0
+# IUGG mean Earth radius used by the haversine fast path
+MEAN_EARTH_RADIUS_KM = 6371.0088
+# Bound on |haversine - geodesic| / haversine over WGS84. The ellipsoid's
+# radii of curvature stay within -0.56%/+0.45% of the mean radius.
+HAVERSINE_RELATIVE_ERROR = 0.0065
+
+Hit = Tuple[float, int]
+
+
+def geodesic_km(lat: float, lon: float, other_lat: float, other_lon: float) -> float:
+    return geodesic((lat, lon), (other_lat, other_lon)).kilometers
+
+
+def haversine_km(lat: float, lon: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in km from one point to arrays of points
+    """
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class SpatialIndex:
+    """
+    Uniform latitude/longitude grid over a set of points, partitioned by an
+    arbitrary key (the doctor's specialization, for example).
+
+    Radius queries visit only the cells overlapping a conservative bounding
+    box around the query point and compute the exact distance for the points
+    in them, so results are identical to a brute-force scan over all points.
+    Hits are (distance_km, row) pairs in ascending order, with ties broken by
+    row number as a stable sort over the input order would.
+
+    Candidate distances are computed in one vectorized haversine call. Only
+    candidates whose haversine distance is within HAVERSINE_RELATIVE_ERROR
+    of the radius, where the spherical error could flip the decision, are
+    re-measured with the exact geodesic. The set of hits is always exact;
+    distances of the other hits are haversine values within 0.65% of the
+    geodesic. Pass exact=True to measure every hit with the geodesic.
+    """
+
+    def __init__(self, latitudes: Sequence[float], longitudes: Sequence[float],
+                 partitions: Optional[Sequence[Hashable]] = None, cell_size_deg: float = 0.1,
+                 distance: Callable[[float, float, float, float], float] = geodesic_km,
+                 order: Optional[np.ndarray] = None):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        if partitions is None:
+            partitions = [None] * len(self.latitudes)
+        self.partitions = list(partitions)
+        self.cell_size_deg = cell_size_deg
+        self.distance = distance
+        self._lon_cells = int(math.ceil(360.0 / cell_size_deg))
+
+        rows = np.arange(len(self.latitudes), dtype=np.int64)
+        # Rows grouped by partition and cell; saved with a directory snapshot
+        # and passed back as ``order`` to skip the sort when loading it
+        self.order = self.grouping(rows, self.partitions) if order is None else order
+        self._cells: Dict[Hashable, Dict[Tuple[int, int], np.ndarray]] = self._group(
+            rows, self.partitions, self.order
+        )
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        lat_cell = int(math.floor((lat + 90.0) / self.cell_size_deg))
+        # Longitudes are wrapped into [-180, 180) before the cell is taken:
+        # unless cell_size_deg divides 360 the last cell is narrower, and
+        # wrapping cell numbers instead would misalign cells across the
+        # antimeridian
+        lon_cell = min(int(math.floor(((lon + 180.0) % 360.0) / self.cell_size_deg)), self._lon_cells - 1)
+        return lat_cell, lon_cell
+
+    def _cells_of(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Same arithmetic as _cell, so both agree on every boundary
+        lat_cells = np.floor((self.latitudes[rows] + 90.0) / self.cell_size_deg).astype(np.int64)
+        lon_cells = np.minimum(
+            np.floor(np.mod(self.longitudes[rows] + 180.0, 360.0) / self.cell_size_deg).astype(np.int64),
+            self._lon_cells - 1
+        )
+        return lat_cells, lon_cells
+
+    @staticmethod
+    def _partition_ids(keys: Sequence[Hashable]) -> Tuple[np.ndarray, List[Hashable]]:
+        ids: Dict[Hashable, int] = {}
+        partition_ids = np.array([ids.setdefault(key, len(ids)) for key in keys], dtype=np.int64)
+        return partition_ids, list(ids)
+
+    def grouping(self, rows: np.ndarray, keys: Sequence[Hashable]) -> np.ndarray:
+        """
+        Positions into rows that bring rows of the same partition and cell
+        together, each group in row order
+        """
+        partition_ids, _ = self._partition_ids(keys)
+        lat_cells, lon_cells = self._cells_of(rows)
+        # lexsort is stable, so rows stay in ascending order within a cell
+        return np.lexsort((lon_cells, lat_cells, partition_ids))
+
+    def _group(self, rows: np.ndarray, keys: Sequence[Hashable],
+               order: np.ndarray) -> Dict[Hashable, Dict[Tuple[int, int], np.ndarray]]:
+        cells: Dict[Hashable, Dict[Tuple[int, int], np.ndarray]] = {}
+        if not len(rows):
+            return cells
+        partition_ids, labels = self._partition_ids(keys)
+        lat_cells, lon_cells = self._cells_of(rows)
+        partition_ids, lat_cells, lon_cells = partition_ids[order], lat_cells[order], lon_cells[order]
+        grouped = rows[order]
+        changes = np.flatnonzero(
+            (partition_ids[1:] != partition_ids[:-1]) | (lat_cells[1:] != lat_cells[:-1]) |
+            (lon_cells[1:] != lon_cells[:-1])
+        ) + 1
+        starts = np.concatenate(([0], changes))
+        ends = np.concatenate((changes, [len(grouped)]))
+        for start, end, partition_id, lat_cell, lon_cell in zip(
+            starts.tolist(), ends.tolist(), partition_ids[starts].tolist(),
+            lat_cells[starts].tolist(), lon_cells[starts].tolist()
+        ):
+            cells.setdefault(labels[partition_id], {})[(lat_cell, lon_cell)] = grouped[start:end]
+        return cells
+
+    def updated(self, latitudes: np.ndarray, longitudes: np.ndarray, partitions: Sequence[Hashable],
+                removed: np.ndarray, added: np.ndarray) -> "SpatialIndex":
+        """
+        A new index over updated columns, without the removed rows and with
+        the added ones. Removed rows keep their old coordinates and
+        partitions in this index; cells neither touches are shared.
+        This index is left unchanged and stays valid for its own columns.
+        """
+        index = copy.copy(self)
+        index.latitudes = np.asarray(latitudes, dtype=np.float64)
+        index.longitudes = np.asarray(longitudes, dtype=np.float64)
+        index.partitions = list(partitions)
+        index.order = None
+        cells = {key: dict(grid) for key, grid in self._cells.items()}
+
+        removed = np.asarray(removed, dtype=np.int64)
+        if len(removed):
+            old_keys = [self.partitions[row] for row in removed.tolist()]
+            for key, grid in self._group(removed, old_keys, self.grouping(removed, old_keys)).items():
+                for cell, rows in grid.items():
+                    remaining = cells[key][cell]
+                    remaining = remaining[~np.isin(remaining, rows)]
+                    if len(remaining):
+                        cells[key][cell] = remaining
+                    else:
+                        del cells[key][cell]
+        added = np.asarray(added, dtype=np.int64)
+        if len(added):
+            new_keys = [index.partitions[row] for row in added.tolist()]
+            for key, grid in index._group(added, new_keys, index.grouping(added, new_keys)).items():
+                partition = cells.setdefault(key, {})
+                for cell, rows in grid.items():
+                    existing = partition.get(cell)
+                    partition[cell] = rows if existing is None else np.sort(np.concatenate((existing, rows)))
+        index._cells = {key: grid for key, grid in cells.items() if grid}
+        return index
+
+    def partition_size(self, partition: Hashable = None) -> int:
+        return sum(len(rows) for rows in self._cells.get(partition, {}).values())
+
+    def candidate_blocks(self, lat: float, lon: float, radius_km: float,
+                         partition: Hashable = None) -> List[np.ndarray]:
+        """
+        Row arrays of the cells overlapping the bounding box of a radius
+        query, a superset of the hits. Their total length tells what a
+        query_radius would cost before paying for it.
+        """
+        grid = self._cells.get(partition)
+        if not grid:
+            return []
+
+        angle = radius_km / BOUNDING_SPHERE_RADIUS_KM
+        lat_low = max(-90.0, lat - math.degrees(angle))
+        lat_high = min(90.0, lat + math.degrees(angle))
+        lat_range = range(self._cell(lat_low, 0.0)[0], self._cell(lat_high, 0.0)[0] + 1)
+
+        if lat_low <= -90.0 or lat_high >= 90.0:
+            # The circle contains a pole, so it spans every longitude
+            lon_range = range(self._lon_cells)
+        else:
+            # Longitude of the meridians tangent to the circle
+            lon_delta = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+            if lon_delta >= 180.0:
+                lon_range = range(self._lon_cells)
+            else:
+                west = (lon - lon_delta + 180.0) % 360.0 - 180.0
+                east = west + 2 * lon_delta
+                first = self._cell(0.0, west)[1]
+                if east < 180.0:
+                    lon_range = range(first, self._cell(0.0, east)[1] + 1)
+                else:
+                    # Across the antimeridian: up to the last cell, then on
+                    # from the first
+                    lon_range = list(dict.fromkeys(
+                        list(range(first, self._lon_cells)) + list(range(self._cell(0.0, east - 360.0)[1] + 1))
+                    ))
+
+        # A huge box over a sparse partition is cheaper to filter cell by cell
+        if len(lat_range) * len(lon_range) > len(grid):
+            lon_cells = set(lon_range)
+            blocks = [
+                rows for (lat_cell, lon_cell), rows in grid.items()
+                if lat_cell in lat_range and lon_cell in lon_cells
+            ]
+        else:
+            blocks = [
+                grid[(lat_cell, lon_cell)]
+                for lat_cell in lat_range for lon_cell in lon_range
+                if (lat_cell, lon_cell) in grid
+            ]
+        return blocks
+
+    def _candidates(self, lat: float, lon: float, radius_km: float, partition: Hashable) -> np.ndarray:
+        blocks = self.candidate_blocks(lat, lon, radius_km, partition)
+        if not blocks:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(blocks)
+
+    def within(self, lat: float, lon: float, radius_km: float, rows: np.ndarray,
+               exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The given rows that lie within radius_km of (lat, lon) and their
+        distances, as unsorted (distances, rows) arrays. Membership is exact;
+        see the class docstring for the distances.
+        """
+        distances = haversine_km(lat, lon, self.latitudes[rows], self.longitudes[rows])
+        inside = distances * (1 + HAVERSINE_RELATIVE_ERROR) <= radius_km
+        boundary = ~inside & (distances * (1 - HAVERSINE_RELATIVE_ERROR) <= radius_km)
+        if exact:
+            boundary |= inside
+            inside[:] = False
+        if not boundary.any():
+            return distances[inside], rows[inside]
+
+        boundary_rows = rows[boundary]
+        boundary_distances = np.array([
+            self.distance(lat, lon, self.latitudes[row], self.longitudes[row]) for row in boundary_rows.tolist()
+        ], dtype=np.float64)
+        kept = boundary_distances <= radius_km
+        return (
+            np.concatenate((distances[inside], boundary_distances[kept])),
+            np.concatenate((rows[inside], boundary_rows[kept]))
+        )
+
+    def _refine(self, lat: float, lon: float, radius_km: float, rows: np.ndarray,
+                exact: bool = False) -> List[Hit]:
+        distances, rows = self.within(lat, lon, radius_km, rows, exact)
+        hits = list(zip(distances.tolist(), rows.tolist()))
+        hits.sort()
+        return hits
+
+    def query_radius(self, lat: float, lon: float, radius_km: float,
+                     partition: Hashable = None, exact: bool = False) -> List[Hit]:
+        """
+        All points of a partition within radius_km of (lat, lon), nearest first
+        """
+        rows = self._candidates(lat, lon, radius_km, partition)
+        return self._refine(lat, lon, radius_km, rows, exact)
+
+    def query_nearest(self, lat: float, lon: float, k: int, partition: Hashable = None,
+                      max_radius_km: float = MAX_DISTANCE_KM, exact: bool = False) -> List[Hit]:
+        """
+        The k points of a partition nearest to (lat, lon), optionally limited
+        to max_radius_km. The search radius doubles until k points are found.
+        """
+        if k <= 0 or partition not in self._cells:
+            return []
+        radius_km = min(max_radius_km, self.cell_size_deg * KM_PER_DEGREE_LATITUDE)
+        while True:
+            hits = self.query_radius(lat, lon, radius_km, partition, exact)
+            if len(hits) >= k or radius_km >= max_radius_km:
+                return hits[:k]
+            radius_km = min(max_radius_km, radius_km * 2)
+
+    def brute_force_radius(self, lat: float, lon: float, radius_km: float,
+                           partition: Hashable = None) -> List[Hit]:
+        """
+        Reference linear scan, for verifying the index
+        """
+        rows = np.array([row for row, key in enumerate(self.partitions) if key == partition], dtype=np.int64)
+        return self._refine(lat, lon, radius_km, rows, exact=True)
@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from ai_symptom_analyzer import SymptomAnalyzer
+from benchmarks.generators import StubGeocoder, generate_directory
+from directory import DirectorySnapshot, LiveDirectory
+from doctor_providers import DirectoryProvider
+from doctor_search import AsyncDoctorSearch, CachingGeocoder
+
+NEW_YORK = {"location": "New York", "specialization": "Cardiology", "radius": 25}
+
+
+@pytest.fixture(scope="module")
+def directory():
+    return LiveDirectory(DirectorySnapshot.build(generate_directory(3000, seed=0)))
+
+
+@pytest.fixture
+def client(monkeypatch, directory):
+    # Searches go to a local directory through the offline geocoder
+    monkeypatch.setattr(api, "AsyncDoctorSearch", lambda providers: AsyncDoctorSearch(
+        [DirectoryProvider(directory)], geocoder=CachingGeocoder(StubGeocoder(), cache_path=None)
+    ))
+    with TestClient(api.app) as client:
+        yield client
+
+
+@pytest.fixture
+def thread_pool(client, monkeypatch):
+    """
+    Analyses run on threads of this process, so the worker function can be
+    replaced and observed
+    """
+    monkeypatch.setattr(api, "_worker_analyzer", SymptomAnalyzer())
+    pool = client.app.state.analysis_pool
+    client.app.state.analysis_pool = ThreadPoolExecutor(max_workers=4)
+    yield client.app.state.analysis_pool
+    client.app.state.analysis_pool.shutdown()
+    client.app.state.analysis_pool = pool
+
+
+def test_analyze_symptoms(client):
+    response = client.post("/analyze-symptoms", json={"symptoms": "I have a fever and a cough"})
+    assert response.status_code == 200
+    assert response.json() == SymptomAnalyzer().analyze_symptoms("I have a fever and a cough")
+    assert client.post("/analyze-symptoms", json={}).status_code == 422
+
+
+def test_identical_analyses_share_one_call(client, thread_pool, monkeypatch):
+    calls = []
+
+    def slow_analysis(symptoms, timed=False):
+        calls.append(symptoms)
+        time.sleep(0.3)
+        return api._worker_analyzer.analyze_symptoms(symptoms), None
+
+    monkeypatch.setattr(api, "_analyze_in_worker", slow_analysis)
+    texts = ["Fever and cough", "FEVER AND COUGH", "fever and cough", "Fever and Cough"]
+    with ThreadPoolExecutor(max_workers=len(texts)) as requests:
+        responses = list(requests.map(
+            lambda text: client.post("/analyze-symptoms", json={"symptoms": text}), texts
+        ))
+    assert [response.status_code for response in responses] == [200] * len(texts)
+    assert len({str(response.json()) for response in responses}) == 1
+    assert len(calls) == 1
+
+
+def test_saturated_analysis_pool_is_rejected(client, thread_pool, monkeypatch):
+    release, started = threading.Event(), threading.Event()
+
+    def blocked_analysis(symptoms, timed=False):
+        started.set()
+        release.wait(5)
+        return {"suggestions": []}, None
+
+    monkeypatch.setattr(api, "_analyze_in_worker", blocked_analysis)
+    client.app.state.analysis_limiter = api.AdmissionLimiter("analysis", 1)
+    with ThreadPoolExecutor(max_workers=1) as requests:
+        first = requests.submit(client.post, "/analyze-symptoms", json={"symptoms": "headache"})
+        assert started.wait(5)
+        rejected = client.post("/analyze-symptoms", json={"symptoms": "something else"})
+        release.set()
+        assert first.result().status_code == 200
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert client.get("/health").json()["pending_analyses"] == 0
+
+
+def test_saturated_search_is_rejected(client):
+    client.app.state.search_limiter = api.AdmissionLimiter("search", 0)
+    assert client.post("/search-doctors", json=NEW_YORK).status_code == 503
+    assert client.post("/search-doctors/page", json=NEW_YORK).status_code == 503
+
+
+def test_search_doctors(client, directory):
+    response = client.post("/search-doctors", json=NEW_YORK)
+    assert response.status_code == 200
+    doctors = response.json()
+    snapshot = directory.current
+    code = snapshot.store.specialization_code("Cardiology")
+    expected = snapshot.index.query_radius(40.7128, -74.0060, 25, code)
+    assert [doctor["doctor_id"] for doctor in doctors] == \
+        [snapshot.store.doctor(row).doctor_id for _, row in expected]
+    assert client.post("/search-doctors", json=dict(NEW_YORK, location="Atlantis")).json() == []
+
+
+@pytest.mark.parametrize("sort_by", ["distance", "rating"])
+def test_search_doctors_pages(client, sort_by):
+    everything = client.post("/search-doctors", json=NEW_YORK).json()
+    request = dict(NEW_YORK, sort_by=sort_by, limit=9)
+    seen, cursor = [], None
+    while True:
+        response = client.post("/search-doctors/page", json=dict(request, cursor=cursor))
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["doctors"]) <= 9
+        seen.extend(page["doctors"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(everything) > 9
+    ids = [doctor["doctor_id"] for doctor in seen]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == {doctor["doctor_id"] for doctor in everything}
+
+
+def test_search_doctors_page_errors(client):
+    assert client.post("/search-doctors/page", json=dict(NEW_YORK, cursor="not a cursor")).status_code == 400
+    cursor = client.post("/search-doctors/page", json=dict(NEW_YORK, limit=1)).json()["next_cursor"]
+    other_query = dict(NEW_YORK, sort_by="rating", cursor=cursor)
+    response = client.post("/search-doctors/page", json=other_query)
+    assert response.status_code == 400
+    assert "different query" in response.json()["detail"]
+    assert client.post("/search-doctors/page", json=dict(NEW_YORK, sort_by="price")).status_code == 422
+    assert client.post("/search-doctors/page", json=dict(NEW_YORK, limit=0)).status_code == 422
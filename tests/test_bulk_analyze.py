@@ -0,0 +1,132 @@
+import csv
+import json
+
+import pytest
+
+import bulk_analyze
+from ai_symptom_analyzer import SymptomAnalyzer
+from benchmarks import generators
+
+
+@pytest.fixture(scope="module")
+def kb_path(tmp_path_factory):
+    return generators.write_synthetic_kb(200, str(tmp_path_factory.mktemp("kb")), seed=1)
+
+
+@pytest.fixture(scope="module")
+def texts(kb_path):
+    return generators.generate_patient_texts(SymptomAnalyzer(knowledge_base=kb_path).kb, 230, seed=2)
+
+
+def write_jsonl(path, texts):
+    with open(path, "w", encoding="utf-8") as handle:
+        for number, text in enumerate(texts):
+            handle.write(json.dumps({"message_id": f"m{number}", "symptoms": text}) + "\n")
+            if number == 40:
+                handle.write("{broken\n")
+            if number == 90:
+                handle.write(json.dumps({"message_id": "nothing"}) + "\n")
+    return str(path)
+
+
+def write_csv(path, texts):
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["message_id", "symptoms"])
+        for number, text in enumerate(texts):
+            # Quoted fields spanning lines must not split records
+            writer.writerow([f"m{number}", text.replace(", ", ",\n", 1)])
+    return str(path)
+
+
+def run(input_path, output_path, kb_path, *extra):
+    argv = [input_path, "-o", output_path, "--kb", kb_path, "--id-field", "message_id", "--processes", "2",
+            "--chunk-size", "16", "--progress", "0", "--checkpoint-interval", "0", *extra]
+    assert bulk_analyze.run(bulk_analyze.parse_args(argv)) == 0
+    with open(output_path, "rb") as output:
+        return output.read()
+
+
+def expected_lines(kb_path, records):
+    analyzer = SymptomAnalyzer(knowledge_base=kb_path, cache_size=0)
+    lines = []
+    for index, (record_id, text) in enumerate(records):
+        entry = {"index": index, "id": record_id}
+        # Unreadable records only carry an error, checked separately
+        if text is not None:
+            entry.update(analyzer.analyze_symptoms(text))
+        lines.append(entry)
+    return lines
+
+
+def read_lines(output):
+    return [json.loads(line) for line in output.decode("utf-8").splitlines()]
+
+
+def test_ordered_jsonl_matches_single_analyses(tmp_path, kb_path, texts):
+    output = run(write_jsonl(tmp_path / "in.jsonl", texts), str(tmp_path / "out.jsonl"), kb_path)
+    records = [(f"m{number}", text) for number, text in enumerate(texts)]
+    records.insert(41, (None, None))
+    records.insert(92, (None, None))
+    lines = read_lines(output)
+    assert len(lines) == len(records)
+    for line, expected in zip(lines, expected_lines(kb_path, records)):
+        if expected["id"] is None:
+            assert line["index"] == expected["index"] and line["error"].startswith("Invalid record")
+        else:
+            assert line == expected
+
+
+def test_ordered_csv_matches_single_analyses(tmp_path, kb_path, texts):
+    path = write_csv(tmp_path / "in.csv", texts)
+    output = run(path, str(tmp_path / "out.jsonl"), kb_path)
+    records = [(f"m{number}", text.replace(", ", ",\n", 1)) for number, text in enumerate(texts)]
+    assert read_lines(output) == expected_lines(kb_path, records)
+
+
+def interrupted(monkeypatch, after_records):
+    """
+    Make the next run fail after reading the given number of records, as a
+    killed run would stop
+    """
+    read_jsonl = bulk_analyze.read_jsonl
+
+    def failing_reader(*args):
+        for number, record in enumerate(read_jsonl(*args)):
+            if number == after_records:
+                raise KeyboardInterrupt
+            yield record
+
+    monkeypatch.setattr(bulk_analyze, "read_jsonl", failing_reader)
+
+
+@pytest.mark.parametrize("after_records", [20, 70, 150])
+def test_resume_gives_identical_output(tmp_path, kb_path, texts, monkeypatch, after_records):
+    input_path = write_jsonl(tmp_path / "in.jsonl", texts)
+    complete = run(input_path, str(tmp_path / "complete.jsonl"), kb_path)
+
+    output_path = str(tmp_path / "out.jsonl")
+    with monkeypatch.context() as patch:
+        interrupted(patch, after_records)
+        with pytest.raises(KeyboardInterrupt):
+            run(input_path, output_path, kb_path)
+    with open(output_path, "rb") as output:
+        partial = output.read()
+    # Whatever the interrupted run wrote is a prefix of the full output
+    assert complete.startswith(partial)
+
+    assert run(input_path, output_path, kb_path, "--resume") == complete
+
+
+@pytest.mark.parametrize("after_records", [40, 150])
+def test_unordered_resume_writes_every_record_once(tmp_path, kb_path, texts, monkeypatch, after_records):
+    input_path = write_jsonl(tmp_path / "in.jsonl", texts)
+    complete = run(input_path, str(tmp_path / "complete.jsonl"), kb_path)
+
+    output_path = str(tmp_path / "out.jsonl")
+    with monkeypatch.context() as patch:
+        interrupted(patch, after_records)
+        with pytest.raises(KeyboardInterrupt):
+            run(input_path, output_path, kb_path, "--unordered")
+    resumed = run(input_path, output_path, kb_path, "--unordered", "--resume")
+    assert sorted(resumed.splitlines()) == sorted(complete.splitlines())
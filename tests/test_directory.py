@@ -0,0 +1,237 @@
+import csv
+import json
+import random
+import threading
+from dataclasses import asdict
+
+import pytest
+
+from directory import (DirectorySnapshot, IngestError, LiveDirectory, apply_delta, ingest, load_directory,
+                       save_snapshot)
+
+SPECIALIZATIONS = ["Cardiology", "Pediatrics", "Dermatology"]
+CENTRE = (40.7128, -74.0060)
+
+
+def records(count, seed=0, prefix="d"):
+    rng = random.Random(seed)
+    return [{
+        "id": f"{prefix}{i}",
+        "name": f"Dr. {prefix.upper()} {i}",
+        "specialization": rng.choice(SPECIALIZATIONS),
+        "address": f"{i} Broadway",
+        "phone": f"555-{i:04d}",
+        "rating": rng.choice([3.0, 3.5, 4.0, 4.5, 5.0]),
+        "latitude": CENTRE[0] + rng.uniform(-0.5, 0.5),
+        "longitude": CENTRE[1] + rng.uniform(-0.5, 0.5)
+    } for i in range(count)]
+
+
+def write_jsonl(path, rows):
+    with open(path, "w") as handle:
+        for row in rows:
+            handle.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+    return str(path)
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def doctors(snapshot):
+    store = snapshot.store
+    return {doctor.doctor_id: asdict(doctor) for doctor in store.materialize(store.live_rows.tolist())}
+
+
+def search(snapshot, specialization, radius_km=40.0):
+    store = snapshot.store
+    code = store.specialization_code(specialization)
+    if code is None:
+        return []
+    return [(round(distance, 6), store.doctor(row).doctor_id)
+            for distance, row in snapshot.index.query_radius(*CENTRE, radius_km, code)]
+
+
+def assert_same_directory(snapshot, expected):
+    assert doctors(snapshot) == doctors(expected)
+    for specialization in SPECIALIZATIONS:
+        assert search(snapshot, specialization) == search(expected, specialization)
+        code = snapshot.store.specialization_code(specialization)
+        ranked = snapshot.ranked.page(*CENTRE, code, "rating", 40.0, limit=1000).doctors
+        rebuilt = expected.ranked.page(*CENTRE, expected.store.specialization_code(specialization),
+                                       "rating", 40.0, limit=1000).doctors
+        assert [(doctor.rating, doctor.doctor_id) for doctor in ranked] == \
+            [(doctor.rating, doctor.doctor_id) for doctor in rebuilt]
+
+
+def reference(tmp_path, rows):
+    # The directory as a fresh build of the given records would be
+    store, _ = ingest(write_jsonl(tmp_path / "reference.jsonl", rows))
+    return DirectorySnapshot.build(store)
+
+
+@pytest.fixture
+def base(tmp_path):
+    rows = records(300)
+    store, report = ingest(write_jsonl(tmp_path / "base.jsonl", rows))
+    assert (report.records, report.accepted, report.rejected) == (300, 300, 0)
+    return rows, DirectorySnapshot.build(store)
+
+
+def test_chunked_ingest_matches_single_chunk(tmp_path):
+    rows = records(250)
+    path = write_csv(tmp_path / "directory.csv", rows)
+    whole, _ = ingest(path)
+    chunked, report = ingest(path, chunk_rows=7)
+    assert report.accepted == report.added == 250
+    assert doctors(DirectorySnapshot.build(chunked)) == doctors(DirectorySnapshot.build(whole))
+    assert doctors(DirectorySnapshot.build(whole)) == doctors(reference(tmp_path, rows))
+
+
+def test_invalid_records_are_reported_and_skipped(tmp_path):
+    rows = records(10)
+    bad = [
+        dict(rows[0], id="x1", latitude=91),
+        dict(rows[0], id="x2", rating="great"),
+        dict(rows[0], id="x3", name=""),
+        dict(rows[1]),
+        "{not json",
+        "[1, 2]",
+    ]
+    path = write_jsonl(tmp_path / "directory.jsonl", rows[:5] + bad + rows[5:])
+    store, report = ingest(path, chunk_rows=3)
+    assert (report.records, report.accepted, report.rejected) == (16, 10, 6)
+    assert report.errors[0].startswith("line 6: latitude out of range")
+    assert any("duplicate id 'd1'" in error for error in report.errors)
+    assert any(error.startswith("line 10: invalid JSON") for error in report.errors)
+    assert len(store) == 10
+
+    assert ingest(path, max_errors=6)[1].rejected == 6
+    with pytest.raises(IngestError, match="6 invalid records, more than the 5 allowed"):
+        ingest(path, max_errors=5)
+
+
+def test_delta_add_update_remove(tmp_path, base):
+    rows, snapshot = base
+    before = doctors(snapshot)
+    updated = dict(rows[3], rating=1.0, latitude=CENTRE[0], longitude=CENTRE[1], specialization="Dermatology")
+    added = records(5, seed=9, prefix="n")
+    delta = write_jsonl(tmp_path / "delta.jsonl", [
+        dict(updated, op="update"),
+        {"op": "remove", "id": "d7"},
+        *(dict(row, op="add") for row in added),
+        # Added and removed again: no change at all
+        dict(records(1, prefix="gone")[0], op="add"),
+        {"op": "remove", "id": "gone0"},
+        # Rejected
+        {"op": "remove", "id": "missing"},
+        dict(rows[4], op="add"),
+        {"op": "rename", "id": "d4"},
+    ])
+    next_snapshot, report = apply_delta(snapshot, delta, chunk_rows=2)
+    assert (report.accepted, report.rejected) == (9, 3)
+    assert (report.added, report.updated, report.removed) == (5, 1, 1)
+    assert next_snapshot.version == snapshot.version + 1
+    # The published snapshot is left as it was
+    assert doctors(snapshot) == before
+
+    expected_rows = [updated if row["id"] == "d3" else row for row in rows if row["id"] != "d7"] + added
+    assert_same_directory(next_snapshot, reference(tmp_path, expected_rows))
+    assert next_snapshot.store.row_for_id("gone0") is None
+
+    with pytest.raises(IngestError):
+        apply_delta(snapshot, delta, max_errors=2)
+
+
+def test_later_records_override_earlier_ones(tmp_path, base):
+    rows, snapshot = base
+    delta = write_jsonl(tmp_path / "delta.jsonl", [
+        {"op": "remove", "id": "d1"},
+        dict(rows[1], op="add", rating=2.0),
+        dict(rows[2], op="update", rating=2.5),
+        dict(rows[2], op="update", rating=4.5),
+    ])
+    next_snapshot, report = apply_delta(snapshot, delta)
+    assert (report.added, report.updated, report.removed) == (0, 2, 0)
+    expected_rows = [dict(row, rating={"d1": 2.0, "d2": 4.5}.get(row["id"], row["rating"])) for row in rows]
+    assert_same_directory(next_snapshot, reference(tmp_path, expected_rows))
+
+
+def test_live_directory_compacts(tmp_path, base):
+    rows, snapshot = base
+    live = LiveDirectory(snapshot, compact_ratio=0.1)
+    live.apply_delta(write_jsonl(tmp_path / "small.jsonl", [{"op": "remove", "id": f"d{i}"} for i in range(10)]))
+    assert live.current.retired == 10
+    live.apply_delta(write_jsonl(tmp_path / "large.jsonl", [{"op": "remove", "id": f"d{i}"} for i in range(10, 40)]))
+    assert live.current.retired == 0 and len(live.current.store) == 260
+    assert live.current.version == 3
+    assert_same_directory(live.current, reference(tmp_path, rows[40:]))
+
+
+def test_apply_pending_skips_seen_and_rejected_files(tmp_path, base):
+    rows, snapshot = base
+    deltas = tmp_path / "deltas"
+    deltas.mkdir()
+    write_jsonl(deltas / "001.jsonl", [{"op": "remove", "id": "d0"}])
+    write_jsonl(deltas / "002.jsonl", ["{not json"])
+    write_jsonl(deltas / "003.jsonl.tmp", [{"op": "remove", "id": "d1"}])
+    live = LiveDirectory(snapshot)
+    reports = live.apply_pending(str(deltas))
+    assert [(report.removed, report.rejected) for report in reports] == [(1, 0), (0, 1)]
+    assert live.apply_pending(str(deltas)) == []
+    assert live.current.store.row_for_id("d1") is not None
+
+
+@pytest.mark.parametrize("with_deltas", [False, True])
+def test_snapshot_round_trip(tmp_path, base, with_deltas):
+    rows, snapshot = base
+    if with_deltas:
+        snapshot, _ = apply_delta(snapshot, write_jsonl(tmp_path / "delta.jsonl", [
+            {"op": "remove", "id": "d0"}, dict(records(1, seed=5, prefix="n")[0], op="add")
+        ]))
+        rows = rows[1:] + records(1, seed=5, prefix="n")
+    path = str(tmp_path / "directory.npz")
+    save_snapshot(snapshot, path)
+    loaded = load_directory(path)
+    assert loaded.retired == 0
+    assert_same_directory(loaded, reference(tmp_path, rows))
+    # Loaded orders are used as saved, so they must match fresh ones
+    assert (loaded.index.order == DirectorySnapshot.build(loaded.store).index.order).all()
+    assert (loaded.ranked.order == DirectorySnapshot.build(loaded.store).ranked.order).all()
+
+
+def test_searches_during_publish_see_whole_snapshots(tmp_path, base):
+    rows, snapshot = base
+    live = LiveDirectory(snapshot, compact_ratio=1.0)
+    # Each delta adds one cardiologist at the centre; any snapshot a reader
+    # takes must hold exactly one more per version
+    initial = len(search(snapshot, "Cardiology"))
+    added = [dict(row, specialization="Cardiology", latitude=CENTRE[0], longitude=CENTRE[1])
+             for row in records(40, seed=3, prefix="n")]
+    paths = [write_jsonl(tmp_path / f"{i:03d}.jsonl", [dict(row, op="add")]) for i, row in enumerate(added)]
+    failures, done = [], threading.Event()
+
+    def read():
+        while not done.is_set():
+            current = live.current
+            found = len(search(current, "Cardiology"))
+            if found != initial + current.version:
+                failures.append((current.version, found))
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for path in paths:
+            live.apply_delta(path)
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+    assert failures == []
+    assert live.current.version == 40
+    assert len(search(live.current, "Cardiology")) == initial + 40
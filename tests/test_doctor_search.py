@@ -0,0 +1,31 @@
+import pytest
+
+from benchmarks.generators import StubGeocoder, generate_directory
+from doctor_search import CachingGeocoder, DoctorSearch
+
+
+@pytest.fixture(scope="module")
+def doctor_search():
+    return DoctorSearch(CachingGeocoder(StubGeocoder(), cache_path=None), doctors=generate_directory(3000, seed=0))
+
+
+def ids(results):
+    return [doctor.doctor_id for doctor, _ in results]
+
+
+def test_search_limits(doctor_search):
+    everything = doctor_search.search("New York", "Cardiology", 25)
+    snapshot = doctor_search.directory.current
+    hits = snapshot.index.query_radius(40.7128, -74.0060, 25, snapshot.store.specialization_code("Cardiology"))
+    assert ids(everything) == [snapshot.store.doctor(row).doctor_id for _, row in hits]
+    assert len(everything) > 5
+    assert ids(doctor_search.search("New York", "Cardiology", 25, limit=5)) == ids(everything)[:5]
+    assert ids(doctor_search.search("New York", "Cardiology", 25, limit=10 ** 6)) == ids(everything)
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_search_rejects_limits_below_one(doctor_search, limit):
+    with pytest.raises(ValueError):
+        doctor_search.search("New York", "Cardiology", 25, limit=limit)
+    with pytest.raises(ValueError):
+        DoctorSearch(CachingGeocoder(StubGeocoder(), cache_path=None)).search("New York", "Cardiology", limit=limit)
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+
+import pytest
+
+from benchmarks.generators import StubGeocoder
+from doctor_search import CachingGeocoder, GeocodeStore, TokenBucket, normalize_location
+
+
+class FlakyGeocoder(StubGeocoder):
+    """
+    Fails its first request, then behaves like StubGeocoder
+    """
+
+    def geocode(self, query):
+        if not self.calls:
+            self.calls += 1
+            raise ConnectionError("provider unavailable")
+        return super().geocode(query)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache" / "geocode.sqlite3")
+
+
+def geocoder(backend, cache_path, **kwargs):
+    return CachingGeocoder(backend, cache_path=cache_path, rate=1000, burst=100, **kwargs)
+
+
+def test_normalize_location():
+    assert normalize_location(" New York,NY") == normalize_location("new  york, ny") == "new york, ny"
+    assert normalize_location(" , ") == ""
+
+
+def test_memory_and_store_hits(cache_path):
+    backend = StubGeocoder()
+    first = geocoder(backend, cache_path)
+    point = first.geocode("Chicago")
+    assert (point.latitude, point.longitude) == (41.8781, -87.6298)
+    assert first.geocode("  CHICAGO ") == point
+    assert backend.calls == 1
+
+    # A new instance over the same file answers from SQLite
+    second = geocoder(backend, cache_path)
+    assert second.geocode("chicago") == point
+    assert backend.calls == 1 and second.backend_calls == 0
+
+
+def test_unresolved_places_are_cached(cache_path):
+    backend = StubGeocoder()
+    first = geocoder(backend, cache_path)
+    assert first.geocode("Atlantis") is None
+    assert first.geocode("atlantis") is None
+    assert geocoder(backend, cache_path).geocode("ATLANTIS") is None
+    assert backend.calls == 1
+
+
+def test_negative_entries_expire_sooner(tmp_path):
+    clock = FakeClock()
+    store = GeocodeStore(str(tmp_path / "geocode.sqlite3"), clock=clock)
+    store.set("atlantis", None, ttl=10)
+    store.set("chicago", None, ttl=1000)
+    assert store.get("atlantis") == (None, 10)
+    clock.now += 10
+    assert store.get("atlantis") is None
+    assert store.purge_expired() == 1
+    assert store.get("chicago") is not None
+
+
+def test_errors_are_not_cached(cache_path):
+    backend = FlakyGeocoder()
+    caching = geocoder(backend, cache_path)
+    with pytest.raises(ConnectionError):
+        caching.geocode("Miami")
+    assert caching.geocode("Miami").latitude == 25.7617
+    assert backend.calls == 2
+
+
+def test_blank_queries_skip_the_backend(cache_path):
+    backend = StubGeocoder()
+    assert geocoder(backend, cache_path).geocode("  ") is None
+    assert backend.calls == 0
+
+
+def test_concurrent_misses_share_one_request(cache_path):
+    backend = StubGeocoder(latency=0.2)
+    caching = geocoder(backend, cache_path)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(caching.geocode("Seattle"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1 and results[0].latitude == 47.6062
+    assert backend.calls == 1
+
+
+def test_geocode_async(cache_path):
+    backend = StubGeocoder(latency=0.2)
+    caching = geocoder(backend, cache_path)
+
+    async def lookups():
+        return await asyncio.gather(*(caching.geocode_async(query) for query in
+                                      ["Toronto", "toronto", " Toronto ", "Atlantis", "1.5, 2.5"]))
+
+    toronto, *rest = asyncio.run(lookups())
+    assert rest[:2] == [toronto, toronto]
+    assert rest[2] is None
+    assert (rest[3].latitude, rest[3].longitude) == (1.5, 2.5)
+    assert backend.calls == 3
+    # Served from memory, then from the store by a fresh instance
+    assert asyncio.run(caching.geocode_async("TORONTO")) == toronto
+    assert asyncio.run(geocoder(backend, cache_path).geocode_async("toronto")) == toronto
+    assert backend.calls == 3
+
+
+def test_token_bucket_spreads_bursts():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        assert bucket.acquire()
+    assert clock.sleeps == []
+    assert bucket.acquire()
+    assert clock.sleeps == [0.5]
+    assert not bucket.acquire(timeout=0.1)
+    clock.now += 10
+    # Refills up to capacity only
+    for _ in range(3):
+        assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+
+
+def test_token_bucket_reserve():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, capacity=1, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.25, 0.5, 0.75]
+    clock.now += 1
+    assert bucket.reserve() == 0.0
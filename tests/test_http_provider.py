@@ -0,0 +1,117 @@
+import asyncio
+from dataclasses import asdict
+
+import httpx
+import pytest
+
+from benchmarks.fake_services import FakeServer, Faults, provider_routes
+from benchmarks.generators import StubGeocoder, generate_directory
+from directory import DirectorySnapshot
+from doctor_providers import HTTPProvider
+from doctor_search import AsyncDoctorSearch, CachingGeocoder
+
+SIZE = 3000
+NEW_YORK = (40.7128, -74.0060)
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    # The directory the fake provider API serves
+    return DirectorySnapshot.build(generate_directory(SIZE, seed=0))
+
+
+@pytest.fixture(scope="module")
+def provider_url():
+    server = FakeServer(provider_routes(SIZE, seed=0, max_results=SIZE), Faults()).start()
+    yield server.url
+    server.close()
+
+
+def run(coro_factory):
+    async def main():
+        async with httpx.AsyncClient() as client:
+            return await coro_factory(client)
+    return asyncio.run(main())
+
+
+def expected_doctors(snapshot, specialization, radius_km):
+    store = snapshot.store
+    hits = snapshot.index.query_radius(*NEW_YORK, radius_km, store.specialization_code(specialization))
+    return [store.doctor(row, distance) for distance, row in hits]
+
+
+def test_search_returns_the_served_directory(snapshot, provider_url):
+    doctors = run(lambda client: HTTPProvider("fake", provider_url, client).search(*NEW_YORK, "Cardiology", 25))
+    expected = expected_doctors(snapshot, "Cardiology", 25)
+    assert expected
+    assert [asdict(doctor) for doctor in doctors] == [asdict(doctor) for doctor in expected]
+
+
+def test_search_unknown_specialization(provider_url):
+    assert run(lambda client: HTTPProvider("fake", provider_url, client).search(*NEW_YORK, "Astrology", 25)) == []
+
+
+def test_batch_details(snapshot, provider_url):
+    ids = [doctor.doctor_id for doctor in expected_doctors(snapshot, "Pediatrics", 25)[:5]]
+    details = run(lambda client: HTTPProvider("fake", provider_url, client).get_details(ids + ["missing"]))
+    assert sorted(details) == sorted(ids)
+    for doctor_id, doctor in details.items():
+        assert doctor.doctor_id == doctor_id and doctor.specialization == "Pediatrics"
+
+
+def test_server_errors_raise():
+    server = FakeServer(provider_routes(10), Faults(error_rate=1.0)).start()
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            run(lambda client: HTTPProvider("broken", server.url, client).search(*NEW_YORK, "Cardiology", 25))
+    finally:
+        server.close()
+    assert server.responses == {503: 1}
+
+
+def test_failing_and_slow_providers_are_skipped(snapshot, provider_url):
+    broken = FakeServer(provider_routes(10), Faults(error_rate=1.0)).start()
+    slow = FakeServer(provider_routes(10), Faults(latency_ms=1000)).start()
+    try:
+        async def search(client):
+            doctor_search = AsyncDoctorSearch(providers=[], geocoder=CachingGeocoder(StubGeocoder(), cache_path=None),
+                                              client=client, timeout=2.0)
+            doctor_search.add_http_provider("broken", broken.url)
+            doctor_search.add_http_provider("slow", slow.url, timeout=0.2)
+            doctor_search.add_http_provider("fake", provider_url)
+            doctors = await doctor_search.search_nearby_doctors("New York", "Cardiology", 25)
+            details = await doctor_search.get_doctor_details(doctors[0].doctor_id)
+            return doctors, details
+
+        doctors, details = run(search)
+    finally:
+        broken.close()
+        slow.close()
+    expected = expected_doctors(snapshot, "Cardiology", 25)
+    assert [doctor.doctor_id for doctor in doctors] == [doctor.doctor_id for doctor in expected]
+    assert details.doctor_id == expected[0].doctor_id
+
+
+@pytest.mark.parametrize("sort_by", ["distance", "rating"])
+def test_pages_cover_the_search(provider_url, sort_by):
+    async def pages(client):
+        doctor_search = AsyncDoctorSearch(providers=[], geocoder=CachingGeocoder(StubGeocoder(), cache_path=None),
+                                          client=client)
+        doctor_search.add_http_provider("fake", provider_url)
+        everything = await doctor_search.search_nearby_doctors("New York", "Pediatrics", 30)
+        seen, cursor = [], None
+        while True:
+            page = await doctor_search.query("New York", "Pediatrics", 30, sort_by=sort_by,
+                                             limit=7, cursor=cursor)
+            seen.extend(page.doctors)
+            cursor = page.next_cursor
+            if cursor is None:
+                return everything, seen
+
+    everything, seen = run(pages)
+    assert len(everything) > 7
+    assert sorted(doctor.doctor_id for doctor in seen) == sorted(doctor.doctor_id for doctor in everything)
+    if sort_by == "distance":
+        assert [doctor.distance for doctor in seen] == sorted(doctor.distance for doctor in seen)
+    else:
+        assert [doctor.rating for doctor in seen] == sorted((doctor.rating for doctor in seen), reverse=True)
@@ -0,0 +1,94 @@
+import random
+
+import numpy as np
+import pytest
+from geopy.distance import distance as geodesic_distance
+
+from benchmarks.generators import generate_directory
+from directory import DirectorySnapshot
+from doctor_store import Doctor, DoctorStore
+from ranking import RankedIndex
+from spatial_index import SpatialIndex
+
+
+def sparse_store(count=400, seed=0):
+    # Few doctors per cell, spread over the globe, with many tied ratings
+    rng = random.Random(seed)
+    doctors = [
+        Doctor(name=f"Doctor {i}", specialization=rng.choice(["Cardiology", "Pediatrics"]),
+               address=f"{i} Main St", phone=f"555-{i:04d}", rating=rng.choice([3.5, 4.0, 4.5]),
+               latitude=rng.uniform(-60, 60), longitude=rng.uniform(-180, 180), doctor_id=f"s{i}")
+        for i in range(count)
+    ]
+    return DoctorStore.from_doctors(doctors)
+
+
+@pytest.fixture(scope="module", params=["sparse", "dense"])
+def snapshot(request):
+    store = sparse_store() if request.param == "sparse" else generate_directory(4000, seed=1)
+    return DirectorySnapshot.build(store)
+
+
+def walk(ranked, lat, lon, code, sort_by, radius_km, min_rating, limit):
+    doctors, cursor = [], None
+    while True:
+        page = ranked.page(lat, lon, code, sort_by, radius_km, min_rating, limit, cursor)
+        assert len(page.doctors) <= limit
+        doctors.extend(page.doctors)
+        cursor = page.next_cursor
+        if cursor is None:
+            return doctors
+
+
+@pytest.mark.parametrize("sort_by", ["distance", "rating"])
+@pytest.mark.parametrize("limit", [1, 3, 25])
+def test_pages_cover_query_radius(snapshot, sort_by, limit):
+    store = snapshot.store
+    rng = random.Random(limit)
+    code = store.specialization_code("Cardiology")
+    for _ in range(8):
+        row = rng.randrange(len(store))
+        lat, lon = float(store.latitudes[row]), float(store.longitudes[row])
+        radius_km = rng.choice([5.0, 30.0, 300.0, 3000.0])
+        min_rating = rng.choice([None, 4.0])
+        doctors = walk(snapshot.ranked, lat, lon, code, sort_by, radius_km, min_rating, limit)
+        ids = [doctor.doctor_id for doctor in doctors]
+        assert len(ids) == len(set(ids))
+        expected = {
+            store.doctor(row).doctor_id for _, row in snapshot.index.query_radius(lat, lon, radius_km, code)
+            if min_rating is None or store.ratings[row] >= min_rating
+        }
+        assert set(ids) == expected
+        if sort_by == "distance":
+            keys = [doctor.distance for doctor in doctors]
+        else:
+            keys = [(-doctor.rating, doctor.distance) for doctor in doctors]
+        assert keys == sorted(keys)
+
+
+def test_doctors_near_the_edge_are_not_skipped():
+    # Haversine and geodesic distances differ by more than the gap between
+    # the first two doctors, which must not decide which page sees them
+    doctors = []
+    for i, km in enumerate([11.0, 11.005, 30.0]):
+        point = geodesic_distance(kilometers=km).destination((0.0, 0.0), 90)
+        doctors.append(Doctor(name=f"Doctor {i}", specialization="Cardiology", address="", phone=str(i),
+                              rating=4.0, latitude=point.latitude, longitude=point.longitude,
+                              doctor_id=f"d{i}"))
+    store = DoctorStore.from_doctors(doctors)
+    ranked = RankedIndex(store, SpatialIndex(store.latitudes, store.longitudes,
+                                             store.specialization_codes.tolist()))
+    ids = [doctor.doctor_id for doctor in walk(ranked, 0.0, 0.0, 0, "distance", 50.0, None, 1)]
+    assert ids == ["d0", "d1", "d2"]
+
+
+def test_keys_do_not_depend_on_the_search_radius(snapshot):
+    store = snapshot.store
+    code = store.specialization_code("Pediatrics")
+    row = int(np.flatnonzero(store.specialization_codes == code)[0])
+    lat, lon = float(store.latitudes[row]), float(store.longitudes[row])
+    everything = snapshot.ranked.query(lat, lon, code, "distance", 500.0, limit=50)
+    distances = dict(zip(everything[1].tolist(), everything[0].tolist()))
+    for limit in (1, 5, 20):
+        first = snapshot.ranked.query(lat, lon, code, "distance", 500.0, limit=limit)
+        assert all(distances[row] == distance for distance, row in zip(*first))
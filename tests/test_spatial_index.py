@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+import pytest
+
+from spatial_index import SpatialIndex
+
+CELL_SIZES = [0.1, 0.25, 0.7, 1.1, 7.0]
+
+
+def random_index(cell_size_deg, count=600, seed=0):
+    rng = random.Random(seed)
+    latitudes, longitudes, partitions = [], [], []
+    for _ in range(count):
+        # Clustered points, plus some anywhere including the poles and the antimeridian
+        if rng.random() < 0.8:
+            lat, lon = rng.choice([(40.7, -74.0), (-36.8, 174.7), (64.8, -179.9), (0.0, 179.95)])
+            lat, lon = lat + rng.gauss(0, 1.5), lon + rng.gauss(0, 1.5)
+        else:
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        latitudes.append(max(-90.0, min(90.0, lat)))
+        longitudes.append((lon + 180.0) % 360.0 - 180.0)
+        partitions.append(rng.choice(["Cardiology", "Pediatrics"]))
+    return SpatialIndex(latitudes, longitudes, partitions, cell_size_deg=cell_size_deg)
+
+
+def rows(hits):
+    return sorted(row for _, row in hits)
+
+
+@pytest.mark.parametrize("cell_size_deg", CELL_SIZES)
+def test_radius_matches_brute_force(cell_size_deg):
+    index = random_index(cell_size_deg)
+    rng = random.Random(1)
+    for _ in range(30):
+        lat = rng.uniform(-90, 90)
+        lon = rng.choice([rng.uniform(-180, 180), 179.9, -179.9, 180.0, -180.0])
+        radius_km = rng.choice([5, 50, 300, 1000])
+        partition = rng.choice(["Cardiology", "Pediatrics"])
+        expected = index.brute_force_radius(lat, lon, radius_km, partition)
+        assert rows(index.query_radius(lat, lon, radius_km, partition)) == rows(expected)
+        assert index.query_radius(lat, lon, radius_km, partition, exact=True) == expected
+
+
+@pytest.mark.parametrize("cell_size_deg", CELL_SIZES)
+def test_radius_across_antimeridian(cell_size_deg):
+    # Two points either side of 180 degrees, 11 km apart, and two far away
+    index = SpatialIndex([-17.0, -17.0, -17.0, 10.0], [179.95, -179.95, 170.0, -179.95],
+                         cell_size_deg=cell_size_deg)
+    for lon in (179.95, -179.95, 180.0, -180.0):
+        hits = index.query_radius(-17.0, lon, 20.0)
+        assert rows(hits) == [0, 1]
+        assert rows(hits) == rows(index.brute_force_radius(-17.0, lon, 20.0))
+
+
+@pytest.mark.parametrize("cell_size_deg", CELL_SIZES)
+def test_nearest_matches_brute_force(cell_size_deg):
+    index = random_index(cell_size_deg, seed=2)
+    rng = random.Random(3)
+    for _ in range(30):
+        lat, lon = rng.uniform(-80, 80), rng.choice([rng.uniform(-180, 180), 179.99])
+        nearest = index.query_nearest(lat, lon, 5, "Cardiology", exact=True)
+        assert nearest == index.brute_force_radius(lat, lon, 20004.0, "Cardiology")[:5]
+
+
+def test_updated_index_matches_rebuild():
+    index = random_index(0.7, count=500, seed=4)
+    latitudes = np.append(index.latitudes, [-16.99, 0.0])
+    longitudes = np.append(index.longitudes, [-179.99, 179.99])
+    partitions = index.partitions + ["Cardiology", "Pediatrics"]
+    removed = np.arange(0, 500, 7)
+    updated = index.updated(latitudes, longitudes, partitions, removed, np.array([500, 501]))
+    for lat, lon in [(-17.0, 179.95), (0.0, -179.99), (40.7, -74.0)]:
+        for partition in ("Cardiology", "Pediatrics"):
+            expected = [row for row in rows(SpatialIndex(latitudes, longitudes, partitions, cell_size_deg=0.7)
+                                            .brute_force_radius(lat, lon, 300.0, partition))
+                        if row not in set(removed.tolist())]
+            assert rows(updated.query_radius(lat, lon, 300.0, partition)) == expected
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+
+import pytest
+
+from ai_symptom_analyzer import IncrementalAnalysis, SymptomAnalyzer
+from benchmarks import generators
+from knowledge_base import DEFAULT_SOURCE_PATH, compile_knowledge_base, load_knowledge_base, write_knowledge_base
+
+# Symptoms nested in each other and in ordinary words, one listed twice,
+# to hold the automaton to the scan's substring semantics
+OVERLAPPING = {
+    "Migraine": {"symptoms": ["headache", "head", "ache", "nausea"], "remedies": ["Dark room"]},
+    "Back strain": {"symptoms": ["back pain", "pain", "ache", "ache"], "remedies": ["Heat pack"]},
+    "Cold": {"symptoms": ["cough", "sneezing", "sore throat", "ache"], "remedies": ["Tea", "Rest"]},
+    "Flu": {"symptoms": ["fever", "cough", "chills", "ache", "fatigue"], "remedies": ["Fluids"]},
+}
+
+TEXTS = [
+    "",
+    "nothing relevant here",
+    "I have a headache",
+    "HEADACHE and Back Pain since monday",
+    "backache, coughing and chills",
+    "painful sore throat with sneezing",
+    "fever fever fever",
+    "my head aches, and so does my back pain",
+    "feverish, fatigued? fatigue and nausea",
+]
+
+
+@pytest.fixture(scope="module", params=["overlapping", "synthetic"])
+def analyzer(request, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("kb")
+    if request.param == "overlapping":
+        path = str(directory / "overlapping.kb")
+        write_knowledge_base(OVERLAPPING, path)
+    else:
+        path = generators.write_synthetic_kb(300, str(directory))
+    return SymptomAnalyzer(knowledge_base=path, cache_size=0)
+
+
+def texts_for(analyzer):
+    return TEXTS + generators.generate_patient_texts(analyzer.kb, 200, seed=3)
+
+
+def test_automaton_matches_scan(analyzer):
+    for text in texts_for(analyzer):
+        assert analyzer.analyze_symptoms(text, engine="automaton") == \
+            analyzer.analyze_symptoms(text, engine="scan"), text
+
+
+def test_batch_matches_single(analyzer):
+    texts = texts_for(analyzer)
+    expected = [analyzer.analyze_symptoms(text, engine="scan") for text in texts]
+    assert analyzer.analyze_symptoms_batch(texts) == expected
+
+
+def test_incremental_matches_full_analysis(analyzer):
+    live = IncrementalAnalysis(analyzer)
+    text = ""
+    for addition in texts_for(analyzer)[:40]:
+        live.apply_edit(len(text), 0, " " + addition)
+        text += " " + addition
+        assert live.result() == analyzer.analyze_symptoms(text, engine="scan")
+    live.apply_edit(0, len(text) // 2, "")
+    assert live.result() == analyzer.analyze_symptoms(text[len(text) // 2:], engine="scan")
+
+
+def test_cached_results_match_and_are_not_shared(tmp_path):
+    path = str(tmp_path / "overlapping.kb")
+    write_knowledge_base(OVERLAPPING, path)
+    analyzer = SymptomAnalyzer(knowledge_base=path)
+    first = analyzer.analyze_symptoms("headache and cough")
+    first["suggestions"][0]["home_remedies"].append("changed")
+    # Differently worded, same symptoms: served from the cache
+    second = analyzer.analyze_symptoms("Cough, HEADACHE")
+    assert second == analyzer.analyze_symptoms("headache and cough", engine="scan")
+    assert analyzer.cache_stats()["hits"] >= 1
+
+
+def test_reload_drops_cached_results(tmp_path):
+    path = str(tmp_path / "conditions.kb")
+    write_knowledge_base({"Flu": {"symptoms": ["fever"], "remedies": ["Rest"]}}, path)
+    analyzer = SymptomAnalyzer(knowledge_base=path)
+    assert analyzer.analyze_symptoms("fever")["suggestions"][0]["condition"] == "Flu"
+    write_knowledge_base({"Cold": {"symptoms": ["fever"], "remedies": ["Tea"]}}, path)
+    analyzer.reload_knowledge_base()
+    assert analyzer.analyze_symptoms("fever")["suggestions"][0]["condition"] == "Cold"
+
+
+def test_bundled_knowledge_base_is_current():
+    # data/conditions.kb is only rebuilt by running knowledge_base.py
+    kb = load_knowledge_base()
+    with open(DEFAULT_SOURCE_PATH) as source:
+        assert kb.to_dict() == json.load(source)
+    analyzer = SymptomAnalyzer(knowledge_base=kb)
+    for text in TEXTS:
+        assert analyzer.analyze_symptoms(text) == analyzer.analyze_symptoms(text, engine="scan")
+
+
+def test_edited_source_is_reported_not_rebuilt(tmp_path, caplog):
+    source, path = str(tmp_path / "conditions.json"), str(tmp_path / "conditions.kb")
+    with open(source, "w") as handle:
+        json.dump(OVERLAPPING, handle)
+    compile_knowledge_base(source, path)
+    with caplog.at_level(logging.WARNING, logger="knowledge_base"):
+        load_knowledge_base(path, reload=True)
+    assert not caplog.records
+
+    compiled = os.stat(path)
+    with open(source, "w") as handle:
+        json.dump({"Flu": OVERLAPPING["Flu"]}, handle)
+    with caplog.at_level(logging.WARNING, logger="knowledge_base"):
+        kb = load_knowledge_base(path, reload=True)
+    assert "python knowledge_base.py" in caplog.text
+    assert len(kb) == len(OVERLAPPING)
+    assert os.stat(path).st_mtime_ns == compiled.st_mtime_ns
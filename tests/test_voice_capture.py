@@ -0,0 +1,144 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+import speech_recognition as sr
+
+from voice_capture import CaptureSession, RecognizerBackend
+
+# 16 kHz mono: 0.8 s of background noise, then tone bursts of 0.7 s, 1.4 s
+# and 0.8 s at rising loudness, separated by 2.0 s and 3.0 s of noise and
+# followed by 1.4 s of it
+THREE_PHRASES = os.path.join(os.path.dirname(__file__), "fixtures", "three_phrases.wav")
+
+
+class LoudnessBackend(RecognizerBackend):
+    """
+    Names each chunk after the loudest burst in it; background noise is
+    not recognised
+    """
+
+    name = "loudness"
+
+    def __init__(self, words=((1000, None), (6000, "fever"), (12000, "cough"), (32768, "headache"))):
+        self.words = words
+        self.chunks = []
+        self.threads = set()
+
+    def recognize(self, audio):
+        samples = np.frombuffer(audio.get_raw_data(), dtype="<i2")
+        self.chunks.append(len(samples) / audio.sample_rate)
+        self.threads.add(threading.current_thread().name)
+        peak = int(np.abs(samples).max()) if len(samples) else 0
+        for limit, word in self.words:
+            if peak < limit:
+                if word is None:
+                    raise sr.UnknownValueError()
+                return word
+        raise sr.UnknownValueError()
+
+
+def session(backend, **kwargs):
+    capture = CaptureSession(backend, source_factory=lambda: sr.AudioFile(THREE_PHRASES),
+                             calibration_seconds=0.5, **kwargs)
+    # A fixed threshold after calibration, so the steady tones are split
+    # into phrases the same way on every run
+    capture.recognizer.dynamic_energy_threshold = False
+    return capture
+
+
+def test_transcribes_every_phrase_in_order():
+    backend = LoudnessBackend()
+    capture = session(backend, gap_timeout=4.0)
+    statuses, partials = [], []
+    try:
+        text = capture.transcribe(on_status=statuses.append, on_partial=partials.append)
+    finally:
+        capture.close()
+    assert text == "fever cough headache"
+    assert statuses == ["Adjusting for ambient noise...", "Recording... Speak now", "Processing speech..."]
+    assert partials[-1] == text and len(partials) == 3
+    assert all(name.startswith("speech") for name in backend.threads)
+
+
+def test_calibrates_only_once():
+    capture = session(LoudnessBackend(), gap_timeout=4.0)
+    statuses = []
+    try:
+        capture.transcribe(on_status=statuses.append)
+        threshold = capture.energy_threshold
+        assert capture.transcribe(on_status=statuses.append) == "fever cough headache"
+    finally:
+        capture.close()
+    assert statuses.count("Adjusting for ambient noise...") == 1
+    assert capture.energy_threshold == threshold
+
+    capture.recalibrate()
+    assert not capture.calibrated
+
+
+def test_long_phrases_are_split_into_chunks():
+    backend = LoudnessBackend()
+    capture = session(backend, gap_timeout=4.0, chunk_seconds=1.0)
+    try:
+        assert capture.transcribe() == "fever cough cough headache"
+    finally:
+        capture.close()
+    # Every chunk is shorter than the 1.4 s burst it was cut from
+    assert max(backend.chunks) < 1.4
+
+
+def test_stops_at_a_long_gap():
+    capture = session(LoudnessBackend(), gap_timeout=1.2)
+    try:
+        assert capture.transcribe() == "fever cough"
+    finally:
+        capture.close()
+
+
+def test_stops_at_max_seconds():
+    capture = session(LoudnessBackend(), gap_timeout=4.0, max_seconds=1.0)
+    try:
+        assert capture.transcribe() == "fever"
+    finally:
+        capture.close()
+
+
+def test_unrecognised_chunks_are_dropped():
+    capture = session(LoudnessBackend(words=((6000, None), (12000, "cough"), (32768, None))), gap_timeout=4.0)
+    try:
+        assert capture.transcribe() == "cough"
+    finally:
+        capture.close()
+
+
+def test_nothing_recognised():
+    capture = session(LoudnessBackend(words=()), gap_timeout=4.0)
+    try:
+        with pytest.raises(sr.UnknownValueError):
+            capture.transcribe()
+    finally:
+        capture.close()
+
+
+def test_no_speech_before_timeout():
+    capture = session(LoudnessBackend(), gap_timeout=4.0)
+    try:
+        with pytest.raises(sr.WaitTimeoutError):
+            capture.transcribe(timeout=0.2)
+    finally:
+        capture.close()
+
+
+def test_backend_errors_propagate():
+    class Offline(RecognizerBackend):
+        def recognize(self, audio):
+            raise sr.RequestError("no network")
+
+    capture = session(Offline(), gap_timeout=4.0)
+    try:
+        with pytest.raises(sr.RequestError):
+            capture.transcribe()
+    finally:
+        capture.close()
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Type
+
+import speech_recognition as sr
+
+
+class RecognizerBackend:
+    """
+    Turns recorded audio into text. Implementations raise
+    sr.UnknownValueError when the audio holds no recognisable speech and
+    sr.RequestError when the service cannot be reached.
+    """
+
+    name = "backend"
+
+    def recognize(self, audio: sr.AudioData) -> str:
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognizerBackend):
+    """
+    Google Web Speech API (needs network access)
+    """
+
+    name = "google"
+
+    def __init__(self, language: str = "en-US"):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, audio: sr.AudioData) -> str:
+        return self._recognizer.recognize_google(audio, language=self.language)
+
+
+class SphinxBackend(RecognizerBackend):
+    """
+    CMU PocketSphinx, fully offline (needs the pocketsphinx package)
+    """
+
+    name = "sphinx"
+
+    def __init__(self, language: str = "en-US"):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, audio: sr.AudioData) -> str:
+        return self._recognizer.recognize_sphinx(audio, language=self.language)
+
+
+class VoskBackend(RecognizerBackend):
+    """
+    Vosk/Kaldi, fully offline (needs the vosk package and a model directory,
+    taken from TELEMED_VOSK_MODEL by default). The model is loaded once.
+    """
+
+    name = "vosk"
+    SAMPLE_RATE = 16000
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path or os.environ.get("TELEMED_VOSK_MODEL", "model")
+        self._model = None
+        self._lock = threading.Lock()
+
+    def recognize(self, audio: sr.AudioData) -> str:
+        import vosk
+
+        with self._lock:
+            if self._model is None:
+                self._model = vosk.Model(self.model_path)
+        recognizer = vosk.KaldiRecognizer(self._model, self.SAMPLE_RATE)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=self.SAMPLE_RATE, convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+BACKENDS: Dict[str, Type[RecognizerBackend]] = {
+    GoogleBackend.name: GoogleBackend,
+    SphinxBackend.name: SphinxBackend,
+    VoskBackend.name: VoskBackend,
+}
+
+
+def create_backend(name: Optional[str] = None) -> RecognizerBackend:
+    """
+    Build the backend named by name or TELEMED_SPEECH_BACKEND (default google)
+    """
+    name = name or os.environ.get("TELEMED_SPEECH_BACKEND", GoogleBackend.name)
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown speech backend {name!r}, expected one of {sorted(BACKENDS)}")
+
+
+class CaptureSession:
+    """
+    Long-lived voice capture session.
+
+    The recognizer, and with it the ambient-noise energy threshold, is kept
+    between recordings, so calibration runs only on the first one. Speech is
+    captured in chunks of at most ``chunk_seconds``; each chunk is handed to
+    the backend on a worker thread while the next one is being recorded, so
+    recognition overlaps with speaking. Recording stops once no new speech
+    starts within ``gap_timeout`` seconds.
+
+    ``source_factory`` returns an sr.AudioSource; pass
+    ``lambda: sr.AudioFile(path)`` to run from WAV fixtures without a
+    microphone.
+    """
+
+    def __init__(self, backend: Optional[RecognizerBackend] = None,
+                 source_factory: Callable[[], sr.AudioSource] = sr.Microphone,
+                 chunk_seconds: float = 3.0, gap_timeout: float = 1.0,
+                 calibration_seconds: float = 1.0, max_seconds: float = 60.0):
+        self.backend = backend if backend is not None else create_backend()
+        self.source_factory = source_factory
+        self.chunk_seconds = chunk_seconds
+        self.gap_timeout = gap_timeout
+        self.calibration_seconds = calibration_seconds
+        self.max_seconds = max_seconds
+        self.recognizer = sr.Recognizer()
+        self.calibrated = calibration_seconds <= 0
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speech")
+
+    @property
+    def energy_threshold(self) -> float:
+        return self.recognizer.energy_threshold
+
+    def recalibrate(self) -> None:
+        """
+        Force ambient-noise calibration on the next recording
+        """
+        self.calibrated = False
+
+    def transcribe(self, timeout: float = 5.0,
+                   on_status: Optional[Callable[[str], None]] = None,
+                   on_partial: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Record one utterance and return its text. Raises sr.WaitTimeoutError
+        if no speech starts within timeout seconds and sr.UnknownValueError
+        if nothing in it could be recognised. ``on_partial`` receives the
+        text recognised so far each time a chunk finishes.
+        """
+        status = on_status or (lambda message: None)
+        chunks: List[Future] = []
+        recognised: Dict[int, str] = {}
+        lock = threading.Lock()
+
+        def report(position: int, future: Future) -> None:
+            try:
+                text = future.result()
+            except Exception:
+                # Failures are surfaced when the results are collected
+                return
+            with lock:
+                recognised[position] = text
+                partial = " ".join(recognised[key] for key in sorted(recognised))
+            if on_partial is not None:
+                on_partial(partial)
+
+        with self.source_factory() as source:
+            if not self.calibrated:
+                status("Adjusting for ambient noise...")
+                self.recognizer.adjust_for_ambient_noise(source, duration=self.calibration_seconds)
+                self.calibrated = True
+
+            status("Recording... Speak now")
+            recorded = 0.0
+            while recorded < self.max_seconds:
+                try:
+                    audio = self.recognizer.listen(
+                        source,
+                        timeout=timeout if not chunks else self.gap_timeout,
+                        phrase_time_limit=self.chunk_seconds
+                    )
+                except sr.WaitTimeoutError:
+                    if not chunks:
+                        raise
+                    break
+                if not audio.frame_data:
+                    # End of a file source
+                    break
+                recorded += len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+                future = self._executor.submit(self.backend.recognize, audio)
+                future.add_done_callback(lambda done, position=len(chunks): report(position, done))
+                chunks.append(future)
+
+        if not chunks:
+            raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+
+        status("Processing speech...")
+        texts = []
+        for future in chunks:
+            try:
+                texts.append(future.result())
+            except sr.UnknownValueError:
+                continue
+        if not texts:
+            raise sr.UnknownValueError()
+        return " ".join(texts)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)